@@ -0,0 +1,129 @@
+# GIÁ ĐIỀU CHỈNH TÍNH TẠI CHỖ THEO SỰ KIỆN DOANH NGHIỆP (CORPORATE ACTIONS)
+# - CafeF trả cả GiaDongCua (close) và GiaDieuChinh (adj_close); F = adj_close / close là hệ số
+#   điều chỉnh, không đổi giữa hai sự kiện (chia tách, cổ tức cổ phiếu / tiền mặt, phát hành thêm)
+#   và nhảy bậc tại ngày giao dịch không hưởng quyền → phát hiện sự kiện từ bước nhảy của F
+#   (vượt sai số làm tròn của GiaDieuChinh), hệ số sự kiện = mức F trước / mức F sau (trung vị đoạn)
+# - Bảng sự kiện gọn: ticker, ex_date, factor (nhân vào giá TRƯỚC ex_date), cum_factor (tích các
+#   factor từ sự kiện này về sau), source (detected / manual). Lưu ở corporate_actions.csv
+#   (cạnh file raw) và store/actions.npy (xem store.py); sự kiện nhập tay (source = manual) được giữ
+# - Sự kiện mới chỉ cập nhật bảng (cum_factor của các sự kiện cũ hơn nhân thêm factor mới):
+#   lịch sử giá trong kho (close) không bị ghi lại, không phải tải lại toàn bộ mã (xem refresh.py)
+# - Giá điều chỉnh = close × cum_factor của đoạn chứa ngày đó, tính khi cần (apply_factors:
+#   nhân tại chỗ theo từng đoạn cột, không tạo ma trận hệ số T × N)
+import os
+
+import numpy as np
+import pandas as pd
+
+ACTIONS_FILE = "corporate_actions.csv"
+EVENT_COLUMNS = ["ticker", "ex_date", "factor", "cum_factor", "source"]
+PRICE_TICK = 0.01   # GiaDieuChinh được làm tròn 0.01 (nghìn đồng)
+
+
+def empty_events():
+    return pd.DataFrame({"ticker": pd.Series(dtype=str), "ex_date": pd.Series(dtype="datetime64[ns]"),
+                         "factor": pd.Series(dtype="f8"), "cum_factor": pd.Series(dtype="f8"),
+                         "source": pd.Series(dtype=str)})
+
+
+def detect_events(df, tick=PRICE_TICK):
+    """
+    Sự kiện từ dữ liệu đã làm sạch (date, ticker, close, adj_close) của một lần tải:
+    các ngày F = adj_close / close nhảy quá 2 lần sai số làm tròn của hai phiên liền kề.
+    Mọi dòng của một mã phải cùng một lần tải (cùng mốc điều chỉnh của CafeF).
+    """
+    df = df.dropna(subset=["close", "adj_close"])
+    df = df[df["close"] > 0].sort_values(["ticker", "date"])
+    frames = []
+    for ticker, part in df.groupby("ticker", sort=False, observed=True):
+        close = part["close"].to_numpy(dtype="f8")
+        F = part["adj_close"].to_numpy(dtype="f8") / close
+        noise = tick / 2 / close
+        pos = np.flatnonzero(np.abs(np.diff(F)) > 2 * (noise[1:] + noise[:-1])) + 1
+        if not len(pos):
+            continue
+        # Mức F của từng đoạn giữa hai sự kiện: trung vị (ít nhạy với sai số làm tròn từng phiên)
+        bounds = np.concatenate([[0], pos, [len(F)]])
+        level = np.array([np.median(F[lo:hi]) for lo, hi in zip(bounds[:-1], bounds[1:])])
+        frames.append(pd.DataFrame({"ticker": str(ticker), "ex_date": part["date"].to_numpy()[pos],
+                                    "factor": level[:-1] / level[1:], "source": "detected"}))
+    if not frames:
+        return empty_events()
+    return with_cumulative(pd.concat(frames, ignore_index=True))
+
+
+def with_cumulative(events):
+    """
+    cum_factor = tích factor của sự kiện đó và mọi sự kiện sau nó (cùng mã):
+    giá trong đoạn [ex_date trước, ex_date) nhân cum_factor; sau sự kiện cuối: 1.
+    """
+    events = events.sort_values(["ticker", "ex_date"]).reset_index(drop=True)
+    rev = events["factor"][::-1].groupby(events["ticker"][::-1], sort=False).cumprod()
+    events["cum_factor"] = rev[::-1].to_numpy()
+    return events[EVENT_COLUMNS]
+
+
+def merge_events(table, new, replace=()):
+    """
+    Gộp sự kiện mới vào bảng. replace: các mã được phát hiện lại trên toàn bộ lịch sử
+    → bỏ sự kiện detected cũ của các mã đó. Trùng (ticker, ex_date): manual thắng, rồi bản mới.
+    Chỉ bảng sự kiện thay đổi; cum_factor của các sự kiện cũ hơn nhân thêm factor mới.
+    """
+    table = empty_events() if table is None else table
+    keep = ~(table["ticker"].isin(list(replace)) & (table["source"] == "detected"))
+    parts = [p for p in (table[keep], new) if p is not None and len(p)]
+    if not parts:
+        return empty_events()
+    merged = pd.concat(parts, ignore_index=True)
+    merged["rank"] = (merged["source"] == "manual").astype(int)
+    merged = merged.sort_values("rank", kind="stable").drop_duplicates(["ticker", "ex_date"], keep="last")
+    return with_cumulative(merged.drop(columns="rank"))
+
+
+def load_events(path=ACTIONS_FILE):
+    """
+    Bảng sự kiện đã lưu (None nếu chưa có). File có thể được sửa tay: dòng source = manual
+    (hoặc để trống) là sự kiện nhập tay, factor = hệ số nhân vào giá trước ex_date (vd. chia tách 2:1 → 0.5).
+    """
+    if not path or not os.path.exists(path):
+        return None
+    df = pd.read_csv(path, encoding="utf-8-sig")
+    df["ex_date"] = pd.to_datetime(df["ex_date"])
+    df["ticker"] = df["ticker"].astype(str)
+    df["source"] = df.get("source", pd.Series("manual", index=df.index)).fillna("manual")
+    return with_cumulative(df)
+
+
+def save_events(events, path=ACTIONS_FILE):
+    events.to_csv(path, index=False, encoding="utf-8-sig", date_format="%Y-%m-%d")
+    return path
+
+
+def apply_factors(values, dates, tickers, events):
+    """
+    Giá điều chỉnh tại chỗ: values (ngày × mã, sắp theo ngày) nhân cum_factor theo từng đoạn
+    giữa các ex_date của mỗi mã. Mã không có sự kiện giữ nguyên.
+    """
+    if events is None or not len(events):
+        return values
+    dates = np.asarray(dates).astype("M8[ns]")
+    col = {t: j for j, t in enumerate(tickers)}
+    for ticker, ev in events.groupby("ticker", sort=False):
+        j = col.get(ticker)
+        if j is None:
+            continue
+        ends = np.searchsorted(dates, ev["ex_date"].to_numpy(dtype="M8[ns]"))
+        lo = 0
+        for hi, c in zip(ends, ev["cum_factor"].to_numpy()):
+            values[lo:hi, j] *= c
+            lo = hi
+    return values
+
+
+def adjusted_frame(close, events):
+    """
+    DataFrame giá close (date × ticker) → DataFrame giá điều chỉnh (một bản sao).
+    """
+    values = close.to_numpy(dtype="f8", copy=True)
+    apply_factors(values, close.index.to_numpy(), close.columns, events)
+    return pd.DataFrame(values, index=close.index, columns=close.columns, copy=False)
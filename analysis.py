@@ -1,266 +1,303 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import os
-from datetime import datetime
-import statsmodels.api as sm
-from statsmodels.tsa.arima.model import ARIMA
-from pmdarima import auto_arima
-from statsmodels.tsa.stattools import adfuller
-
-# --- CẤU HÌNH OUTPUT ---
-os.makedirs("output", exist_ok=True)
+
+import charts
+from adjust import adjusted_frame
+from backtest import backtest
+from bootstrap import confidence_intervals
+from capm import capm_batch, rolling_capm
+from correlation import cluster_assets, masked_corr
+from forecast import ArimaCache, forecast_many, forecast_table, prepare_returns
+from garch import GarchCache, conditional_cov, fit_many, volatility_bands
+from panel import Panel
+from optimizer import efficient_frontier, ledoit_wolf, max_sharpe, min_variance
+from portfolio import metrics_from_returns, portfolio_batch, portfolio_returns, weights_matrix
+from risk import monte_carlo_var, parametric_var, risk_report
+from store import PriceStore
+from universe import DEFAULT_UNIVERSE, UNIVERSES_FILE, get_universe
+
+# Mỗi mục bên dưới là một task của pipeline (xem pipeline.py); tham số của hàm trùng tên
+# task phụ thuộc và nhận kết quả của task đó:
+#   prices → returns → stats, heatmap, garch, capm ...   prices → arima
+#   arima + garch → forecast;  capm → portfolios, backtest, markowitz;  ... → risk, bootstrap, charts
+# Chạy file này = chạy nhóm task "analysis"; task có đầu vào không đổi được lấy từ cache.
+# Các task tính toán không vẽ; mọi biểu đồ được vẽ song song ở task charts (mục 12, xem charts.py).
+# Import module này không chạy gì; matplotlib chỉ được nạp khi vẽ,
+# pmdarima / statsmodels chỉ khi fit ARIMA (xem forecast.py).
 
 # --- 1. ĐỌC DỮ LIỆU ---
+# --- 2. PIVOT GIÁ ---
+def load_prices(store_root="store", universe=DEFAULT_UNIVERSE, required_start="2020-01-02",
+                universes_file=UNIVERSES_FILE, compact=False, adjusted=True):
+    """
+    Task prices: ma trận giá close của universe đã pivot sẵn trong kho (memory-mapped, xem store.py).
+    Giữ mọi mã của universe; ngày mã không thuộc rổ (point-in-time, xem universe.py) hoặc chưa
+    niêm yết (trước phiên có giá đầu tiên) được đặt NaN để mọi bước phía sau chỉ dùng thành phần
+    tại từng ngày. full_sample: các mã có dữ liệu từ required_start (cho các kết quả cần mẫu
+    đầy đủ, vd. tối ưu Markowitz, biểu đồ giá chuẩn hóa).
+    adjusted=True: giá điều chỉnh theo sự kiện doanh nghiệp (chia tách, cổ tức, ...) tính từ close
+    và bảng hệ số trong kho (xem adjust.py) → không có lợi suất giả tại ngày không hưởng quyền.
+    compact=True: giá float32 (xem panel.py), lợi suất và các ma trận phía sau cũng float32.
+    """
+    store = PriceStore(store_root)
+    u = get_universe(universe, universes_file)
+
+    df_index = store.read([u.index], columns=["close"])
+
+    pivot_close_old = store.matrix("close", name=u.store_name)
+    index_close = df_index.set_index("date")["close"].sort_index().to_frame(u.index)
+
+    print(f"{u.name} shape:", pivot_close_old.shape)
+    print(f"{u.index} shape:", df_index.shape)
+
+    # earliest date per ticker (dựa trên pivot_close)
+    first_dates = pivot_close_old.apply(lambda col: col.first_valid_index())
+    first_dates = first_dates.sort_values()
+    print("Ngày xuất hiện sớm nhất từng mã:\n", first_dates)
+
+    required_start = pd.to_datetime(required_start)
+    insufficient = first_dates[first_dates > required_start].index.tolist()
+    sufficient = first_dates[first_dates <= required_start].index.tolist()
+    tickers = first_dates.dropna().index.tolist()
+
+    print(f"Mã thiếu dữ liệu (bắt đầu sau {required_start.date()}, chỉ tính từ ngày có giá):", insufficient)
+    print("Số mã đủ 5 năm:", len(sufficient))
+
+    # Thành phần tại từng ngày: thuộc rổ VÀ đã có giá (mã niêm yết sau không làm mất các kỳ trước đó)
+    listed = pivot_close_old.index.to_numpy()[:, None] >= first_dates[tickers].to_numpy()[None, :]
+    members = u.membership(pivot_close_old.index, tickers) & listed
+    events = store.read_actions() if adjusted else None
+    if adjusted:
+        n_events = 0 if events is None else int(events["ticker"].isin(tickers).sum())
+        print(f"Giá điều chỉnh theo {n_events} sự kiện doanh nghiệp")
+    if compact:
+        # Một bản sao duy nhất: memory-map → float32 (chỉ các mã của universe), điều chỉnh và che
+        # ngày ngoài rổ tại chỗ
+        panel = Panel.from_store(store, u.store_name, "close", tickers=tickers).adjust(events)
+        pivot_close = panel.mask(members.to_numpy()).frame()
+        print(f"Compact panel: {panel.nbytes / 2**20:.1f} MB ({panel.values.dtype})")
+    else:
+        pivot_close = pivot_close_old[tickers].copy()
+        if adjusted:
+            pivot_close = adjusted_frame(pivot_close, events)
+        pivot_close = pivot_close.where(members)
+
+    # Kiểm tra missing (điểm EDA)
+    missing_stats = pivot_close.isna().sum().sort_values(ascending=False)
+    print("\nMissing value top 10:")
+    print(missing_stats.head(10))
+    missing_stats.to_csv("output/missing_value_report.csv")
+
+    return {"close": pivot_close, "market": index_close, "members": members, "full_sample": sufficient}
 
-df_vn30 = pd.read_csv("VN30_clean_2020_2025.csv", parse_dates=["date"])
-df_vnindex = pd.read_csv("VNINDEX_clean_2020_2025.csv", parse_dates=["date"])
 
-print("VN30 shape:", df_vn30.shape)
-print("VNINDEX shape:", df_vnindex.shape)
+# --- 3. TÍNH LỢI SUẤT ---
+def member_returns(close, members):
+    """
+    Lợi suất chỉ cho mã thuộc rổ ở cả kỳ trước và kỳ này (point-in-time), còn lại NaN.
+    Bỏ kỳ có mã thành phần thiếu dữ liệu (như dropna() khi mọi mã luôn thuộc rổ).
+    """
+    values = close.to_numpy()
+    need = members.to_numpy(dtype=bool)
+    # Kỳ đầu không có lợi suất → chỉ tính cho các kỳ 1..T-1
+    need = need[1:] & need[:-1]
+
+    # Như pct_change nhưng tính tại chỗ trên một mảng cùng kiểu với giá (float32 giữ float32),
+    # cùng bố cục bộ nhớ với giá (thứ tự cộng trong các phép reduce phía sau không đổi)
+    by_column = values.flags.f_contiguous
+    ret = np.empty((max(len(values) - 1, 0), values.shape[1]),
+                   dtype=np.result_type(values.dtype, np.float32), order="F" if by_column else "C")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(values[1:], values[:-1], out=ret)
+    ret -= 1
+    np.putmask(ret, ~need, np.nan)
+
+    valid = ~np.isnan(ret)
+    rows = np.flatnonzero((valid | ~need).all(axis=1) & valid.any(axis=1))
+    if len(rows) < len(ret):
+        ret = ret.T.take(rows, axis=1).T if by_column else ret.take(rows, axis=0)
+    return pd.DataFrame(ret, index=close.index[1:][rows], columns=close.columns, copy=False)
+
+
+def compute_returns(prices, z_threshold=4):
+    """
+    Task returns: lợi suất ngày / tháng của cổ phiếu và chỉ số tham chiếu,
+    báo cáo ngoại lai |z| > z_threshold.
+    """
+    pivot_close = prices["close"]
+    market_close = prices["market"]
+    members = prices["members"]
 
-# --- 2. PIVOT GIÁ ---
+    returns_daily = member_returns(pivot_close, members)
+    returns_monthly = member_returns(pivot_close.resample("ME").last(), members.resample("ME").last())
 
+    market_returns_daily = market_close.pct_change(fill_method=None).dropna()
+    market_returns_monthly = market_close.resample("ME").last().pct_change(fill_method=None).dropna()
 
-pivot_close_old = df_vn30.pivot(index="date", columns="ticker", values="close").sort_index()
-vnindex_close = df_vnindex.set_index("date")["close"].sort_index().to_frame("VNINDEX")
+    print("\nDaily returns (sample):")
+    print(returns_daily.head())
 
-# earliest date per ticker (dựa trên pivot_close)
-first_dates = pivot_close_old.apply(lambda col: col.first_valid_index())
-first_dates = first_dates.sort_values()
-print("Ngày xuất hiện sớm nhất từng mã:\n", first_dates)
+    # Kiểm tra outliers (EDA): |z| tính tại chỗ trên một mảng tạm duy nhất
+    zscore = returns_daily.to_numpy() - returns_daily.mean().to_numpy(dtype=returns_daily.dtypes.iloc[0])
+    zscore /= returns_daily.std().to_numpy(dtype=zscore.dtype)
+    np.abs(zscore, out=zscore)
+    outliers = pd.Series((zscore > z_threshold).sum(axis=0), index=returns_daily.columns)
+    outliers = outliers.sort_values(ascending=False)
+    outliers.to_csv("output/outlier_report_daily.csv")
 
-required_start = pd.to_datetime("2020-01-02")
-insufficient = first_dates[first_dates > required_start].index.tolist()
-sufficient = first_dates[first_dates <= required_start].index.tolist()
+    return {"daily": returns_daily, "monthly": returns_monthly,
+            "market_daily": market_returns_daily, "market_monthly": market_returns_monthly}
 
-print("Mã thiếu dữ liệu (bắt đầu sau 2020-01-02):", insufficient)
-print("Số mã đủ 5 năm:", len(sufficient))
 
-pivot_close = pivot_close_old[sufficient].copy()
-returns_monthly_full5 = pivot_close.resample("ME").last().pct_change().dropna()
-# dùng returns_monthly_full5 cho CAPM/cluster/danh mục
+# --- 4. THỐNG KÊ MÔ TẢ ---
+def descriptive_stats(prices, returns):
+    """
+    Task stats: thống kê mô tả giá và lợi suất ngày.
+    """
+    summary_price = prices["close"].describe().T
+    summary_return = returns["daily"].describe().T
 
+    summary_price.to_csv("output/summary_price.csv", encoding="utf-8-sig")
+    summary_return.to_csv("output/summary_daily_return.csv", encoding="utf-8-sig")
+    print("Đã lưu summary_price.csv và summary_daily_return.csv")
+    return {"price": summary_price, "return": summary_return}
 
-# Kiểm tra missing (điểm EDA)
-missing_stats = pivot_close.isna().sum().sort_values(ascending=False)
-print("\nMissing value top 10:")
-print(missing_stats.head(10))
-missing_stats.to_csv("output/missing_value_report.csv")
 
-# --- 3. TÍNH LỢI SUẤT ---
+# --- 5. HEATMAP TƯƠNG QUAN ---
+N_CLUSTERS = 5
 
-returns_daily = pivot_close.pct_change(fill_method=None).dropna()
-returns_monthly = pivot_close.resample("ME").last().pct_change(fill_method=None).dropna()
 
-market_returns_daily = vnindex_close.pct_change(fill_method=None).dropna()
-market_returns_monthly = vnindex_close.resample("ME").last().pct_change(fill_method=None).dropna()
+def correlation_heatmap(returns, n_clusters=N_CLUSTERS):
+    """
+    Task heatmap: tương quan trên lợi suất ngày (không phải giá), sắp theo cụm phân cấp
+    để thấy các khối (biểu đồ vẽ ở task charts).
+    """
+    corr_returns = masked_corr(returns["daily"])
+    clusters = cluster_assets(corr_returns, n_clusters=n_clusters)
+    corr_sorted = corr_returns.loc[clusters["order"], clusters["order"]]
+    corr_sorted.to_csv("output/VN30_correlation_returns.csv", encoding="utf-8-sig")
+    clusters["labels"].loc[clusters["order"]].to_frame().to_csv("output/VN30_clusters.csv", encoding="utf-8-sig")
+    print("Đã lưu VN30_correlation_returns.csv, VN30_clusters.csv")
+    return {"corr": corr_sorted, "clusters": clusters["labels"]}
 
-print("\nDaily returns (sample):")
-print(returns_daily.head())
 
-# Kiểm tra outliers (EDA)
-zscore = (returns_daily - returns_daily.mean()) / returns_daily.std()
-outliers = (np.abs(zscore) > 4).sum().sort_values(ascending=False)
-outliers.to_csv("output/outlier_report_daily.csv")
+# --- 6. BIỂU ĐỒ PRICE NORMALIZED: vẽ ở task charts (mục 12) ---
 
-# --- 4. THỐNG KÊ MÔ TẢ ---
 
-summary_price = pivot_close.describe().T
-summary_return = returns_daily.describe().T
+# --- 7. ARIMA DỰ BÁO CHO TỪNG MÃ (SONG SONG, XEM forecast.py) ---
+def arima_forecasts(prices, steps=30, cache_path="cache/arima_orders.json"):
+    """
+    Task arima: ADF → auto_arima → dự báo `steps` ngày BD cho mọi mã, mỗi mã một process.
+    Order + tham số được cache: auto_arima chỉ chạy lại mỗi tuần hoặc khi phát hiện drift.
+    """
+    arima_cache = ArimaCache(cache_path, max_age_days=7, drift_pvalue=0.01)
+    forecasts, summary = forecast_many(prices["close"], steps=steps, cache=arima_cache)
+    return {"forecasts": forecasts, "summary": summary}
+
 
-summary_price.to_csv("output/summary_price.csv", encoding="utf-8-sig")
-summary_return.to_csv("output/summary_daily_return.csv", encoding="utf-8-sig")
-print("Đã lưu summary_price.csv và summary_daily_return.csv")
+# --- Biến động có điều kiện GJR-GARCH cho mọi mã (xem garch.py) ---
+def garch_volatility(returns, steps=30, cache_path="cache/garch_params.json"):
+    """
+    Task garch: GJR-GARCH cho mọi mã. Tham số được cache: refresh hằng ngày warm start
+    từ tham số hôm trước.
+    """
+    garch_cache = GarchCache(cache_path)
+    garch_res = fit_many(returns["daily"], model="gjr", steps=steps, cache=garch_cache)
+    failed = garch_res["params"].index[~garch_res["params"]["fit_ok"]].tolist()
+    if failed:
+        print("Mã fit GARCH thất bại (dùng phương sai mẫu):", failed)
+    garch_res["params"].to_csv("output/GARCH_params.csv", encoding="utf-8-sig")
+    print("Đã lưu GARCH_params.csv")
+    return garch_res
 
-# --- 5. HEATMAP TƯƠNG QUAN ---
 
-plt.figure(figsize=(14,12))
-sns.heatmap(pivot_close.corr(), cmap="coolwarm", linewidths=0.5)
-plt.xticks(rotation=90)
-plt.yticks(rotation=0)
-plt.title("Correlation Heatmap VN30", fontsize=16)
-plt.tight_layout()
-plt.savefig("output/VN30_correlation_heatmap.png", dpi=300)
-plt.close()
-print("Đã lưu VN30_correlation_heatmap.png")
-
-# --- 6. BIỂU ĐỒ PRICE NORMALIZED ---
-
-normalized = pivot_close / pivot_close.iloc[0]
-plt.figure(figsize=(14,7))
-for col in normalized.columns:
-    plt.plot(normalized.index, normalized[col], linewidth=0.7, alpha=0.5)
-plt.title("Normalized Price Trend (VN30)", fontsize=16)
-plt.grid(alpha=0.3)
-plt.tight_layout()
-plt.savefig("output/VN30_normalized_trend.png", dpi=300)
-plt.close()
-print("Đã lưu VN30_normalized_trend.png")
-
-
-# --- 7. ARIMA DỰ BÁO MÃ VJC  ---
-
-# Lấy dữ liệu giá đóng cửa
-vjc_price = pivot_close["VJC"].dropna().sort_index()
-
-# Tính daily return
-vjc_return = vjc_price.pct_change().dropna()
-
-# Chuyển sang tần suất Business-Day
-vjc_return = vjc_return.asfreq("B").ffill()
-
-# ----------------- KIỂM ĐỊNH DỪNG (ADF) -----------------
-adf_result = adfuller(vjc_return)
-print("\nADF Statistic:", adf_result[0])
-print("p-value:", adf_result[1])
-
-with open("output/ADF_test_VJC.txt", "w") as f:
-    f.write(f"ADF statistic: {adf_result[0]}\n")
-    f.write(f"p-value: {adf_result[1]}\n")
-
-# ----------------- AUTO ARIMA RETURN -----------------
-arima_model = auto_arima(
-    vjc_return,
-    seasonal=False,
-    trace=True,
-    max_p=5,
-    max_q=5,
-    max_d=2,
-    error_action="ignore",
-    suppress_warnings=True
-)
-
-print("Best ARIMA model:\n", arima_model.summary())
-
-# Fit model
-model = ARIMA(vjc_return, order=arima_model.order)
-model_fit = model.fit()
-
-# ----------------- DỰ BÁO RETURN 30 NGÀY -----------------
-fc_ret = model_fit.get_forecast(steps=30)
-fc_df = fc_ret.summary_frame()
-
-# Chuẩn hóa index forecast (theo ngày BD)
-forecast_index = pd.date_range(
-    start=vjc_return.index[-1] + pd.Timedelta(days=1),
-    periods=30,
-    freq="B"
-)
-fc_df.index = forecast_index
-
-# ----------------- DỰ BÁO GIÁ TỪ RETURN -----------------
-last_price = vjc_price.iloc[-1]
-fc_price = last_price * (1 + fc_df["mean"]).cumprod()
-fc_price.index = forecast_index  # đảm bảo trùng index
-
-# ----------------- LƯU FILE -----------------
-out = pd.DataFrame({
-    "forecast_return": fc_df["mean"],
-    "lower_ci": fc_df["mean_ci_lower"],
-    "upper_ci": fc_df["mean_ci_upper"],
-    "price_forecast": fc_price
-})
-out.to_csv("output/VJC_ARIMA_forecast_return.csv", encoding="utf-8-sig")
-
-print("Đã lưu VJC_ARIMA_forecast_return.csv")
-
-
-# ----------------- VẼ BIỂU ĐỒ LỢI SUẤT -----------------
-plt.figure(figsize=(12,6))
-plt.plot(vjc_return, label="Actual Return")
-plt.plot(fc_df["mean"], label="Forecast Return", color="red")
-
-plt.fill_between(
-    fc_df.index,
-    fc_df["mean_ci_lower"],
-    fc_df["mean_ci_upper"],
-    color='pink',
-    alpha=0.3
-)
-
-plt.title("ARIMA Forecast – VJC Daily Return (30 Business Days Ahead)", fontsize=14)
-plt.legend()
-plt.tight_layout()
-plt.savefig("output/VJC_ARIMA_return_forecast.png", dpi=300)
-plt.close()
-print("Đã lưu VJC_ARIMA_return_forecast.png")
-
-
-# ----------------- VẼ BIỂU ĐỒ GIÁ -----------------
-plt.figure(figsize=(12,6))
-plt.plot(vjc_price, label="Actual Price")
-plt.plot(fc_price, label="Forecast Price", color="red")
-
-plt.title("ARIMA Forecast – VJC Price (30 Business Days Ahead)", fontsize=14)
-plt.legend()
-plt.tight_layout()
-plt.savefig("output/VJC_ARIMA_price_forecast.png", dpi=300)
-plt.close()
-
-print("Đã lưu VJC_ARIMA_price_forecast.png")
+def forecast_report(prices, arima, garch, ticker="VJC"):
+    """
+    Task forecast: dải tin cậy GARCH cho dự báo ARIMA, bảng dự báo mọi mã, chi tiết một mã
+    (trả về kèm chuỗi giá / lợi suất thực tế của mã đó cho task charts).
+    """
+    # Dải tin cậy của dự báo lợi suất theo biến động GARCH dự báo từng bước
+    forecasts = {
+        t: volatility_bands(fc, garch["forecast"][t]) if t in garch["forecast"] else fc
+        for t, fc in arima["forecasts"].items()
+    }
+    arima_summary = arima["summary"]
 
-# --- 8. CAPM HỒI QUY BETA CHUẨN ---
+    forecast_table(forecasts).to_csv("output/ARIMA_forecast_all.csv", index=False, encoding="utf-8-sig")
+    arima_summary.to_csv("output/ARIMA_models_summary.csv", index=False, encoding="utf-8-sig")
+    print("Đã lưu ARIMA_forecast_all.csv và ARIMA_models_summary.csv")
 
-# Đọc risk-free
-rf_df = pd.read_csv("Risk_Free_Rate_clean_2020-2025.csv", parse_dates=["date"])
-rf_df = rf_df.sort_values("date").set_index("date")
+    # ----------------- CHI TIẾT MÃ VJC -----------------
+    vjc_price, vjc_return = prepare_returns(prices["close"][ticker])
+    vjc_summary = arima_summary.set_index("ticker").loc[ticker]
 
-# Annual → Monthly rate
-rf_df["rf_monthly"] = (1 + rf_df["rate"])**(1/12) - 1
+    print("\nADF Statistic:", vjc_summary["adf_stat"])
+    print("p-value:", vjc_summary["adf_pvalue"])
+    print("Best ARIMA model:", vjc_summary["order"])
 
-# Đồng bộ mốc thời gian
-rf_sync = rf_df["rf_monthly"].resample("ME").last()
-common_dates = returns_monthly.index.intersection(market_returns_monthly.index).intersection(rf_sync.index)
+    with open(f"output/ADF_test_{ticker}.txt", "w") as f:
+        f.write(f"ADF statistic: {vjc_summary['adf_stat']}\n")
+        f.write(f"p-value: {vjc_summary['adf_pvalue']}\n")
 
-ret_m = returns_monthly.loc[common_dates]
-mkt_m = market_returns_monthly.loc[common_dates]
-rf_m = rf_sync.loc[common_dates]
+    out = forecasts[ticker]
+    out.to_csv(f"output/{ticker}_ARIMA_forecast_return.csv", encoding="utf-8-sig")
+    print(f"Đã lưu {ticker}_ARIMA_forecast_return.csv")
 
-# Excess return
-excess_stock = ret_m.subtract(rf_m, axis=0)
-excess_mkt = (mkt_m["VNINDEX"] - rf_m).rename("MKT")
+    return {"forecasts": forecasts, "ticker": ticker, "price": vjc_price, "return": vjc_return}
 
-# --- Hồi quy CAPM ---
-capm_rows = []
 
-for ticker in excess_stock.columns:
-    df_capm = pd.concat([excess_stock[ticker], excess_mkt], axis=1).dropna()
-    X = sm.add_constant(df_capm["MKT"])
-    y = df_capm[ticker]
-    model = sm.OLS(y, X).fit()
+# --- 8. CAPM HỒI QUY BETA CHUẨN ---
+def capm_regression(returns, store_root="store"):
+    """
+    Task capm: CAPM tháng với lãi suất phi rủi ro thực, beta trượt 36 tháng / 252 ngày.
+    Trả về kết quả CAPM và các chuỗi excess return / rf đã đồng bộ cho các task danh mục.
+    """
+    returns_daily = returns["daily"]
 
-    capm_rows.append({
-        "Ticker": ticker,
-        "Alpha": model.params["const"],
-        "Beta": model.params["MKT"],
-        "Alpha_tstat": model.tvalues["const"],
-        "Beta_tstat": model.tvalues["MKT"],
-        "Alpha_pvalue": model.pvalues["const"],
-        "Beta_pvalue": model.pvalues["MKT"],
-        "R2": model.rsquared,
-        "Adj_R2": model.rsquared_adj,
-        "N_obs": int(model.nobs)
-    })
+    # Đọc risk-free
+    rf_df = PriceStore(store_root).read_series("rf")
+    rf_df = rf_df.sort_values("date").set_index("date")
 
-capm_df = pd.DataFrame(capm_rows)
-capm_df.to_csv("output/CAPM_results_realRF.csv", index=False, encoding="utf-8-sig")
+    # Annual → Monthly rate
+    rf_df["rf_monthly"] = (1 + rf_df["rate"])**(1/12) - 1
 
-print("\nĐã lưu CAPM_results_realRF.csv")
-print(capm_df.head())
+    # Đồng bộ mốc thời gian
+    rf_sync = rf_df["rf_monthly"].resample("ME").last()
+    common_dates = returns["monthly"].index.intersection(returns["market_monthly"].index).intersection(rf_sync.index)
 
+    ret_m = returns["monthly"].loc[common_dates]
+    mkt_m = returns["market_monthly"].loc[common_dates]
+    rf_m = rf_sync.loc[common_dates]
 
-# --- 9. DANH MỤC THEO BETA & ĐÁNH GIÁ HIỆU QUẢ (CHỈ 2 DANH MỤC THEO ĐỀ BÀI) ---
+    # Excess return
+    excess_stock = ret_m.subtract(rf_m, axis=0)
+    excess_mkt = (mkt_m.iloc[:, 0] - rf_m).rename("MKT")
+
+    # --- Hồi quy CAPM (mọi mã cùng lúc, xem capm.py) ---
+    capm_df = capm_batch(excess_stock, excess_mkt)
+    capm_df.to_csv("output/CAPM_results_realRF.csv", index=False, encoding="utf-8-sig")
+
+    print("\nĐã lưu CAPM_results_realRF.csv")
+    print(capm_df.head())
 
-# Chia nhóm theo Beta
-high_beta = capm_df[capm_df["Beta"] > 1]["Ticker"].tolist()      # Aggressive
-low_beta  = capm_df[capm_df["Beta"] <= 1]["Ticker"].tolist()     # Stable
+    # --- Beta trượt 36 tháng / 252 ngày (tổng tích lũy, xem capm.py) ---
+    rolling_m = rolling_capm(excess_stock, excess_mkt, window=36)
+    rolling_m["beta"].to_csv("output/CAPM_rolling_beta_36M.csv", encoding="utf-8-sig")
 
-print("Aggressive (High β):", high_beta)
-print("Stable (Low β):", low_beta)
+    rf_d = ((1 + rf_df["rate"])**(1/252) - 1).reindex(returns_daily.index, method="ffill")
+    excess_stock_d = returns_daily.subtract(rf_d, axis=0)
+    excess_mkt_d = returns["market_daily"].iloc[:, 0].reindex(returns_daily.index) - rf_d
+    rolling_d = rolling_capm(excess_stock_d, excess_mkt_d, window=252)
+    rolling_d["beta"].to_csv("output/CAPM_rolling_beta_252D.csv", encoding="utf-8-sig")
+    print("Đã lưu CAPM_rolling_beta_36M.csv và CAPM_rolling_beta_252D.csv")
+
+    return {"capm": capm_df, "ret_m": ret_m, "mkt_m": mkt_m, "rf_m": rf_m, "rf_d": rf_d,
+            "beta_36m": rolling_m["beta"], "beta_252d": rolling_d["beta"]}
+
+
+# --- 9. DANH MỤC THEO BETA & ĐÁNH GIÁ HIỆU QUẢ (CHỈ 2 DANH MỤC THEO ĐỀ BÀI) ---
 
-# --- Hàm tính metrics ---
+# --- Hàm tính metrics (xem portfolio.py: mọi danh mục được tính trong một lượt NumPy) ---
 def portfolio_metrics_weighted(tickers, returns_df, rf=0):
     """
     Tính metrics cho danh mục:
@@ -270,75 +307,240 @@ def portfolio_metrics_weighted(tickers, returns_df, rf=0):
     - Sharpe ratio
     - Max drawdown
     """
-    data = returns_df[tickers].dropna()
-    weights = np.ones(len(tickers)) / len(tickers)  # 1/N weight
-    port_return = (data * weights).sum(axis=1)
-
-    # Annualized metrics
-    mean_ret = port_return.mean() * 12
-    vol = port_return.std() * np.sqrt(12)
-    sharpe = (mean_ret - rf) / vol
-    cum_ret = (1 + port_return).cumprod()
-
-    # Max drawdown
-    roll_max = cum_ret.cummax()
-    drawdown = (cum_ret - roll_max) / roll_max
-    max_dd = drawdown.min()
-
-    return mean_ret, vol, sharpe, cum_ret, max_dd
-
-
-# Tính metrics cho hai danh mục
-metrics = {}
-portfolio_groups = {
-    "Aggressive (High β)": high_beta,
-    "Stable (Low β)": low_beta
-}
-
-for name, group in portfolio_groups.items():
-    if len(group) == 0:
-        continue
-    mean_ret, vol, sharpe, cum_ret, max_dd = portfolio_metrics_weighted(
-        group, 
-        ret_m, 
-        rf=rf_m.mean()
-    )
-    metrics[name] = {
-        "Annualized Return": mean_ret,
-        "Volatility": vol,
-        "Sharpe Ratio": sharpe,
-        "Cumulative Return": cum_ret,
-        "Max Drawdown": max_dd
+    weights = weights_matrix({"portfolio": tickers}, tickers)
+    metrics_df, cum = portfolio_batch(weights, returns_df[tickers], rf=rf)
+    m = metrics_df.iloc[0]
+    return m["Annualized Return"], m["Volatility"], m["Sharpe Ratio"], cum["portfolio"], m["Max Drawdown"]
+
+
+def return_metrics(port_return, rf=0):
+    """
+    Metrics từ chuỗi lợi suất tháng của danh mục (dùng chung cho danh mục cố định và beta trượt).
+    """
+    m, cum = metrics_from_returns(port_return.to_numpy(), rf)
+    cum_ret = pd.Series(cum[:, 0], index=port_return.index)
+    return (m["Annualized Return"][0], m["Volatility"][0], m["Sharpe Ratio"][0],
+            cum_ret, m["Max Drawdown"][0])
+
+
+def beta_portfolios(capm):
+    """
+    Task portfolios: danh mục Aggressive (β > 1) / Stable (β ≤ 1) cố định và theo beta trượt 36 tháng.
+    """
+    capm_df, ret_m, mkt_m, rf_m = capm["capm"], capm["ret_m"], capm["mkt_m"], capm["rf_m"]
+
+    # Chia nhóm theo Beta; danh mục cố định chỉ gồm các mã có đủ lịch sử lợi suất tháng
+    # (như Markowitz), mã niêm yết / vào rổ sau chỉ tham gia danh mục beta trượt
+    full_sample = capm_df["Ticker"].isin(ret_m.columns[ret_m.notna().all()])
+    high_beta = capm_df[full_sample & (capm_df["Beta"] > 1)]["Ticker"].tolist()      # Aggressive
+    low_beta  = capm_df[full_sample & (capm_df["Beta"] <= 1)]["Ticker"].tolist()     # Stable
+
+    print("Aggressive (High β):", high_beta)
+    print("Stable (Low β):", low_beta)
+
+    # Tính metrics cho hai danh mục (một lượt cho cả ma trận trọng số)
+    portfolio_groups = {
+        "Aggressive (High β)": high_beta,
+        "Stable (Low β)": low_beta
     }
+    portfolio_groups = {k: v for k, v in portfolio_groups.items() if len(v)}
+
+    portfolio_weights = weights_matrix(portfolio_groups, ret_m.columns)
+    metrics_df, cum_df = portfolio_batch(portfolio_weights, ret_m, rf=rf_m.mean())
+
+    # --- Lưu summary metrics ---
+    metrics_summary = metrics_df[["Annualized Return", "Volatility", "Sharpe Ratio", "Max Drawdown"]].reset_index()
 
+    metrics_summary.to_csv("output/Portfolio_metrics_complete.csv", index=False, encoding="utf-8-sig")
+    print("Đã lưu Portfolio_metrics_complete.csv")
+    print(metrics_summary)
 
-# --- Lưu summary metrics ---
-metrics_summary = pd.DataFrame([
-    {
-        "Portfolio": k,
-        "Annualized Return": v["Annualized Return"],
-        "Volatility": v["Volatility"],
-        "Sharpe Ratio": v["Sharpe Ratio"],
-        "Max Drawdown": v["Max Drawdown"]
+    # --- Danh mục beta trượt: mỗi tháng phân nhóm theo beta 36 tháng của tháng TRƯỚC (không look-ahead) ---
+    beta_pit = capm["beta_36m"].shift(1)
+    rolling_groups = {
+        "Aggressive (High β, rolling 36M)": (beta_pit > 1).astype(float),
+        "Stable (Low β, rolling 36M)": (beta_pit <= 1).astype(float)
     }
-    for k, v in metrics.items()
-])
-
-metrics_summary.to_csv("output/Portfolio_metrics_complete.csv", index=False, encoding="utf-8-sig")
-print("Đã lưu Portfolio_metrics_complete.csv")
-print(metrics_summary)
-
-# --- Vẽ cumulative return chart ---
-plt.figure(figsize=(12,6))
-for name, v in metrics.items():
-    plt.plot(v["Cumulative Return"], label=name)
-plt.plot((1 + mkt_m["VNINDEX"]).cumprod(), label="VNINDEX", color="black", linestyle="--")
-plt.title("Cumulative Return: Stable vs Aggressive Portfolio", fontsize=14)
-plt.legend()
-plt.grid(alpha=0.3)
-plt.tight_layout()
-plt.savefig("output/Portfolio_cumulative_return_complete.png", dpi=300)
-plt.close()
-print("Đã lưu Portfolio_cumulative_return_complete.png")
+
+    rolling_rows = []
+    for name, member in rolling_groups.items():
+        # Trọng số 1/N trong nhóm tại từng tháng, chỉ trên các mã có lợi suất tháng đó
+        # (không thuộc rổ / thiếu dữ liệu không bị tính là lợi suất 0); tháng chưa đủ 36 tháng lịch sử bị bỏ qua
+        m = member.where(ret_m.notna(), 0)
+        port_return = (ret_m.fillna(0) * m).sum(axis=1) / m.sum(axis=1).replace(0, np.nan)
+        port_return = port_return.dropna()
+        if port_return.empty:
+            continue
+        mean_ret, vol, sharpe, cum_ret, max_dd = return_metrics(port_return, rf=rf_m.mean())
+        rolling_rows.append({
+            "Portfolio": name,
+            "Annualized Return": mean_ret,
+            "Volatility": vol,
+            "Sharpe Ratio": sharpe,
+            "Max Drawdown": max_dd,
+            "N_months": len(port_return)
+        })
+
+    pd.DataFrame(rolling_rows).to_csv("output/Portfolio_metrics_rolling_beta.csv", index=False, encoding="utf-8-sig")
+    print("Đã lưu Portfolio_metrics_rolling_beta.csv")
+
+    return {"weights": portfolio_weights, "metrics": metrics_df,
+            "cumulative": cum_df[list(portfolio_groups)], "market_cumulative": (1 + mkt_m.iloc[:, 0]).cumprod()}
+
+
+# --- Backtest walk-forward trên lợi suất ngày (xem backtest.py) ---
+TRANSACTION_COST = 0.0015
+
+
+def walkforward_backtest(returns, capm, cost=TRANSACTION_COST):
+    """
+    Task backtest: cuối mỗi tháng lập lại danh mục theo beta 252 ngày tính đến hết ngày đó
+    (dùng lại beta trượt của task capm), nắm giữ trôi theo giá tới cuối tháng sau;
+    chi phí 15 bps / đơn vị turnover.
+    """
+    bt = backtest(returns["daily"], betas=capm["beta_252d"], freq="ME", cost=cost,
+                  rf=capm["rf_d"].mean() * 252)
+    bt["metrics"].reset_index().to_csv("output/Backtest_walkforward_metrics.csv", index=False, encoding="utf-8-sig")
+    bt["returns"].to_csv("output/Backtest_walkforward_returns.csv", encoding="utf-8-sig")
+    print("Đã lưu Backtest_walkforward_metrics.csv và Backtest_walkforward_returns.csv")
+    print(bt["metrics"][["Annualized Return", "Sharpe Ratio", "Max Drawdown", "Turnover"]])
+    return {"metrics": bt["metrics"], "returns": bt["returns"]}
+
+
+# --- 10. TỐI ƯU DANH MỤC MARKOWITZ (xem optimizer.py) ---
+MAX_WEIGHT = 0.2   # ràng buộc hộp: long-only, tối đa 20% / mã
+
+
+def markowitz_portfolios(capm, max_weight=MAX_WEIGHT, n_points=50):
+    """
+    Task markowitz: min-variance / max-Sharpe và đường biên hiệu quả.
+    Chỉ dùng các mã có đủ lịch sử lợi suất tháng; hiệp phương sai co rút Ledoit-Wolf.
+    """
+    ret_opt = capm["ret_m"].dropna(axis=1)
+    rf_m = capm["rf_m"]
+    rf_annual = rf_m.mean() * 12
+
+    cov_lw, shrinkage = ledoit_wolf(ret_opt)
+    cov_annual = cov_lw * 12
+    mu_annual = ret_opt.mean().to_numpy() * 12
+    print(f"\nLedoit-Wolf shrinkage: {shrinkage:.3f} ({ret_opt.shape[1]} mã, {ret_opt.shape[0]} tháng)")
+
+    opt_bounds = (0, max_weight)
+    opt_weights = pd.DataFrame({
+        "Min Variance": min_variance(cov_annual, opt_bounds),
+        "Max Sharpe": max_sharpe(mu_annual, cov_annual, rf=rf_annual, bounds=opt_bounds)
+    }, index=ret_opt.columns)
+    opt_weights.index.name = "Ticker"
+    opt_weights.round(6).to_csv("output/Markowitz_weights.csv", encoding="utf-8-sig")
+    print("Đã lưu Markowitz_weights.csv")
+
+    frontier, frontier_weights = efficient_frontier(mu_annual, cov_annual, n_points=n_points, bounds=opt_bounds,
+                                                    rf=rf_annual, tickers=ret_opt.columns)
+    pd.concat([frontier, frontier_weights.round(6)], axis=1).to_csv(
+        "output/Markowitz_efficient_frontier.csv", index=False, encoding="utf-8-sig")
+    print("Đã lưu Markowitz_efficient_frontier.csv")
+
+    # Hiệu quả (in-sample) của hai danh mục tối ưu, cùng thước đo với mục 9
+    opt_metrics, _ = portfolio_batch(opt_weights.T, ret_opt, rf=rf_m.mean())
+    print(opt_metrics)
+
+    # Điểm của hai danh mục tối ưu trên mặt phẳng (volatility, return) cho biểu đồ đường biên
+    opt_points = {
+        name: (np.sqrt(w @ cov_annual @ w), w @ mu_annual)
+        for name, w in opt_weights.items()
+    }
+    return {"weights": opt_weights, "metrics": opt_metrics, "frontier": frontier, "points": opt_points,
+            "asset_vol": np.sqrt(np.diag(cov_annual)), "asset_ret": mu_annual, "max_weight": max_weight}
+
+
+# --- Khoảng tin cậy bootstrap cho CAPM và hiệu quả danh mục (xem bootstrap.py) ---
+def bootstrap_intervals(capm, portfolios, markowitz, n_boot=2000, confidence=0.95, method="stationary",
+                        seed=42, max_workers=None):
+    """
+    Task bootstrap: khoảng tin cậy của alpha, beta, Sharpe, max drawdown cho từng mã và từng danh mục
+    (mục 9, mục 10) bằng stationary bootstrap trên lợi suất tháng.
+    """
+    ret_m, mkt_m, rf_m = capm["ret_m"], capm["mkt_m"], capm["rf_m"]
+    weights = pd.concat([portfolios["weights"], markowitz["weights"].T]).reindex(
+        columns=ret_m.columns).fillna(0.0)
+    port, _ = portfolio_returns(weights.to_numpy(), ret_m.to_numpy())
+
+    R = np.hstack([ret_m.to_numpy(dtype="f8"), port])
+    names = list(ret_m.columns) + list(weights.index)
+    types = ["Ticker"] * ret_m.shape[1] + ["Portfolio"] * len(weights)
+    ci = confidence_intervals(R, (mkt_m.iloc[:, 0] - rf_m).to_numpy(), rf_m.to_numpy(), names, types,
+                              sharpe_rf=rf_m.mean(), n_boot=n_boot, confidence=confidence, method=method,
+                              seed=seed, max_workers=max_workers)
+    ci.to_csv("output/Bootstrap_CI.csv", index=False, encoding="utf-8-sig")
+    print("\nĐã lưu Bootstrap_CI.csv")
+    print(ci.loc[ci["Type"] == "Portfolio", ["Name", "Metric", "Estimate", "CI_Lower", "CI_Upper"]])
+    return ci
+
+
+# --- 11. RỦI RO DANH MỤC: VaR / EXPECTED SHORTFALL (xem risk.py) ---
+def portfolio_risk(returns, portfolios, markowitz, garch, alphas=(0.95, 0.99), horizons=(1, 10),
+                   n_sims=100_000, seed=42):
+    """
+    Task risk: các danh mục của mục 9 và mục 10, kỳ hạn 1 ngày / 10 ngày, độ tin cậy 95% / 99%.
+    """
+    returns_daily = returns["daily"]
+    risk_weights = pd.concat([portfolios["weights"], markowitz["weights"].T]).reindex(
+        columns=returns_daily.columns).fillna(0.0)
+    risk_df = risk_report(returns_daily, risk_weights, alphas=alphas, horizons=horizons,
+                          n_sims=n_sims, seed=seed)
+
+    # Cùng các danh mục với hiệp phương sai có điều kiện GJR-GARCH (CCC) cho từng kỳ hạn
+    garch_risk = []
+    for h in horizons:
+        cov_h = conditional_cov(garch, horizon=h, tickers=returns_daily.columns)
+        garch_risk += [
+            parametric_var(returns_daily, risk_weights, alphas=alphas, horizons=(h,), cov=cov_h),
+            monte_carlo_var(returns_daily, risk_weights, alphas=alphas, horizons=(h,),
+                            n_sims=n_sims, seed=seed, cov=cov_h)
+        ]
+    garch_risk = pd.concat(garch_risk, ignore_index=True)
+    garch_risk["Method"] += " (GJR-GARCH)"
+    risk_df = pd.concat([risk_df, garch_risk], ignore_index=True)
+    risk_df.to_csv("output/Portfolio_VaR_CVaR.csv", index=False, encoding="utf-8-sig")
+    print("\nĐã lưu Portfolio_VaR_CVaR.csv")
+    print(risk_df[(risk_df["Horizon"] == 1) & (risk_df["Confidence"] == max(alphas))])
+    return risk_df
+
+
+# --- 12. BIỂU ĐỒ (VẼ SONG SONG, XEM charts.py) ---
+def render_charts(prices, heatmap, forecast, portfolios, markowitz, mode="full", max_workers=None):
+    """
+    Task charts: vẽ toàn bộ biểu đồ từ kết quả các task khác, mỗi biểu đồ một process.
+    mode: full (PNG 300 dpi) / draft (PNG 72 dpi) / svg / none.
+    """
+    ticker = forecast["ticker"]
+    fc = forecast["forecasts"][ticker]
+    jobs = {
+        "VN30_correlation_heatmap": (charts.correlation_heatmap, {"corr": heatmap["corr"]}),
+        "VN30_normalized_trend": (charts.normalized_trend, {"prices": prices["close"][prices["full_sample"]]}),
+        f"{ticker}_ARIMA_return_forecast": (charts.forecast_return,
+                                            {"actual": forecast["return"], "fc": fc, "ticker": ticker}),
+        f"{ticker}_ARIMA_price_forecast": (charts.forecast_price,
+                                           {"actual": forecast["price"], "fc": fc, "ticker": ticker}),
+        "Portfolio_cumulative_return_complete": (charts.cumulative_returns,
+                                                 {"cum": portfolios["cumulative"],
+                                                  "market": portfolios["market_cumulative"]}),
+        "Markowitz_efficient_frontier": (charts.efficient_frontier,
+                                         {"frontier": markowitz["frontier"], "asset_vol": markowitz["asset_vol"],
+                                          "asset_ret": markowitz["asset_ret"], "points": markowitz["points"],
+                                          "max_weight": markowitz["max_weight"]}),
+    }
+    return charts.render(jobs, mode=mode, max_workers=max_workers)
+
+
+def main(argv=None):
+    """
+    Chạy nhóm task "analysis" của pipeline (nhận cùng tham số dòng lệnh với pipeline.py).
+    """
+    from pipeline import main as run_pipeline
+
+    run_pipeline(argv, default_targets=("analysis",))
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# BACKTEST WALK-FORWARD CHO DANH MỤC THEO BETA
+# Khắc phục look-ahead của mục 9 (beta ước lượng trên toàn mẫu rồi chấm điểm trên chính mẫu đó):
+#   tại mỗi ngày tái cân bằng, beta chỉ dùng dữ liệu trượt đến hết ngày đó, danh mục được
+#   lập lại và nắm giữ (trôi theo giá) trên lợi suất NGÀY cho tới lần tái cân bằng sau.
+# - Beta trượt lấy từ rolling_capm (tổng tích lũy tính một lần cho mọi ngày) → mọi ngày tái cân bằng
+#   chỉ việc đọc một dòng, không hồi quy lại
+# - Quy tắc lập danh mục vector hóa trên mọi ngày tái cân bằng cùng lúc; nhiều chiến lược
+#   được gộp thành một tensor trọng số (kỳ × danh mục × mã)
+# - Mỗi kỳ nắm giữ: một cumprod (ngày × mã) + một phép nhân ma trận cho mọi danh mục
+# - Turnover = |trọng số mới − trọng số đã trôi cuối kỳ trước|, chi phí trừ vào ngày đầu kỳ
+import numpy as np
+import pandas as pd
+
+from capm import rolling_capm
+from portfolio import METRIC_COLUMNS, metrics_from_returns
+
+
+# ----------------- QUY TẮC LẬP DANH MỤC -----------------
+# Mỗi quy tắc nhận ma trận beta B (kỳ × mã, NaN = chưa đủ lịch sử)
+# và trả về dict tên danh mục -> mask (kỳ × mã); trọng số 1/N trong mask.
+def beta_split(threshold=1.0):
+    """
+    Hai danh mục như mục 9: High β (beta > threshold) và Low β (beta ≤ threshold).
+    """
+    def rule(B):
+        return {"High β": B > threshold, "Low β": B <= threshold}
+    return rule
+
+
+def beta_quantiles(q=5):
+    """
+    q danh mục theo phân vị beta trong từng kỳ (Q1 = beta thấp nhất).
+    """
+    def rule(B):
+        rank = pd.DataFrame(B).rank(axis=1, pct=True).to_numpy()
+        bucket = np.ceil(rank * q)
+        return {f"Q{k}": bucket == k for k in range(1, q + 1)}
+    return rule
+
+
+DEFAULT_STRATEGIES = {
+    "Beta 1.0": beta_split(1.0),
+    "Quintile": beta_quantiles(5)
+}
+
+
+def rebalance_positions(index, freq="ME"):
+    """
+    Vị trí (số nguyên) của ngày giao dịch cuối cùng trong mỗi kỳ freq ("ME", "QE", "W-FRI", ...).
+    """
+    pos = pd.Series(np.arange(len(index)), index=index).resample(freq).last().dropna()
+    return pos.astype(int).to_numpy()
+
+
+def formation_weights(B, strategies):
+    """
+    Áp dụng mọi chiến lược lên B (kỳ × mã) cùng lúc.
+    Trả về (W: kỳ × danh mục × mã, names: list "chiến lược | danh mục").
+    """
+    layers, names = [], []
+    for strategy, rule in strategies.items():
+        for name, mask in rule(B).items():
+            mask = np.asarray(mask, dtype="f8")
+            count = mask.sum(axis=1, keepdims=True)
+            layers.append(np.divide(mask, count, out=np.zeros_like(mask), where=count > 0))
+            names.append(f"{strategy} | {name}")
+    return np.stack(layers, axis=1), names
+
+
+# ----------------- MÔ PHỎNG -----------------
+def walk_forward(R, W, positions, cost=0.0):
+    """
+    Nắm giữ W[k] từ sau ngày positions[k] tới hết ngày positions[k+1] (kỳ cuối: tới hết dữ liệu).
+    - R: lợi suất ngày (T × N); NaN trong kỳ nắm giữ (tạm ngừng giao dịch) được coi là 0
+    - W: trọng số tại các ngày tái cân bằng (K × P × N); phần không đầu tư (tổng < 1) là tiền mặt
+    - cost: chi phí trên mỗi đơn vị turnover; lần lập danh mục đầu tiên không tính turnover
+    Trả về (port_returns T × P, turnover T × P); các ngày trước lần lập đầu tiên là NaN.
+    """
+    R0 = np.nan_to_num(np.asarray(R, dtype="f8"), nan=0.0)
+    T = R0.shape[0]
+    K, P, N = W.shape
+    port = np.full((T, P), np.nan)
+    turnover = np.zeros((T, P))
+    drifted = W[0]
+
+    for k in range(K):
+        start = positions[k]
+        end = positions[k + 1] if k + 1 < K else T - 1
+        if end <= start:
+            continue
+        Wk = W[k]
+        if k > 0:
+            turnover[start + 1] = np.abs(Wk - drifted).sum(axis=1)
+
+        # Giá trị danh mục (vốn đầu kỳ = 1) theo từng ngày: trọng số trôi theo giá trong kỳ
+        G = np.cumprod(1 + R0[start + 1:end + 1], axis=0)
+        V = G @ Wk.T + (1 - Wk.sum(axis=1))
+        prev = np.vstack([np.ones((1, P)), V[:-1]])
+        r = V / prev - 1
+        r[0] -= cost * turnover[start + 1]
+        port[start + 1:end + 1] = r
+
+        drifted = Wk * G[-1] / V[-1][:, None]
+
+    return port, turnover
+
+
+def backtest(returns, betas=None, excess_stock=None, excess_mkt=None, window=252, freq="ME",
+             strategies=None, cost=0.0, rf=0.0, periods_per_year=252):
+    """
+    Backtest walk-forward các danh mục theo beta trên lợi suất ngày.
+    - returns: lợi suất ngày (date × mã)
+    - betas: beta trượt đã tính sẵn (date × mã, vd. rolling_capm(...)["beta"]); beta tại ngày t
+      chỉ dùng dữ liệu đến hết ngày t. None → tính bằng rolling_capm(excess_stock, excess_mkt, window)
+    - freq: tần suất tái cân bằng; strategies: dict tên -> quy tắc (mặc định DEFAULT_STRATEGIES)
+    - cost: chi phí / đơn vị turnover; rf: lãi suất phi rủi ro năm cho Sharpe
+    Trả về dict:
+    - returns: lợi suất ngày của mọi danh mục (date × danh mục)
+    - turnover: turnover tại các ngày đầu kỳ (date × danh mục)
+    - weights: trọng số lúc lập danh mục (MultiIndex (date, danh mục) × mã)
+    - metrics: DataFrame METRIC_COLUMNS + số lần tái cân bằng
+    """
+    strategies = strategies or DEFAULT_STRATEGIES
+    if betas is None:
+        betas = rolling_capm(excess_stock, excess_mkt, window=window)["beta"]
+    betas = betas.reindex(index=returns.index, columns=returns.columns)
+
+    positions = rebalance_positions(returns.index, freq)
+    B = betas.to_numpy(dtype="f8")[positions]
+    # Bỏ các ngày tái cân bằng chưa có beta nào (chưa đủ lịch sử)
+    ready = np.isfinite(B).any(axis=1)
+    positions, B = positions[ready], B[ready]
+    if len(positions) == 0:
+        raise ValueError("Không có ngày tái cân bằng nào đủ lịch sử để ước lượng beta")
+
+    W, names = formation_weights(B, strategies)
+    port, turnover = walk_forward(returns.to_numpy(), W, positions, cost)
+
+    first = positions[0] + 1
+    index = returns.index[first:]
+    port, turnover = port[first:], turnover[first:]
+
+    metrics, _ = metrics_from_returns(port, rf, periods_per_year)
+    metrics["Turnover"] = turnover.mean(axis=0) * periods_per_year
+    metrics = pd.DataFrame(metrics, index=pd.Index(names, name="Portfolio"))[METRIC_COLUMNS]
+    metrics["N_rebalance"] = len(positions)
+
+    weights = pd.DataFrame(
+        W.reshape(-1, W.shape[2]),
+        index=pd.MultiIndex.from_product([returns.index[positions], names], names=["date", "Portfolio"]),
+        columns=returns.columns
+    )
+    return {
+        "returns": pd.DataFrame(port, index=index, columns=names),
+        "turnover": pd.DataFrame(turnover, index=index, columns=names),
+        "weights": weights,
+        "metrics": metrics
+    }
@@ -0,0 +1,336 @@
+# BENCHMARK HIỆU NĂNG
+# Suite "import": thời gian khởi động — import từng module của dự án trong một process Python MỚI
+# (đúng chi phí một worker phải trả), lấy trung vị của nhiều lần đo, kèm danh sách thư viện nặng
+# bị nạp theo (matplotlib, statsmodels, pmdarima, ...).
+# Suite "scale": dữ liệu giả lập theo đúng schema CafeF (Ngay, GiaDieuChinh, ThayDoi "0.2(0.88 %)",
+# KhoiLuongKhopLenh, ...) ở nhiều quy mô (30 → 3000 mã, 6 → 30 năm), đo các bước thật của dự án:
+# preprocess_raw_data → pivot (kho + ma trận + load_prices) → returns → CAPM → portfolio_metrics_weighted.
+# Suite "arima": thời gian fit auto_arima cho một mã theo độ dài chuỗi.
+# Kết quả ghi ra JSON; --baseline so với một file kết quả cũ, báo các mục chậm hơn ngưỡng
+# (exit code 1 nếu có hồi quy hiệu năng).
+#
+#   python benchmark.py --suite import
+#   python benchmark.py --suite scale --sizes 30x6 300x6 3000x30
+#   python benchmark.py --suite import scale arima --baseline output/benchmark_baseline.json --tolerance 0.25
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+MODULES = ("data", "analysis", "pipeline", "preprocess", "store", "fetcher", "refresh", "ingest",
+           "capm", "portfolio", "backtest", "optimizer", "risk", "garch", "forecast", "correlation",
+           "incremental", "charts", "metrics", "universe", "panel", "bootstrap", "adjust")
+HEAVY = ("matplotlib", "seaborn", "statsmodels", "pmdarima", "sklearn", "scipy", "requests")
+
+_IMPORT_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+t1 = time.perf_counter()
+print(json.dumps({{"seconds": t1 - t0, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _probe(code, cwd):
+    out = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def bench_imports(modules=MODULES, repeats=5, root=None):
+    """
+    Thời gian import (giây, trung vị của `repeats` lần) của từng module trong process mới.
+    "import:pandas" là mức sàn: mọi module của dự án đều cần pandas.
+    """
+    root = root or os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for module in ("pandas",) + tuple(modules):
+        runs = [_probe(_IMPORT_PROBE.format(module=module, heavy=HEAVY), root) for _ in range(repeats)]
+        results[f"import:{module}"] = {
+            "seconds": statistics.median(r["seconds"] for r in runs),
+            "min": min(r["seconds"] for r in runs),
+            "heavy": runs[-1]["heavy"],
+        }
+    return results
+
+
+# ----------------- DỮ LIỆU GIẢ LẬP (SCHEMA CafeF) -----------------
+SIZES = ((30, 6), (300, 6), (3000, 6), (30, 30), (300, 30))
+END_DATE = "2025-11-21"
+
+
+def _synthetic_prices(n_tickers, n_years, seed=0):
+    """
+    Giá close (ngày × mã) theo mô hình một nhân tố: r = beta * r_thị_trường + nhiễu.
+    Trả về (dates, close, index_close).
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=END_DATE, periods=n_years * 252)
+    mkt = rng.normal(3e-4, 0.012, len(dates))
+    beta = rng.uniform(0.5, 1.5, n_tickers)
+    ret = mkt[:, None] * beta + rng.normal(0, 0.015, (len(dates), n_tickers))
+    close = rng.uniform(10, 100, n_tickers) * np.exp(np.cumsum(ret, axis=0))
+    return dates, close.round(2), (1000 * np.exp(np.cumsum(mkt))).round(2)
+
+
+def _cafef_frame(dates, close, symbols, rng, missing=0.0):
+    """
+    DataFrame dạng long như file raw / API CafeF: sắp theo mã rồi ngày, Ngay dạng DD/MM/YYYY.
+    missing: tỷ lệ ô giá bị trống (trừ phiên đầu mỗi mã) để bước forward fill có việc làm.
+    """
+    n_days, n_tickers = close.shape
+    prev = np.vstack([close[:1], close[:-1]])
+    change = (close - prev).T.ravel()
+    pct = ((close / prev - 1) * 100).T.ravel()
+    close_long = close.T.ravel()
+    volume = rng.integers(10_000, 5_000_000, close_long.size)
+
+    df = pd.DataFrame({
+        "Ngay": np.tile(dates.strftime("%d/%m/%Y").to_numpy(dtype=object), n_tickers),
+        "GiaDieuChinh": (close_long * np.repeat(rng.uniform(0.3, 1.0, n_tickers), n_days)).round(2),
+        "GiaDongCua": close_long,
+        "ThayDoi": (pd.Series(change.round(2)).astype(str) + "(" + pd.Series(pct.round(2)).astype(str) + " %)"),
+        "KhoiLuongKhopLenh": volume,
+        "GiaTriKhopLenh": volume * close_long * 1000,
+        "KLThoaThuan": 0,
+        "GtThoaThuan": 0,
+        "GiaMoCua": (close_long - change / 2).round(2),
+        "GiaCaoNhat": np.maximum(close_long, close_long - change / 2) + 0.1,
+        "GiaThapNhat": np.minimum(close_long, close_long - change / 2) - 0.1,
+        "symbol": np.repeat(np.asarray(symbols, dtype=object), n_days),
+    })
+    if missing:
+        holes = rng.random(len(df)) < missing
+        holes[::n_days] = False
+        df.loc[holes, ["GiaDongCua", "GiaDieuChinh", "GiaMoCua", "GiaCaoNhat", "GiaThapNhat"]] = np.nan
+    return df
+
+
+def synthetic_raw(n_tickers=30, n_years=6, seed=0, missing=0.001):
+    """
+    Dữ liệu thô giả lập cho n_tickers mã (30 mã đầu mang tên VN30) trong n_years năm.
+    Trả về dict: vn30, vnindex (schema CafeF), rf (date, rate), tickers.
+    """
+    from universe import VN30
+
+    rng = np.random.default_rng(seed)
+    dates, close, index_close = _synthetic_prices(n_tickers, n_years, seed)
+    tickers = list(VN30[:n_tickers]) + [f"S{i:04d}" for i in range(len(VN30), n_tickers)]
+    rf = pd.DataFrame({"date": dates, "rate": 0.03 + rng.normal(0, 1e-3, len(dates)).cumsum() / 50})
+    return {"vn30": _cafef_frame(dates, close, tickers, rng, missing),
+            "vnindex": _cafef_frame(dates, index_close[:, None], ["VNINDEX"], rng),
+            "rf": rf, "tickers": tickers}
+
+
+# ----------------- ĐO CÁC BƯỚC THẬT CỦA DỰ ÁN -----------------
+@contextmanager
+def _sandbox():
+    """
+    Chạy trong thư mục tạm (có output/): các hàm của analysis.py ghi output/*.csv
+    nên không được ghi đè kết quả thật. In ra màn hình bị nuốt.
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="vn30_bench_") as root:
+        os.makedirs(os.path.join(root, "output"))
+        os.chdir(root)
+        try:
+            with redirect_stdout(io.StringIO()):
+                yield root
+        finally:
+            os.chdir(cwd)
+
+
+def _timed(func, *args, repeats=1, **kwargs):
+    """
+    Gọi func `repeats` lần. Trả về (kết quả lần cuối, {"seconds": trung vị, "min": nhỏ nhất}).
+    """
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = func(*args, **kwargs)
+        times.append(time.perf_counter() - t0)
+    return out, {"seconds": statistics.median(times), "min": min(times)}
+
+
+def _build_store(clean, clean_index, rf, tickers, store_root):
+    from store import PriceStore
+
+    store = PriceStore(store_root)
+    store.write_bars(clean)
+    store.write_bars(clean_index)
+    store.write_series("rf", rf, "rate")
+    store.build_matrix("vn30", tickers=tickers)
+
+
+def _first_date(raw):
+    from preprocess import parse_ngay
+
+    return parse_ngay(raw["Ngay"].iloc[:1]).iloc[0]
+
+
+def _run_stages(raw, repeats):
+    from analysis import capm_regression, compute_returns, load_prices, portfolio_metrics_weighted
+    from data import preprocess_raw_data, preprocess_vnindex_data
+
+    first = _first_date(raw["vn30"])
+    timings = {}
+    with _sandbox() as root:
+        store_root = os.path.join(root, "store")
+        clean, timings["preprocess"] = _timed(preprocess_raw_data, raw["vn30"], repeats=repeats)
+        clean_index = preprocess_vnindex_data(raw["vnindex"])
+
+        def pivot():
+            _build_store(clean, clean_index, raw["rf"], raw["tickers"], store_root)
+            return load_prices(store_root, required_start=first)
+
+        prices, timings["pivot"] = _timed(pivot, repeats=repeats)
+        returns, timings["returns"] = _timed(compute_returns, prices, repeats=repeats)
+        _, timings["capm"] = _timed(capm_regression, returns, store_root, repeats=repeats)
+        _, timings["portfolio"] = _timed(portfolio_metrics_weighted, list(returns["daily"].columns),
+                                         returns["daily"], repeats=repeats)
+    return timings
+
+
+def bench_scale(sizes=SIZES, repeats=3):
+    """
+    Thời gian từng bước của pipeline trên dữ liệu giả lập, mỗi quy mô (số mã, số năm) một lượt:
+    - preprocess: data.preprocess_raw_data trên DataFrame thô schema CafeF
+    - pivot: ghi kho + dựng ma trận date × mã + analysis.load_prices
+    - returns: analysis.compute_returns
+    - capm: analysis.capm_regression (CAPM tháng + beta trượt 36 tháng / 252 ngày)
+    - portfolio: analysis.portfolio_metrics_weighted (1/N toàn bộ mã, lợi suất ngày)
+    Khóa kết quả: "<bước>:<mã>x<năm>y"; rows = số dòng dữ liệu thô (mã × phiên).
+    """
+    # Lượt khởi động trên dữ liệu nhỏ (không tính): nạp các thư viện import lười (scipy, ...)
+    _run_stages(synthetic_raw(5, 2), repeats=1)
+
+    results = {}
+    for n_tickers, n_years in sizes:
+        raw = synthetic_raw(n_tickers, n_years)
+        rows = len(raw["vn30"])
+        timings = _run_stages(raw, repeats)
+        for stage, t in timings.items():
+            results[f"{stage}:{n_tickers}x{n_years}y"] = dict(t, rows=rows, rows_per_s=rows / t["seconds"])
+        print(f"  {n_tickers} mã × {n_years} năm ({rows:,} dòng): "
+              + ", ".join(f"{k} {v['seconds']:.2f}s" for k, v in timings.items()))
+    return results
+
+
+def bench_arima(years=(6, 30), n_series=2, repeats=1):
+    """
+    Thời gian fit auto_arima (forecast.fit_arima, không dùng cache) cho MỘT mã theo độ dài chuỗi.
+    Khóa kết quả: "arima:<năm>y"; seconds = trung vị giây / mã.
+    """
+    import warnings
+
+    from forecast import fit_arima, prepare_returns
+
+    results = {}
+    for n_years in years:
+        dates, close, _ = _synthetic_prices(n_series, n_years, seed=1)
+        times = []
+        for j in range(n_series):
+            _, ret = prepare_returns(pd.Series(close[:, j], index=dates))
+            with warnings.catch_warnings(), redirect_stdout(io.StringIO()):
+                warnings.simplefilter("ignore")
+                _, t = _timed(fit_arima, ret, repeats=repeats)
+            times.append(t["seconds"])
+        results[f"arima:{n_years}y"] = {"seconds": statistics.median(times), "min": min(times),
+                                        "rows": len(dates)}
+        print(f"  ARIMA {n_years} năm ({len(dates):,} phiên): {statistics.median(times):.2f}s / mã")
+    return results
+
+
+SUITES = {"import": bench_imports, "scale": bench_scale, "arima": bench_arima}
+
+
+# ----------------- KẾT QUẢ / SO SÁNH BASELINE -----------------
+def save_results(results, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    payload = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=1, ensure_ascii=False)
+    return payload
+
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.01):
+    """
+    So với baseline: ratio = hiện tại / baseline; chậm hơn (1 + tolerance) lần → hồi quy.
+    Bỏ qua các mục quá nhanh (< min_seconds) vì nhiễu đo lớn hơn tín hiệu.
+    Trả về list dict (name, baseline, current, ratio, regression).
+    """
+    rows = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = cur["seconds"] / base["seconds"] if base["seconds"] > 0 else float("inf")
+        noisy = max(cur["seconds"], base["seconds"]) < min_seconds
+        rows.append({"name": name, "baseline": base["seconds"], "current": cur["seconds"],
+                     "ratio": ratio, "regression": (not noisy) and ratio > 1 + tolerance})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark hiệu năng dự án VN30")
+    parser.add_argument("--suite", nargs="+", default=list(SUITES), choices=list(SUITES))
+    parser.add_argument("--repeats", type=int, default=None, help="số lần đo (mặc định theo suite)")
+    parser.add_argument("--sizes", nargs="+", default=[f"{n}x{y}" for n, y in SIZES],
+                        help="quy mô cho suite scale, dạng <số mã>x<số năm>, vd. 3000x30")
+    parser.add_argument("--years", nargs="+", type=int, default=[6, 30], help="độ dài chuỗi cho suite arima")
+    parser.add_argument("--out", default="output/benchmark_results.json")
+    parser.add_argument("--baseline", help="file kết quả cũ để so sánh")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="cho phép chậm hơn tối đa (tỷ lệ)")
+    args = parser.parse_args(argv)
+
+    options = {
+        "scale": {"sizes": [tuple(int(v) for v in s.lower().split("x")) for s in args.sizes]},
+        "arima": {"years": args.years},
+    }
+    results = {}
+    for suite in args.suite:
+        kwargs = dict(options.get(suite, {}))
+        if args.repeats is not None:
+            kwargs["repeats"] = args.repeats
+        t0 = time.perf_counter()
+        results.update(SUITES[suite](**kwargs))
+        print(f"✓ Suite {suite}: {time.perf_counter() - t0:.1f}s")
+
+    for name, r in results.items():
+        extra = f"  [{', '.join(r['heavy'])}]" if r.get("heavy") else ""
+        if r.get("rows_per_s"):
+            extra = f"  {r['rows_per_s']:,.0f} dòng/s"
+        print(f"{name:<28} {r['seconds'] * 1000:9.1f} ms{extra}")
+    save_results(results, args.out)
+    print(f"Đã lưu {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        rows = compare(results, baseline, args.tolerance)
+        for r in rows:
+            flag = "✗ CHẬM HƠN" if r["regression"] else "✓"
+            print(f"{flag} {r['name']:<28} {r['baseline'] * 1000:9.1f} → {r['current'] * 1000:9.1f} ms "
+                  f"(x{r['ratio']:.2f})")
+        if any(r["regression"] for r in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# KHOẢNG TIN CẬY BOOTSTRAP CHO CAPM VÀ HIỆU QUẢ DANH MỤC
+# - Lấy mẫu lại theo khối trên chuỗi lợi suất tháng (giữ tự tương quan / cụm biến động):
+#   stationary bootstrap (Politis–Romano, độ dài khối ngẫu nhiên, trung bình mean_block) hoặc
+#   circular block bootstrap (khối độ dài cố định); block = 1 → bootstrap i.i.d.
+# - Các mẫu lặp là MA TRẬN CHỈ SỐ (B × T): một lô B mẫu được đánh giá bằng một lượt NumPy
+#   (mỗi mẫu là một nhóm cột của ma trận T × (B·K)) → alpha / beta (capm.capm_moments),
+#   Sharpe / max drawdown (portfolio.metrics_from_returns) cho mọi mã và danh mục, không fit lại từng mẫu
+# - Các lô chạy song song trên process pool; lô i luôn dùng SeedSequence con thứ i
+#   → cùng seed cho cùng kết quả, bất kể số process
+# - Khoảng tin cậy percentile + sai số chuẩn bootstrap
+import multiprocessing as mp
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from capm import capm_moments
+from metrics import stage
+from portfolio import metrics_from_returns
+
+METHODS = ("stationary", "block")
+BOOTSTRAP_METRICS = ("Alpha", "Beta", "Sharpe Ratio", "Max Drawdown")
+BOOTSTRAP_COLUMNS = ["Name", "Type", "Metric", "Estimate", "Std_Error", "CI_Lower", "CI_Upper",
+                     "Confidence", "Method", "N_boot"]
+
+
+# ----------------- CHỈ SỐ LẤY MẪU LẠI -----------------
+def default_block(n_obs):
+    # Độ dài khối (trung bình) ~ T^(1/3)
+    return max(1, int(round(n_obs ** (1 / 3))))
+
+
+def stationary_indices(n_obs, n_boot, mean_block, rng):
+    """
+    Stationary bootstrap: mỗi vị trí bắt đầu khối mới với xác suất 1 / mean_block
+    (độ dài khối ~ hình học), trong khối các chỉ số liên tiếp, nối vòng cuối → đầu chuỗi.
+    Trả về ma trận chỉ số (n_boot × n_obs).
+    """
+    start = rng.integers(0, n_obs, size=(n_boot, n_obs))
+    new = rng.random((n_boot, n_obs)) < 1 / mean_block
+    new[:, 0] = True
+    t = np.arange(n_obs)
+    # Vị trí bắt đầu khối gần nhất tính đến t
+    last = np.maximum.accumulate(np.where(new, t, 0), axis=1)
+    return (np.take_along_axis(start, last, axis=1) + t - last) % n_obs
+
+
+def block_indices(n_obs, n_boot, block, rng):
+    """
+    Circular block bootstrap: các khối độ dài block bắt đầu ngẫu nhiên, nối vòng.
+    Trả về ma trận chỉ số (n_boot × n_obs).
+    """
+    n_blocks = -(-n_obs // block)
+    start = rng.integers(0, n_obs, size=(n_boot, n_blocks))
+    idx = (start[:, :, None] + np.arange(block)).reshape(n_boot, -1)[:, :n_obs]
+    return idx % n_obs
+
+
+def resample_indices(n_obs, n_boot, method="stationary", block=None, rng=None):
+    rng = np.random.default_rng(rng)
+    block = default_block(n_obs) if block is None else block
+    if method == "stationary":
+        return stationary_indices(n_obs, n_boot, block, rng)
+    if method == "block":
+        return block_indices(n_obs, n_boot, block, rng)
+    raise ValueError(f"method phải là một trong {METHODS}, không phải {method!r}")
+
+
+# ----------------- THỐNG KÊ THEO LÔ -----------------
+def batch_stats(idx, R, x, rf, sharpe_rf=0, periods_per_year=12):
+    """
+    Thống kê của mọi cột R (T × K) trên B mẫu lặp idx (B × T) trong một lượt:
+    - Alpha / Beta: hồi quy (R - rf) theo x (excess return thị trường), bỏ NaN từng cột
+    - Sharpe Ratio / Max Drawdown: như portfolio.metrics_from_returns (rf = sharpe_rf)
+    Trả về dict tên → mảng (B × K).
+    """
+    B, T = idx.shape
+    K = R.shape[1]
+    # (B, T, K) → (T, B·K): mẫu b chiếm các cột b·K ... b·K + K - 1
+    Rb = R[idx].transpose(1, 0, 2).reshape(T, B * K)
+    Y = Rb - np.repeat(rf[idx].T, K, axis=1)
+    X = np.repeat(x[idx].T, K, axis=1)
+
+    n, x_mean, y_mean, sxx, _, sxy = capm_moments(Y, X)
+    # Mẫu lặp toàn NaN / không đổi của một cột → NaN, không cảnh báo
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        beta = sxy / sxx
+        alpha = y_mean - beta * x_mean
+        m, _ = metrics_from_returns(Rb, sharpe_rf, periods_per_year)
+    return {"Alpha": alpha.reshape(B, K), "Beta": beta.reshape(B, K),
+            "Sharpe Ratio": m["Sharpe Ratio"].reshape(B, K),
+            "Max Drawdown": m["Max Drawdown"].reshape(B, K)}
+
+
+def _run_batches(batch_ids, sizes, seed, R, x, rf, sharpe_rf, periods_per_year, method, block):
+    """
+    Các lô được giao cho một process: lô i dùng SeedSequence con thứ i.
+    """
+    children = np.random.SeedSequence(seed).spawn(len(sizes))
+    out = []
+    for i in batch_ids:
+        rng = np.random.default_rng(children[i])
+        idx = resample_indices(len(R), sizes[i], method, block, rng)
+        out.append((i, batch_stats(idx, R, x, rf, sharpe_rf, periods_per_year)))
+    return out
+
+
+def _pool_context():
+    methods = mp.get_all_start_methods()
+    return mp.get_context("fork") if "fork" in methods else None
+
+
+def bootstrap(R, x, rf, sharpe_rf=0, periods_per_year=12, n_boot=2000, method="stationary",
+              block=None, seed=None, batch_cells=2_000_000, max_workers=None):
+    """
+    Phân phối bootstrap của alpha, beta, Sharpe, max drawdown cho mọi cột của R.
+    - R: lợi suất kỳ (T × K, NaN = không có dữ liệu); x: excess return thị trường (T,); rf: lãi suất
+      phi rủi ro từng kỳ (T,) — một mẫu lặp lấy cùng các kỳ cho R, x, rf
+    - n_boot mẫu lặp, chia lô sao cho mỗi lô ~ batch_cells ô (T × B·K) để giới hạn bộ nhớ
+    - seed: int / None; cùng seed → cùng kết quả, bất kể max_workers
+    - max_workers: None = số CPU, 1 = tuần tự trong process hiện tại
+    Trả về dict tên → mảng (n_boot × K).
+    """
+    R = np.asarray(R, dtype="f8")
+    x = np.asarray(x, dtype="f8")
+    rf = np.broadcast_to(np.asarray(rf, dtype="f8"), x.shape)
+    if method not in METHODS:
+        raise ValueError(f"method phải là một trong {METHODS}, không phải {method!r}")
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    T, K = R.shape
+    per_batch = max(1, int(batch_cells // max(1, T * K)))
+    sizes = [min(per_batch, n_boot - lo) for lo in range(0, n_boot, per_batch)]
+    args = (sizes, seed, R, x, rf, sharpe_rf, periods_per_year, method, block)
+
+    workers = min(len(sizes), max_workers or os.cpu_count() or 1)
+    with stage("bootstrap", method=method) as rec:
+        rec.rows_in = R.size
+        if workers > 1:
+            chunks = [list(range(len(sizes)))[i::workers] for i in range(workers)]
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+                parts = [p for part in pool.map(_run_batches, chunks, *[[a] * workers for a in args])
+                         for p in part]
+        else:
+            parts = _run_batches(range(len(sizes)), *args)
+        rec.rows_out = n_boot * K
+
+    # Ghép theo thứ tự lô (không phụ thuộc process nào chạy lô nào)
+    parts = [stats for _, stats in sorted(parts, key=lambda p: p[0])]
+    return {name: np.concatenate([p[name] for p in parts]) for name in BOOTSTRAP_METRICS}
+
+
+def confidence_intervals(R, x, rf, names, types=None, sharpe_rf=0, periods_per_year=12, n_boot=2000,
+                         confidence=0.95, method="stationary", block=None, seed=None, max_workers=None):
+    """
+    Bảng khoảng tin cậy percentile (BOOTSTRAP_COLUMNS), một dòng / (cột của R, thước đo).
+    Estimate là giá trị trên mẫu gốc (cùng cách tính với CAPM_results_realRF.csv và
+    Portfolio_metrics_complete.csv). names / types: tên và loại (Ticker / Portfolio) của các cột R.
+    """
+    R = np.asarray(R, dtype="f8")
+    x = np.asarray(x, dtype="f8")
+    rf = np.broadcast_to(np.asarray(rf, dtype="f8"), x.shape)
+    types = ["Ticker"] * R.shape[1] if types is None else list(types)
+
+    point = batch_stats(np.arange(len(R))[None, :], R, x, rf, sharpe_rf, periods_per_year)
+    boot = bootstrap(R, x, rf, sharpe_rf, periods_per_year, n_boot=n_boot, method=method, block=block,
+                     seed=seed, max_workers=max_workers)
+
+    tail = (1 - confidence) / 2 * 100
+    frames = []
+    for metric in BOOTSTRAP_METRICS:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            lower, upper = np.nanpercentile(boot[metric], [tail, 100 - tail], axis=0)
+            std = np.nanstd(boot[metric], axis=0, ddof=1)
+        frames.append(pd.DataFrame({
+            "Name": names, "Type": types, "Metric": metric, "Estimate": point[metric][0],
+            "Std_Error": std, "CI_Lower": lower, "CI_Upper": upper,
+        }))
+    out = pd.concat(frames, ignore_index=True)
+    out["Confidence"] = confidence
+    out["Method"] = method
+    out["N_boot"] = n_boot
+    return out[BOOTSTRAP_COLUMNS]
@@ -0,0 +1,158 @@
+# HỒI QUY CAPM THEO LÔ (CLOSED-FORM, VECTOR HÓA)
+# Thay vòng lặp sm.OLS(y, X).fit() cho từng mã:
+# alpha/beta, t-stat, p-value, R², Adj R² của mọi mã được tính cùng lúc bằng NumPy.
+# Mỗi cột có mask NaN riêng → mã có lịch sử khác nhau vẫn đúng như khi dropna từng mã.
+import numpy as np
+import pandas as pd
+
+from metrics import stage
+
+CAPM_COLUMNS = ["Ticker", "Alpha", "Beta", "Alpha_tstat", "Beta_tstat",
+                "Alpha_pvalue", "Beta_pvalue", "R2", "Adj_R2", "N_obs"]
+
+
+def capm_arrays(Y, x):
+    """
+    Hồi quy y_j = alpha_j + beta_j * x + e cho mọi cột j của Y (T × N) cùng lúc.
+    x có thể là vector (T,) dùng chung hoặc ma trận (T × N).
+    Trả về dict các mảng (N,).
+    """
+    return capm_from_moments(*capm_moments(Y, x))
+
+
+def capm_moments(Y, x):
+    """
+    Các moment đủ theo cột (bỏ qua NaN từng cột): n, x_mean, y_mean, sxx, syy, sxy.
+    beta = sxy / sxx, alpha = y_mean - beta * x_mean (không cần t-stat / p-value, vd. bootstrap).
+    """
+    Y = np.asarray(Y, dtype="f8")
+    x = np.asarray(x, dtype="f8")
+    if x.ndim == 1:
+        x = x[:, None]
+
+    mask = np.isfinite(Y) & np.isfinite(x)
+    n = mask.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Hai lượt: trung bình trước rồi tổng bình phương đã trừ trung bình (ổn định số học)
+        x_mean = np.where(mask, x, 0).sum(axis=0) / n
+        y_mean = np.where(mask, Y, 0).sum(axis=0) / n
+        xc = np.where(mask, x - x_mean, 0)
+        yc = np.where(mask, Y - y_mean, 0)
+
+        sxx = (xc * xc).sum(axis=0)
+        syy = (yc * yc).sum(axis=0)
+        sxy = (xc * yc).sum(axis=0)
+
+    return n, x_mean, y_mean, sxx, syy, sxy
+
+
+def capm_from_moments(n, x_mean, y_mean, sxx, syy, sxy):
+    """
+    Kết quả CAPM từ các moment đủ: số quan sát, trung bình, tổng bình phương / tích chéo
+    đã trừ trung bình (dùng chung cho capm_arrays và các tổng cập nhật gia tăng).
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        beta = sxy / sxx
+        alpha = y_mean - beta * x_mean
+
+        dof = n - 2
+        ssr = np.maximum(syy - beta * sxy, 0)
+        sigma2 = ssr / dof
+        se_beta = np.sqrt(sigma2 / sxx)
+        se_alpha = np.sqrt(sigma2 * (1 / n + x_mean ** 2 / sxx))
+
+        alpha_t = alpha / se_alpha
+        beta_t = beta / se_beta
+        r2 = 1 - ssr / syy
+        adj_r2 = 1 - (1 - r2) * (n - 1) / dof
+
+    from scipy import stats  # nạp khi cần: import scipy.stats tốn ~1s
+
+    alpha_p = 2 * stats.t.sf(np.abs(alpha_t), dof)
+    beta_p = 2 * stats.t.sf(np.abs(beta_t), dof)
+
+    return {
+        "Alpha": alpha, "Beta": beta,
+        "Alpha_tstat": alpha_t, "Beta_tstat": beta_t,
+        "Alpha_pvalue": alpha_p, "Beta_pvalue": beta_p,
+        "R2": r2, "Adj_R2": adj_r2,
+        "N_obs": n
+    }
+
+
+def capm_batch(excess_stock, excess_mkt):
+    """
+    CAPM cho mọi mã trong excess_stock (DataFrame date × ticker) theo excess_mkt (Series).
+    Trả về DataFrame cùng cột với CAPM_results_realRF.csv.
+    """
+    excess_mkt = excess_mkt.reindex(excess_stock.index)
+    # Một lượt NumPy cho mọi mã → đo cả lô (rows_in = số ô date × mã), không đo riêng từng mã
+    with stage("capm_regression") as rec:
+        rec.rows_in = excess_stock.size
+        res = capm_arrays(excess_stock.to_numpy(), excess_mkt.to_numpy())
+        rec.rows_out = excess_stock.shape[1]
+    capm_df = pd.DataFrame(res)
+    capm_df.insert(0, "Ticker", excess_stock.columns.to_numpy())
+    capm_df["N_obs"] = capm_df["N_obs"].astype(int)
+    return capm_df[CAPM_COLUMNS]
+
+
+def rolling_capm(excess_stock, excess_mkt, window=None, min_periods=None):
+    """
+    Alpha / beta / R² trượt cho mọi mã trên toàn bộ lịch sử.
+    - window: số kỳ của cửa sổ (vd. 36 tháng, 252 ngày); None → cửa sổ mở rộng (expanding)
+    - min_periods: số quan sát hợp lệ tối thiểu trong cửa sổ (mặc định = window, hoặc 3)
+    Dùng tổng tích lũy của x, y, x², y², xy: tổng trong cửa sổ = cs[t] - cs[t - window],
+    nên mỗi bước trượt là O(1) cho mỗi mã (tổng O(T·N) thay vì O(T·W·N) khi fit lại).
+    Trả về dict "alpha", "beta", "r2", "n_obs" → DataFrame date × ticker.
+    Giá trị tại ngày t chỉ dùng dữ liệu đến hết ngày t.
+    """
+    with stage("capm_rolling", window=window) as rec:
+        rec.rows_in = excess_stock.size
+        excess_mkt = excess_mkt.reindex(excess_stock.index)
+        Y = excess_stock.to_numpy(dtype="f8")
+        x = np.broadcast_to(excess_mkt.to_numpy(dtype="f8")[:, None], Y.shape)
+        mask = np.isfinite(Y) & np.isfinite(x)
+
+        if min_periods is None:
+            min_periods = window if window is not None else 3
+
+        # Trừ trung bình toàn mẫu trước khi cộng dồn để giảm sai số triệt tiêu;
+        # beta không đổi khi tịnh tiến x, y, alpha được cộng bù lại bên dưới.
+        with np.errstate(invalid="ignore"):
+            x_shift = np.nanmean(np.where(mask, x, np.nan), axis=0)
+            y_shift = np.nanmean(np.where(mask, Y, np.nan), axis=0)
+        xm = np.where(mask, x - x_shift, 0)
+        ym = np.where(mask, Y - y_shift, 0)
+
+        def window_sum(a):
+            cs = np.cumsum(a, axis=0)
+            if window is None:
+                return cs
+            out = cs.copy()
+            out[window:] -= cs[:-window]
+            return out
+
+        n = window_sum(mask.astype("f8"))
+        sx = window_sum(xm)
+        sy = window_sum(ym)
+        sxx = window_sum(xm * xm)
+        syy = window_sum(ym * ym)
+        sxy = window_sum(xm * ym)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = sxy - sx * sy / n
+            var_x = sxx - sx * sx / n
+            var_y = syy - sy * sy / n
+            beta = cov / var_x
+            alpha = (sy - beta * sx) / n + y_shift - beta * x_shift
+            r2 = cov * cov / (var_x * var_y)
+
+        valid = n >= min_periods
+    index, columns = excess_stock.index, excess_stock.columns
+    return {
+        "alpha": pd.DataFrame(np.where(valid, alpha, np.nan), index=index, columns=columns),
+        "beta": pd.DataFrame(np.where(valid, beta, np.nan), index=index, columns=columns),
+        "r2": pd.DataFrame(np.where(valid, r2, np.nan), index=index, columns=columns),
+        "n_obs": pd.DataFrame(n.astype(int), index=index, columns=columns),
+    }
@@ -0,0 +1,177 @@
+# VẼ BIỂU ĐỒ (TÁCH KHỎI PHẦN TÍNH TOÁN)
+# - Backend Agg + API hướng đối tượng (Figure / FigureCanvasAgg), không qua state machine pyplot
+#   → không cần màn hình, an toàn khi chạy trong nhiều process
+# - Mỗi biểu đồ là một job (hàm vẽ + dữ liệu), các job chạy song song trên process pool
+# - Giá chuẩn hóa: mọi mã vẽ bằng MỘT LineCollection thay vì một plt.plot / mã
+# - Heatmap tương quan: imshow (một ảnh) thay cho seaborn (mỗi ô một hình chữ nhật)
+# - Chế độ: full (PNG 300 dpi), draft (PNG 72 dpi), svg (vector), none (không vẽ)
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+CHART_MODES = {
+    "full": {"fmt": "png", "dpi": 300},
+    "draft": {"fmt": "png", "dpi": 72},
+    "svg": {"fmt": "svg", "dpi": 72},
+}
+
+
+def _figure(figsize):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _save(fig, path, dpi):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fig.tight_layout()
+    fig.savefig(path, dpi=dpi)
+    return path
+
+
+# ----------------- CÁC BIỂU ĐỒ -----------------
+def correlation_heatmap(corr, path, dpi=300, title="Correlation Heatmap VN30 (daily returns, clustered)"):
+    fig = _figure((14, 12))
+    ax = fig.add_subplot()
+    im = ax.imshow(corr.to_numpy(dtype="f8"), cmap="coolwarm", vmin=-1, vmax=1, interpolation="nearest")
+    n = len(corr)
+    ax.set_xticks(np.arange(n), labels=corr.columns, rotation=90)
+    ax.set_yticks(np.arange(n), labels=corr.index)
+    # Đường kẻ trắng giữa các ô (như linewidths của seaborn) bằng grid phụ
+    ax.set_xticks(np.arange(n + 1) - 0.5, minor=True)
+    ax.set_yticks(np.arange(n + 1) - 0.5, minor=True)
+    ax.grid(which="minor", color="white", linewidth=0.5)
+    ax.tick_params(which="minor", length=0)
+    fig.colorbar(im, ax=ax)
+    ax.set_title(title, fontsize=16)
+    return _save(fig, path, dpi)
+
+
+def normalized_trend(prices, path, dpi=300, title="Normalized Price Trend (VN30)"):
+    import matplotlib.dates as mdates
+    from matplotlib.collections import LineCollection
+
+    normalized = prices / prices.iloc[0]
+    x = mdates.date2num(normalized.index.to_pydatetime())
+    Y = normalized.to_numpy(dtype="f8")
+    # segments: (mã, ngày, 2); NaN làm đứt nét giống plt.plot
+    segments = np.stack([np.broadcast_to(x, Y.T.shape), Y.T], axis=-1)
+
+    fig = _figure((14, 7))
+    ax = fig.add_subplot()
+    lines = LineCollection(segments, colors=[f"C{i % 10}" for i in range(Y.shape[1])],
+                           linewidths=0.7, alpha=0.5)
+    ax.add_collection(lines)
+    ax.autoscale_view()
+    ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(ax.xaxis.get_major_locator()))
+    ax.set_title(title, fontsize=16)
+    ax.grid(alpha=0.3)
+    return _save(fig, path, dpi)
+
+
+def forecast_return(actual, fc, path, dpi=300, ticker="VJC"):
+    """
+    actual: lợi suất thực tế; fc: DataFrame dự báo của forecast.py (có thể kèm dải GARCH).
+    """
+    fig = _figure((12, 6))
+    ax = fig.add_subplot()
+    ax.plot(actual.index, actual.to_numpy(), label="Actual Return")
+    ax.plot(fc.index, fc["forecast_return"], label="Forecast Return", color="red")
+    ax.fill_between(fc.index, fc["lower_ci"], fc["upper_ci"], color="pink", alpha=0.3)
+    if "lower_ci_garch" in fc:
+        ax.fill_between(fc.index, fc["lower_ci_garch"], fc["upper_ci_garch"],
+                        color="orange", alpha=0.2, label="95% CI (GJR-GARCH)")
+    ax.set_title(f"ARIMA Forecast – {ticker} Daily Return (30 Business Days Ahead)", fontsize=14)
+    ax.legend()
+    return _save(fig, path, dpi)
+
+
+def forecast_price(actual, fc, path, dpi=300, ticker="VJC"):
+    fig = _figure((12, 6))
+    ax = fig.add_subplot()
+    ax.plot(actual.index, actual.to_numpy(), label="Actual Price")
+    ax.plot(fc.index, fc["price_forecast"], label="Forecast Price", color="red")
+    ax.set_title(f"ARIMA Forecast – {ticker} Price (30 Business Days Ahead)", fontsize=14)
+    ax.legend()
+    return _save(fig, path, dpi)
+
+
+def cumulative_returns(cum, market, path, dpi=300,
+                       title="Cumulative Return: Stable vs Aggressive Portfolio"):
+    """
+    cum: DataFrame lợi suất tích lũy (mỗi cột một danh mục); market: chuỗi tích lũy VNINDEX.
+    """
+    fig = _figure((12, 6))
+    ax = fig.add_subplot()
+    for name in cum.columns:
+        ax.plot(cum.index, cum[name], label=name)
+    ax.plot(market.index, market.to_numpy(), label=market.name or "VNINDEX", color="black", linestyle="--")
+    ax.set_title(title, fontsize=14)
+    ax.legend()
+    ax.grid(alpha=0.3)
+    return _save(fig, path, dpi)
+
+
+def efficient_frontier(frontier, asset_vol, asset_ret, points, path, dpi=300, max_weight=0.2):
+    """
+    frontier: DataFrame (volatility, return); points: dict tên danh mục -> (vol, return).
+    """
+    fig = _figure((10, 6))
+    ax = fig.add_subplot()
+    ax.plot(frontier["volatility"], frontier["return"], label="Efficient Frontier", color="navy")
+    ax.scatter(asset_vol, asset_ret, s=15, color="gray", alpha=0.6, label="Cổ phiếu VN30")
+    for name, (vol, ret) in points.items():
+        ax.scatter(vol, ret, s=80, marker="*", label=name)
+    ax.set_xlabel("Volatility (năm)")
+    ax.set_ylabel("Expected Return (năm)")
+    ax.set_title(f"Markowitz Efficient Frontier (Ledoit-Wolf, long-only, tối đa {max_weight:.0%}/mã)",
+                 fontsize=14)
+    ax.legend()
+    ax.grid(alpha=0.3)
+    return _save(fig, path, dpi)
+
+
+# ----------------- CHẠY SONG SONG -----------------
+def chart_path(name, mode="full", out_dir="output"):
+    return os.path.join(out_dir, f"{name}.{CHART_MODES[mode]['fmt']}")
+
+
+def _render_job(func, kwargs, path, dpi):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    return func(path=path, dpi=dpi, **kwargs)
+
+
+def _pool_context():
+    methods = mp.get_all_start_methods()
+    return mp.get_context("fork") if "fork" in methods else None
+
+
+def render(jobs, mode="full", out_dir="output", max_workers=None):
+    """
+    Vẽ các biểu đồ. jobs: dict tên file (không đuôi) -> (hàm vẽ, kwargs dữ liệu).
+    mode: full / draft / svg / none (none → không vẽ gì).
+    max_workers = 1 → vẽ tuần tự trong process hiện tại.
+    Trả về list đường dẫn file đã ghi.
+    """
+    if mode == "none" or not jobs:
+        return []
+    dpi = CHART_MODES[mode]["dpi"]
+    args = [(func, kwargs, chart_path(name, mode, out_dir), dpi) for name, (func, kwargs) in jobs.items()]
+
+    if max_workers == 1 or len(args) == 1:
+        paths = [_render_job(*a) for a in args]
+    else:
+        workers = min(len(args), max_workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+            paths = list(pool.map(_render_job, *zip(*args)))
+    for p in paths:
+        print(f"Đã lưu {os.path.basename(p)}")
+    return paths
@@ -0,0 +1,160 @@
+# TƯƠNG QUAN / HIỆP PHƯƠNG SAI NHANH + PHÂN CỤM
+# - Pairwise bỏ NaN theo cặp (như DataFrame.corr/cov) nhưng bằng vài phép nhân ma trận (BLAS):
+#   n = Vᵀ V, tổng = Xᵀ V, tổng bình phương = (X²)ᵀ V, tích chéo = Xᵀ X (V = mask có dữ liệu);
+#   không có NaN → một phép nhân ma trận duy nhất
+# - Ước lượng thay thế: co rút Ledoit-Wolf (optimizer.py), EWMA kiểu RiskMetrics
+# - Phân cụm phân cấp trên khoảng cách sqrt((1 - rho) / 2), sắp xếp lá (seriation)
+#   để vẽ heatmap theo khối, và nhãn cụm để nhóm tài sản
+import numpy as np
+import pandas as pd
+
+from incremental import PairMoments
+from optimizer import ledoit_wolf
+
+
+def _frame(values, columns):
+    return pd.DataFrame(values, index=columns, columns=columns)
+
+
+def cov_to_corr(cov):
+    sd = np.sqrt(np.diag(cov))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = cov / np.outer(sd, sd)
+    np.fill_diagonal(corr, np.where(np.isfinite(sd) & (sd > 0), 1.0, np.nan))
+    return corr
+
+
+def pairwise_moments(returns):
+    """
+    Thống kê đủ theo cặp (PairMoments) của returns (date × mã), tính một lượt bằng BLAS.
+    """
+    X = returns.to_numpy(dtype="f8")
+    moments = PairMoments(X.shape[1], np.nanmean(X, axis=0) if len(X) else None)
+    moments.update(X)
+    return moments
+
+
+def masked_cov(returns, ddof=1):
+    """
+    Hiệp phương sai pairwise bỏ NaN theo cặp (giống returns.cov()).
+    """
+    X = returns.to_numpy(dtype="f8")
+    if np.isfinite(X).all():
+        Xc = X - X.mean(axis=0)
+        return _frame(Xc.T @ Xc / (len(X) - ddof), returns.columns)
+    return _frame(pairwise_moments(returns).cov(ddof), returns.columns)
+
+
+def masked_corr(returns):
+    """
+    Tương quan Pearson pairwise bỏ NaN theo cặp (giống returns.corr()).
+    """
+    X = returns.to_numpy(dtype="f8")
+    if np.isfinite(X).all():
+        Xc = X - X.mean(axis=0)
+        return _frame(cov_to_corr(Xc.T @ Xc), returns.columns)
+    return _frame(pairwise_moments(returns).corr(), returns.columns)
+
+
+def ewma_cov(returns, lam=0.94, demean=False):
+    """
+    Hiệp phương sai EWMA (RiskMetrics): trọng số (1 - lam)·lam^k cho quan sát cách k kỳ,
+    chuẩn hóa tổng trọng số = 1. NaN bỏ theo cặp (như masked_cov): mỗi cặp dùng các kỳ cả hai
+    mã cùng có dữ liệu, trọng số chuẩn hóa lại trên các kỳ đó → một mã niêm yết muộn không
+    rút ngắn cửa sổ của các cặp khác.
+    """
+    X = returns.to_numpy(dtype="f8")
+    w = lam ** np.arange(len(X))[::-1]
+    if np.isfinite(X).all():
+        w /= w.sum()
+        if demean:
+            X = X - w @ X
+        return _frame((X * w[:, None]).T @ X, returns.columns)
+
+    V = np.isfinite(X).astype("f8")
+    Xz = np.where(V > 0, X, 0.0)
+    Vw = V * w[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        n = Vw.T @ V                      # tổng trọng số của các kỳ chung từng cặp
+        cov = (Xz * w[:, None]).T @ Xz / n
+        if demean:
+            mean = (Xz * w[:, None]).T @ V / n   # mean[i, j]: trung bình có trọng số của mã i trên kỳ chung với j
+            cov -= mean * mean.T
+    cov[n == 0] = np.nan
+    return _frame(cov, returns.columns)
+
+
+def estimate_cov(returns, method="sample", **kwargs):
+    """
+    method: "sample" (pairwise), "ledoit_wolf" (co rút, kỳ đủ dữ liệu), "ewma" (pairwise).
+    """
+    if method == "sample":
+        return masked_cov(returns, **kwargs)
+    if method == "ledoit_wolf":
+        return _frame(ledoit_wolf(returns)[0], returns.columns)
+    if method == "ewma":
+        return ewma_cov(returns, **kwargs)
+    raise ValueError(f"Phương pháp không hỗ trợ: {method}")
+
+
+def estimate_corr(returns, method="sample", **kwargs):
+    if method == "sample":
+        return masked_corr(returns)
+    cov = estimate_cov(returns, method, **kwargs)
+    return _frame(cov_to_corr(cov.to_numpy()), cov.columns)
+
+
+# ----------------- PHÂN CỤM -----------------
+OPTIMAL_ORDERING_MAX = 300
+
+
+def cluster_assets(corr, method="average", n_clusters=None, threshold=None, optimal_ordering=None):
+    """
+    Phân cụm phân cấp từ ma trận tương quan.
+    - Khoảng cách d = sqrt((1 - rho) / 2) ∈ [0, 1]; rho NaN coi như 0
+    - Thứ tự lá: các mã tương quan cao nằm cạnh nhau (heatmap theo khối). optimal_ordering
+      (sắp lá tối ưu, chi phí ~O(N³)) mặc định chỉ bật khi N ≤ OPTIMAL_ORDERING_MAX;
+      N lớn hơn dùng thứ tự lá của cây (vẫn giữ các cụm liền khối)
+    - n_clusters hoặc threshold (khoảng cách cắt cây) → nhãn cụm
+    Trả về dict: order (list mã), labels (Series mã → cụm, nếu có), linkage (ma trận scipy).
+    """
+    from scipy.cluster.hierarchy import fcluster, linkage
+    from scipy.spatial.distance import squareform
+
+    tickers = list(corr.columns)
+    rho = np.nan_to_num(corr.to_numpy(dtype="f8"), nan=0.0)
+    dist = np.sqrt(np.clip((1 - rho) / 2, 0, None))
+    np.fill_diagonal(dist, 0.0)
+    if optimal_ordering is None:
+        optimal_ordering = len(tickers) <= OPTIMAL_ORDERING_MAX
+    Z = linkage(squareform(dist, checks=False), method=method, optimal_ordering=optimal_ordering)
+
+    leaves = _leaf_order(Z, len(tickers))
+    out = {"order": [tickers[i] for i in leaves], "linkage": Z, "labels": None}
+    if n_clusters is not None:
+        out["labels"] = pd.Series(fcluster(Z, n_clusters, criterion="maxclust"), index=tickers, name="cluster")
+    elif threshold is not None:
+        out["labels"] = pd.Series(fcluster(Z, threshold, criterion="distance"), index=tickers, name="cluster")
+    return out
+
+
+def _leaf_order(Z, n):
+    # Thứ tự lá của cây (duyệt trái → phải), không cần dựng dendrogram
+    children = {n + i: (int(a), int(b)) for i, (a, b) in enumerate(Z[:, :2])}
+    order, stack = [], [2 * n - 2]
+    while stack:
+        node = stack.pop()
+        if node < n:
+            order.append(node)
+        else:
+            left, right = children[node]
+            stack += [right, left]
+    return order
+
+
+def seriate(corr, method="average", optimal_ordering=None):
+    """
+    Ma trận tương quan đã sắp theo thứ tự lá (dùng để vẽ heatmap).
+    """
+    order = cluster_assets(corr, method, optimal_ordering=optimal_ordering)["order"]
+    return corr.loc[order, order]
@@ -1,344 +1,264 @@
 # IMPORT THƯ VIỆN CẦN THIẾT
-import pandas as pd
-import requests
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import datetime, timedelta
+# Import module này không chạy gì: các bước là hàm, chỉ chạy qua main() / pipeline.py.
+# Thư viện tải dữ liệu (requests, ...) chỉ được nạp trong fetch_raw.
+# Danh sách mã / chỉ số lấy từ các universe (xem universe.py).
+# Sự kiện doanh nghiệp (chia tách, cổ tức, ...) được phát hiện khi tải và lưu thành bảng hệ số
+# điều chỉnh (xem adjust.py); giá điều chỉnh được tính lại từ close khi phân tích.
 import os
-import json
-import time
 
-# time series & stats
-import statsmodels.api as sm
-from statsmodels.tsa.arima.model import ARIMA
-from pmdarima import auto_arima
+import pandas as pd
+
+from adjust import ACTIONS_FILE, detect_events, load_events, merge_events, save_events
+from metrics import timed
+from preprocess import clean_prices, convert_frame, parse_ngay
+from store import PriceStore
+from universe import UNIVERSES_FILE, VN30, all_symbols, load_universes
 
-    
-# BƯỚC 1 — LẤY DANH SÁCH VN30
-vn30_stock = ("ACB", "BCM", "BID", "CTG", "DGC", "FPT", "GAS", "GVR", "HDB", "HPG",
-              "LPB", "MBB", "MSN", "MWG", "PLX", "SAB", "SHB", "SSB", "SSI", "STB",
-               "TCB", "TPB", "VCB", "VHM", "VIB", "VIC", "VJC", "VNM", "VPB", "VRE")
+# Các bước bên dưới là các task của pipeline (xem pipeline.py):
+#   fetch → clean ─┐
+#   rf ────────────┴→ store
+# Chạy file này = chạy nhóm task "data"; bước nào có đầu vào không đổi sẽ lấy từ cache.
 
-print("Danh sách VN30:", vn30_stock)
-print("Tổng số mã:", len(vn30_stock))
+# BƯỚC 1 — DANH SÁCH MÃ: các universe (VN30, rổ tự chọn, ...) cấu hình ở universe.py / universes.json.
+# Mọi universe dùng chung một lượt tải / làm sạch / ghi kho: mã thuộc nhiều rổ chỉ xử lý một lần.
+vn30_stock = VN30
 
 start_date = "01/01/2020"
 end_date = "21/11/2025"
 
 
-# BƯỚC 2 — HÀM LẤY DỮ LIỆU TỪ CafeF 
-def fetch_cafef_price(ticker, start_date, end_date, page_index=1, page_size=10000, save_raw=True): 
-    """
-    Lấy dữ liệu giá CafeF.
-    start_date, end_date dạng DD/MM/YYYY.
-    """
-    url = "https://s.cafef.vn/Ajax/PageNew/DataHistory/PriceHistory.ashx"
-    
-    params = {
-        "Symbol": ticker,
-        "StartDate": start_date,
-        "EndDate": end_date,
-        "PageIndex": page_index,
-        "PageSize": page_size
-    }
-
-    headers = {
-        "User-Agent": "Mozilla/5.0",
-        "Referer": "https://s.cafef.vn/"
-    }
+# File raw giữ tên cũ: raw_file chứa cổ phiếu của mọi universe, vnindex_raw_file chứa các chỉ số
+raw_file = "VN30_raw_2020_2025.csv"
+vnindex_raw_file = "VNINDEX_raw_2020_2025.csv"
+backup_files = ("VN30_raw_backup_2020_2025.csv", "VNINDEX_raw_backup_2020_2025.csv")
+rf_file = "Risk_Free_Rate_2020-2025.csv"
+# Bảng sự kiện doanh nghiệp / hệ số điều chỉnh (có thể thêm dòng nhập tay, source = manual)
+actions_file = ACTIONS_FILE
 
-    resp = requests.get(url, params=params, headers=headers, timeout=20)
+# Kho dữ liệu dạng cột dùng chung với analysis.py (xem store.py)
+store_root = "store"
 
-    try:
-        data = resp.json()
-    except:
-        print(f"[ERROR] JSON parse lỗi cho {ticker}")
-        return pd.DataFrame()
+# True → chỉ tải các phiên còn thiếu nếu đã có file raw (xem refresh.py)
+# False → luôn tải lại toàn bộ từ start_date
+incremental = True
 
-    # Lấy danh sách row
-    rows = []
-    if "Data" in data and isinstance(data["Data"], dict) and "Data" in data["Data"]:
-        rows = data["Data"]["Data"]
-    else:
-        print(f"[WARN] Không tìm thấy Data.Data cho {ticker}. Kiểm tra JSON raw.")
-        return pd.DataFrame()
-
-    # Chuyển sang DataFrame
-    df = pd.DataFrame(rows)
-    if not df.empty:
-        df["symbol"] = ticker
-
-    return df
-
-all_data = []
-
-for ticker in vn30_stock:
-    print(f"Đang tải {ticker}...")
-    df = fetch_cafef_price(ticker, start_date, end_date, page_index=1, page_size=10000, save_raw=True)
-    
-    # Nếu API thất bại cho bất kỳ ticker nào → dừng
-    if df is None or df.empty:
-        print("API thất bại → dùng file backup!") 
-        backup_file = "VN30_raw_backup_2020_2025.csv"
-        if os.path.exists(backup_file):
-            df = pd.read_csv(backup_file)
-            all_data.append(df)
-        else:
-            print(" Không có file backup → DỪNG LẠI!")
-        break
-
-    if df is not None and not df.empty: 
-        all_data.append(df)
-        print(f"✓ Thành công ({len(df)} dòng)")
-        
-        # Nghỉ 0.5s để tránh bị chặn
-        time.sleep(0.5)
-        
-# Gộp toàn bộ
-df_all = pd.concat(all_data, ignore_index=True)
-
-# Chuẩn hóa cột date để sắp xếp
-# CafeF trả date dạng string, convert ngày tháng
-df_all["Ngay"] = pd.to_datetime(df_all["Ngay"], dayfirst=True, errors="coerce")
-
-# Sắp xếp theo symbol rồi date
-df_all = df_all.sort_values(["symbol", "Ngay"]).reset_index(drop=True)
-
-df_all.to_csv("VN30_raw_2020_2025.csv", index=False, encoding="utf-8-sig")
-print("Đã lưu file raw data: VN30_raw_2020_2025.csv")
-print(df_all.head)
-
-# Lấy dữ liệu VN-Index:
-ticker = "VNINDEX"
-print(f"Đang tải {ticker}...")
-
-# Fetch từ CafeF
-vnindex_df = fetch_cafef_price(
-    ticker,
-    start_date,
-    end_date,
-    page_index=1,
-    page_size=10000,
-    save_raw=True
-)
-
-if vnindex_df is not None and not vnindex_df.empty:
-    all_data.append(vnindex_df)
-    print(f"✓ Thành công ({len(vnindex_df)} dòng)")
-    
-    # Chuẩn hóa cột date để sắp xếp
-    # CafeF trả date dạng string, convert ngày tháng
-    vnindex_df["Ngay"] = pd.to_datetime(vnindex_df["Ngay"], dayfirst=True, errors="coerce")
-
-    # Sắp xếp theo symbol rồi date
-    vnindex_df = vnindex_df.sort_values(["Ngay"]).reset_index(drop=True)
-
-    vnindex_df.to_csv("VNINDEX_raw_2020_2025.csv", index=False, encoding="utf-8-sig")
-    print("Đã lưu file raw data: VNINDEX_raw_2020_2025.csv")
-else:
-    print("✗ Lỗi: Không thể tải dữ liệu VNINDEX từ API. Dùng file backup...")
-    vnindex_backup = "VNINDEX_raw_backup_2020_2025.csv"
-    if os.path.exists(vnindex_backup):
-        vnindex_df = pd.read_csv(vnindex_backup)
-
-# Nghỉ 0.5 giây tránh bị chặn
-time.sleep(0.5)
 
-# BƯỚC 3 — XỬ LÝ DỮ LIỆU THÔ
-# 1. XỬ LÝ DỮ LIỆU CHO VN30
-def preprocess_raw_data(df_all):
+def select_universes(universes=None, universes_file=UNIVERSES_FILE):
     """
-    Tiền xử lý DataFrame thô từ CafeF:
-    - Giữ các cột cần thiết: Date, Close, Adj_Close, Open, High, Low, Volume, symbol
-    - Rename cột sang chuẩn
-    - Convert số và ngày tháng
+    Các Universe được chọn theo tên (None → mọi universe đã cấu hình).
     """
-    df = df_all.copy()
-    # Chuẩn hóa tên cột 
-    rename_map = {
-        "Ngay": "date",
-        "GiaDongCua": "close",
-        "GiaDieuChinh": "adj_close",
-        "GiaMoCua": "open",
-        "GiaCaoNhat": "high",
-        "GiaThapNhat": "low",
-        'KhoiLuongKhopLenh': 'volume',
-        "symbol": "ticker"
-        }
-    
-    df.rename(columns=rename_map, inplace=True)
-
-    # Chỉ giữ các cột cần thiết nếu có
-    keep_cols = ["date", "close", "adj_close", "open", "high", "low", "volume", "ticker"]
-    df = df[[c for c in keep_cols if c in df.columns]]
-    
-    # Chuyển symbol ngay sau date
-    cols = df.columns.tolist()
-    if "ticker" in cols:
-        cols.remove("ticker")
-        cols.insert(1, "ticker")
-        df = df[cols]
+    configured = load_universes(universes_file)
+    return [configured[n] for n in (universes or configured)]
 
-    # Convert ngày tháng
-    if "date" in df.columns:
-        df["date"] = pd.to_datetime(df["date"], dayfirst=True, errors="coerce")
-
-    # Convert numeric các cột số
-    num_cols = ["close", "adj_close", "open", "high", "low", "volume", "value"]
-    for c in num_cols:
-        if c in df.columns:
-            df[c] = (
-                df[c].astype(str)
-                      .str.replace(",", "", regex=False)
-            )
-            
-            df[c] = pd.to_numeric(df[c], errors="coerce")
 
-    # Xử lý missing
-    missing_before = df.isna().sum().sum()
+def _split_symbols(df_all, indices):
+    is_index = df_all["symbol"].isin(indices) if not df_all.empty else pd.Series(dtype=bool)
+    return df_all[~is_index].reset_index(drop=True), df_all[is_index].reset_index(drop=True)
 
-    if missing_before > 0:
-        print(f"[INFO] Missing detected: {missing_before} values → applying cleaning")
-        
-        # Loại bỏ dòng không có ngày
-        df = df.dropna(subset=['date'])
 
-        # Forward fill theo từng mã 
-        df = df.groupby("ticker", group_keys=False).apply(lambda x: x.ffill())
+# BƯỚC 2 — TẢI DỮ LIỆU TỪ CafeF (SONG SONG, XEM fetcher.py)
+def fetch_raw(universes=None, start_date=start_date, end_date=end_date, incremental=incremental,
+              offline=False, universes_file=UNIVERSES_FILE):
+    """
+    Tải dữ liệu thô cho hợp các mã của các universe + chỉ số tham chiếu, chung một lượt tải
+    (cùng session, rate limiter, retry, backup), rồi ghi file raw.
+    offline=True → không gọi API, chỉ đọc lại file raw đã lưu.
+    Bảng sự kiện doanh nghiệp (actions_file) được cập nhật gia tăng theo các phiên mới tải.
+    Trả về dict: stocks, indices (schema CafeF), events (bảng sự kiện, xem adjust.py).
+    """
+    from fetcher import fetch_many
+    from ingest import iter_raw_chunks
+    from refresh import incremental_refresh, load_raw
+
+    tickers, indices = all_symbols(select_universes(universes, universes_file))
+    symbols = tickers + indices
+
+    def load_stored():
+        frames = [df for df in (load_raw(raw_file), load_raw(vnindex_raw_file)) if not df.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["symbol", "Ngay"])
+
+    events = load_events(actions_file)
+
+    if offline:
+        stored = load_stored()
+        stored = stored[stored["symbol"].isin(symbols)]
+        if events is None:
+            events = detect_events(convert_frame(stored))
+        stocks_df, indices_df = _split_symbols(stored, indices)
+        return {"stocks": stocks_df, "indices": indices_df, "events": events}
+
+    print("Danh sách mã:", tickers, "+ chỉ số:", indices)
+    print("Tổng số mã:", len(tickers))
+
+    if incremental and (os.path.exists(raw_file) or os.path.exists(vnindex_raw_file)):
+        # Cập nhật gia tăng: cổ phiếu và chỉ số nối thêm phiên mới vào dữ liệu raw đã có
+        df_all, failed, events = incremental_refresh(load_stored(), symbols, start_date, end_date, events=events,
+                                                     max_workers=8, rate=4.0, retries=3, backoff=1.0)
+        if failed:
+            print(f"[WARN] Không cập nhật được {failed} → giữ dữ liệu đã lưu")
+    else:
+        # Tải toàn bộ. Mã nào lỗi sau khi retry → chỉ mã đó lấy từ file backup.
+        fetched, failed = fetch_many(symbols, start_date, end_date,
+                                     max_workers=8, rate=4.0, retries=3, backoff=1.0)
+        failed += [t for t, df in fetched.items() if df.empty]
+        all_data = [df for df in fetched.values() if not df.empty]
+
+        if failed:
+            print(f"API thất bại cho {failed} → dùng file backup!")
+            found = set()
+            for backup_file in backup_files:
+                if os.path.exists(backup_file):
+                    # Đọc backup theo chunk, chỉ giữ các mã lỗi (không nạp cả file)
+                    for chunk in iter_raw_chunks(backup_file, tickers=failed):
+                        found.update(chunk["symbol"].unique())
+                        all_data.append(chunk)
+            if set(failed) - found:
+                print(" Không có dữ liệu backup → bỏ qua các mã:", sorted(set(failed) - found))
+
+        # Gộp toàn bộ
+        df_all = pd.concat(all_data, ignore_index=True)
+
+        # Chuẩn hóa cột date để sắp xếp
+        # CafeF trả date dạng string, convert ngày tháng
+        df_all["Ngay"] = parse_ngay(df_all["Ngay"])
+
+        # Sắp xếp theo symbol rồi date
+        df_all = df_all.sort_values(["symbol", "Ngay"]).reset_index(drop=True)
+
+        # Tải toàn bộ → phát hiện lại sự kiện của các mã vừa tải (giữ sự kiện nhập tay)
+        events = merge_events(events, detect_events(convert_frame(df_all)), replace=df_all["symbol"].unique())
+
+    stocks_df, indices_df = _split_symbols(df_all, indices)
+
+    stocks_df.to_csv(raw_file, index=False, encoding="utf-8-sig")
+    print(f"Đã lưu file raw data: {raw_file}")
+    print(stocks_df.head())
+
+    if indices_df.empty:
+        print("✗ Lỗi: Không có dữ liệu chỉ số", indices)
+    else:
+        indices_df.to_csv(vnindex_raw_file, index=False, encoding="utf-8-sig")
+        print(f"Đã lưu file raw data: {vnindex_raw_file}")
 
-        # Drop lại phần còn NA (đầu chuỗi)
-        df = df.dropna()
+    save_events(events, actions_file)
+    print(f"Đã lưu bảng sự kiện doanh nghiệp: {actions_file} ({len(events)} sự kiện)")
 
-        missing_after = df.isna().sum().sum()
-        print(f"[INFO] Missing after cleaning: {missing_after}")
-    
-    return df
+    return {"stocks": stocks_df, "indices": indices_df, "events": events}
 
-df_clean = preprocess_raw_data(df_all)
 
-df_clean.to_csv("VN30_clean_2020_2025.csv", index=False, encoding="utf-8-sig")
-print("Đã lưu file raw data: VN30_clean_2020_2025.csv")
+# BƯỚC 3 — XỬ LÝ DỮ LIỆU THÔ
+# 1. XỬ LÝ DỮ LIỆU CHO VN30
+@timed("preprocess_raw_data")
+def preprocess_raw_data(df_all):
+    """
+    Tiền xử lý DataFrame thô từ CafeF (xem preprocess.py):
+    - Giữ các cột cần thiết: Date, Close, Adj_Close, Open, High, Low, Volume, symbol
+    - Rename cột sang chuẩn, tách ThayDoi thành change / change_pct
+    - Convert số và ngày tháng, forward fill theo từng mã
+    """
+    return clean_prices(df_all)
 
-# Kiểm tra 5 dòng đầu
-print("Đã xử lý dữ liệu VN30")
-print(df_clean.head())
 
 # 2. XỬ LÝ DỮ LIỆU CHO VNINDEX
+@timed("preprocess_vnindex_data")
 def preprocess_vnindex_data(vnindex_df):
     """
-    Tiền xử lý DataFrame thô từ CafeF:
-    - Giữ các cột cần thiết: Date, Close, Adj_Close, Open, High, Low, Volume, symbol
-    - Rename cột sang chuẩn
-    - Convert số và ngày tháng
+    Tiền xử lý VNINDEX bằng cùng schema với cổ phiếu (xem preprocess.py).
     """
-    df_vnindex = vnindex_df.copy()
-    # Chuẩn hóa tên cột 
-    rename_map = {
-        "Ngay": "date",
-        "GiaDongCua": "close",
-        "GiaDieuChinh": "adj_close",
-        "GiaMoCua": "open",
-        "GiaCaoNhat": "high",
-        "GiaThapNhat": "low",
-        'KhoiLuongKhopLenh': 'volume',
-        "symbol": "ticker"
-        }
-    
-    df_vnindex.rename(columns=rename_map, inplace=True)
-
-    # Chỉ giữ các cột cần thiết nếu có
-    keep_cols = ["date", "close", "adj_close", "open", "high", "low", "volume", "ticker"]
-    df_vnindex = df_vnindex[[c for c in keep_cols if c in df_vnindex.columns]]
-    
-    
-    # Chuyển symbol ngay sau date
-    cols = df_vnindex.columns.tolist()
-    if "ticker" in cols:
-        cols.remove("ticker")
-        cols.insert(1, "ticker")
-        df_vnindex = df_vnindex[cols]
-
-    # Convert ngày tháng
-    if "date" in df_vnindex.columns:
-        df_vnindex["date"] = pd.to_datetime(df_vnindex["date"], dayfirst=True, errors="coerce")
-
-    # Convert numeric các cột số
-    num_cols = ["close", "adj_close", "open", "high", "low", "volume", "value"]
-    for c in num_cols:
-        if c in df_vnindex.columns:
-            df_vnindex[c] = (
-                df_vnindex[c].astype(str)
-                      .str.replace(",", "", regex=False)
-            )
-            df_vnindex[c] = pd.to_numeric(df_vnindex[c], errors="coerce")
+    return clean_prices(vnindex_df)
 
-    # Xử lý missing
-    missing_before = df_vnindex.isna().sum().sum()
 
-    if missing_before > 0:
-        print(f"[INFO] Missing detected: {missing_before} values → applying cleaning")
-        
-        # Loại bỏ dòng không có ngày
-        df_vnindex = df_vnindex.dropna(subset=['date'])
-
-        # Forward fill 
-        df_vnindex = df_vnindex.ffill()
-
-        # Drop lại phần còn NA (đầu chuỗi)
-        df_vnindex = df_vnindex.dropna()
-
-        missing_after = df_vnindex.isna().sum().sum()
-        print(f"[INFO] Missing after cleaning: {missing_after}")
-        
-    return df_vnindex
-
-vnindex_clean = preprocess_vnindex_data(vnindex_df)
+def clean_raw(fetch):
+    """
+    Task clean: làm sạch dữ liệu thô của task fetch (bảng sự kiện được chuyển tiếp nguyên trạng).
+    """
+    df_clean = preprocess_raw_data(fetch["stocks"])
+    print("Đã xử lý dữ liệu cổ phiếu")
+    print(df_clean.head())
 
-vnindex_clean.to_csv("VNINDEX_clean_2020_2025.csv", index=False, encoding="utf-8-sig")
-print("Đã lưu file raw data: VNINDEX_clean_2020_2025.csv")
+    index_clean = preprocess_vnindex_data(fetch["indices"])
+    print("Đã xử lý dữ liệu chỉ số")
+    print(index_clean.head())
+    return {"stocks": df_clean, "indices": index_clean, "events": fetch.get("events")}
 
-# Kiểm tra 5 dòng đầu
-print("Đã xử lý dữ liệu VNINDEX")
-print(vnindex_clean.head())
 
- # 2. XỬ LÝ DỮ LIỆU CHO RISK FREE RATE
+ # 3. XỬ LÝ DỮ LIỆU CHO RISK FREE RATE
 # --- 0. Đọc và chuẩn hóa dữ liệu Risk-Free Rate ---
-rf_file = "Risk_Free_Rate_2020-2025.csv"
-rf_df = pd.read_csv(rf_file)
-
+@timed("preprocess_rf_data")
 def preprocess_rf_data(rf_df):
     df_rf = rf_df.copy()
-    
+
     # Chuẩn hóa tên cột
     rename_map = {
         "Ngày": "date",
         "Lần cuối": "rate"
     }
     df_rf.rename(columns=rename_map, inplace=True)
-    
+
     # Giữ các cột cần thiết
     df_rf = df_rf[[c for c in ["date","rate"] if c in df_rf.columns]]
-    
+
     # Convert ngày tháng
     df_rf["date"] = pd.to_datetime(df_rf["date"], dayfirst=True, errors="coerce")
-    
+
     # Convert rate sang decimal
     df_rf["rate"] = df_rf["rate"].astype(str).str.replace('%','').str.replace(',','').astype(float)/100
-    
+
     # Sắp xếp theo ngày tăng dần
     df_rf = df_rf.sort_values('date').reset_index(drop=True)
-    
+
     # Xử lý missing
     df_rf = df_rf.dropna(subset=['date', 'rate']).ffill().dropna()
-    
+
     return df_rf
 
-rf_clean = preprocess_rf_data(rf_df)
 
-# Lưu file chuẩn hóa
-rf_clean.to_csv("Risk_Free_Rate_clean_2020-2025.csv", index=False, encoding="utf-8-sig")
-print("Đã lưu Risk-Free Rate chuẩn hóa: Risk_Free_Rate_clean_2020-2025.csv")
-print(rf_clean.head())
+def load_rf(rf_file=rf_file):
+    """
+    Task rf: đọc và chuẩn hóa file lãi suất phi rủi ro.
+    """
+    rf_clean = preprocess_rf_data(pd.read_csv(rf_file))
+    print(rf_clean.head())
+    return rf_clean
+
+
+# BƯỚC 4 — GHI KHO + PIVOT SẴN MA TRẬN GIÁ CHO analysis.py (memory-mapped, không cần pivot lại)
+def save_store(clean, rf, store_root=store_root, universes=None, universes_file=UNIVERSES_FILE):
+    """
+    Task store: ghi dữ liệu đã làm sạch vào kho (mỗi mã một lần, dùng chung cho mọi universe)
+    và dựng ma trận giá date × mã cho từng universe (store/matrix/<tên universe>).
+    """
+    store = PriceStore(store_root)
+
+    store.write_bars(clean["stocks"])
+    print(f"Đã lưu dữ liệu cổ phiếu vào kho: {store.root}/bars")
+
+    store.write_bars(clean["indices"])
+    print(f"Đã lưu dữ liệu chỉ số vào kho: {store.root}/bars")
+
+    store.write_series("rf", rf, "rate")
+    print(f"Đã lưu Risk-Free Rate chuẩn hóa vào kho: {store.root}/series/rf.npy")
+
+    if clean.get("events") is not None:
+        store.write_actions(clean["events"])
+        print(f"Đã lưu bảng sự kiện doanh nghiệp vào kho: {store.root}/actions.npy")
+
+    shapes = {}
+    for u in select_universes(universes, universes_file):
+        n_dates, n_tickers = store.build_matrix(u.store_name, tickers=u.tickers())
+        shapes[u.name] = {"n_dates": n_dates, "n_tickers": n_tickers}
+        print(f"Đã lưu ma trận close/adj_close {u.name}: {n_dates} ngày × {n_tickers} mã")
+    return shapes
+
+
+def main(argv=None):
+    """
+    Chạy nhóm task "data" của pipeline (nhận cùng tham số dòng lệnh với pipeline.py).
+    """
+    from pipeline import main as run_pipeline
+
+    run_pipeline(argv, default_targets=("data",))
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# BỘ TẢI DỮ LIỆU CafeF SONG SONG
+# - Một requests.Session dùng chung (connection pool)
+# - Nhiều mã tải đồng thời qua ThreadPoolExecutor
+# - Token bucket thay cho time.sleep(0.5) cố định
+# - Retry + backoff riêng cho từng mã (tiếp tục từ trang lỗi), mỗi trang lấy một token
+# - Mỗi lần gọi API được đo (thời gian, số byte, số dòng) theo mã, xem metrics.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import stage
+
+# Đặt biến môi trường CAFEF_URL để trỏ sang mock server (mock_cafef.py)
+CAFEF_URL = os.environ.get(
+    "CAFEF_URL", "https://s.cafef.vn/Ajax/PageNew/DataHistory/PriceHistory.ashx"
+)
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Referer": "https://s.cafef.vn/"
+}
+
+
+class RateLimiter:
+    """
+    Token bucket dùng chung giữa các luồng.
+    - rate: số request/giây được phép (tốc độ nạp token)
+    - burst: số token tối đa trong bucket
+    """
+
+    def __init__(self, rate=2.0, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def make_session(pool_size=16):
+    """
+    Tạo requests.Session với connection pool đủ lớn cho số luồng tải.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def fetch_cafef_price(ticker, start_date, end_date, page_index=1, page_size=10000,
+                      session=None, url=CAFEF_URL):
+    """
+    Lấy dữ liệu giá CafeF.
+    start_date, end_date dạng DD/MM/YYYY.
+    - Trả về None nếu JSON lỗi hoặc không có Data.Data
+    - Trả về DataFrame rỗng nếu không có phiên nào trong khoảng ngày
+    - Raise requests.HTTPError nếu server trả mã lỗi HTTP
+    """
+    params = {
+        "Symbol": ticker,
+        "StartDate": start_date,
+        "EndDate": end_date,
+        "PageIndex": page_index,
+        "PageSize": page_size
+    }
+
+    http = session if session is not None else requests
+    with stage("fetch_cafef_price", ticker=ticker) as rec:
+        resp = http.get(url, params=params, headers=HEADERS, timeout=20)
+        resp.raise_for_status()
+        rec.bytes_read = len(resp.content)
+
+        try:
+            data = resp.json()
+        except ValueError:
+            print(f"[ERROR] JSON parse lỗi cho {ticker}")
+            return None
+
+        # Lấy danh sách row
+        if "Data" in data and isinstance(data["Data"], dict) and "Data" in data["Data"]:
+            rows = data["Data"]["Data"] or []
+        else:
+            print(f"[WARN] Không tìm thấy Data.Data cho {ticker}. Kiểm tra JSON raw.")
+            return None
+
+        # Chuyển sang DataFrame
+        df = pd.DataFrame(rows)
+        if not df.empty:
+            df["symbol"] = ticker
+        rec.rows_out = len(df)
+
+    return df
+
+
+def fetch_cafef_history(ticker, start_date, end_date, page_size=10000, session=None,
+                        url=CAFEF_URL, limiter=None, pages=None):
+    """
+    Lấy toàn bộ lịch sử trong khoảng ngày, lật trang bằng PageIndex
+    cho tới khi trang trả về ít hơn page_size dòng.
+    - limiter: mỗi trang lấy một token trước khi gọi API
+    - pages: list các trang đã tải (của lần thử trước) → tiếp tục từ trang kế tiếp;
+      trang tải thành công được thêm vào list này
+    Trả về None nếu có trang lỗi.
+    """
+    pages = [] if pages is None else pages
+    while not pages or len(pages[-1]) == page_size:
+        if limiter is not None:
+            limiter.acquire()
+        df = fetch_cafef_price(ticker, start_date, end_date, page_index=len(pages) + 1,
+                               page_size=page_size, session=session, url=url)
+        if df is None:
+            return None
+        pages.append(df)
+
+    return pd.concat(pages, ignore_index=True) if len(pages) > 1 else pages[0]
+
+
+def fetch_with_retry(ticker, start_date, end_date, session, limiter,
+                     retries=3, backoff=1.0, url=CAFEF_URL, page_size=10000):
+    """
+    Tải một mã, thử lại tối đa `retries` lần với backoff luỹ thừa
+    (backoff, 2*backoff, 4*backoff, ...). Mỗi trang đều lấy token từ limiter;
+    lần thử lại tiếp tục từ trang lỗi, không tải lại các trang đã có.
+    Trả về None nếu vẫn thất bại.
+    """
+    last_error = None
+    pages = []
+    for attempt in range(retries + 1):
+        try:
+            df = fetch_cafef_history(ticker, start_date, end_date, page_size=page_size,
+                                     session=session, url=url, limiter=limiter, pages=pages)
+            if df is not None:
+                return df
+            last_error = "invalid response"
+        except requests.RequestException as e:
+            last_error = str(e)
+
+        if attempt < retries:
+            time.sleep(backoff * (2 ** attempt))
+
+    print(f"[WARN] {ticker}: thất bại sau {retries + 1} lần ({last_error})")
+    return None
+
+
+def fetch_many(tickers, start_date, end_date, max_workers=8, rate=4.0, burst=None,
+               retries=3, backoff=1.0, url=CAFEF_URL, page_size=10000, session=None):
+    """
+    Tải nhiều mã đồng thời.
+    start_date có thể là một chuỗi DD/MM/YYYY chung hoặc dict ticker -> ngày bắt đầu
+    (dùng cho chế độ cập nhật gia tăng).
+    Trả về (data, failed):
+    - data: dict ticker -> DataFrame (có thể rỗng nếu không có phiên mới)
+    - failed: list các mã thất bại sau khi đã retry
+    Một mã lỗi không làm dừng các mã còn lại.
+    """
+    starts = start_date if isinstance(start_date, dict) else {}
+    limiter = RateLimiter(rate, burst)
+    own_session = session is None
+    if own_session:
+        session = make_session(pool_size=max_workers)
+
+    data, failed = {}, []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(fetch_with_retry, t, starts[t] if starts else start_date, end_date,
+                            session, limiter, retries, backoff, url, page_size): t
+                for t in tickers
+            }
+            for fut in as_completed(futures):
+                ticker = futures[fut]
+                df = fut.result()
+                if df is None:
+                    failed.append(ticker)
+                else:
+                    data[ticker] = df
+                    print(f"✓ {ticker} thành công ({len(df)} dòng)")
+    finally:
+        if own_session:
+            session.close()
+
+    # Giữ thứ tự danh sách mã ban đầu
+    data = {t: data[t] for t in tickers if t in data}
+    failed = [t for t in tickers if t in failed]
+    return data, failed
@@ -0,0 +1,303 @@
+# DỰ BÁO ARIMA CHO NHIỀU MÃ SONG SONG
+# Tổng quát hóa pipeline VJC của analysis.py cho mọi mã (hoặc tập con):
+#   lợi suất ngày (Business-Day, ffill) → ADF → auto_arima → dự báo lợi suất & giá
+# - Dùng luôn mô hình auto_arima đã fit để dự báo (không fit lại ARIMA lần hai)
+# - Mỗi mã chạy trong một process riêng (ProcessPoolExecutor), lỗi của mã nào chỉ ảnh hưởng mã đó
+# - Kết quả gộp thành một bảng dự báo và một bảng tóm tắt mô hình
+# - Cache order (p,d,q) + tham số đã fit: ngày thường chỉ fit lại warm-start,
+#   chỉ chạy lại auto_arima khi cache quá hạn, dữ liệu cũ thay đổi hoặc kiểm định drift thất bại
+# - pmdarima / statsmodels chỉ được import khi thật sự fit (import module này không tốn vài giây)
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import traceback
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from metrics import collect, merge, stage
+
+ARIMA_PARAMS = {
+    "seasonal": False,
+    "max_p": 5,
+    "max_q": 5,
+    "max_d": 2,
+    "error_action": "ignore",
+    "suppress_warnings": True
+}
+
+
+def prepare_returns(price):
+    """
+    Giá đóng cửa → lợi suất ngày theo tần suất Business-Day (ffill ngày nghỉ).
+    """
+    # Một chuỗi / mã: nâng lên float64 (giá có thể là float32 của compact panel, xem panel.py)
+    price = price.dropna().sort_index().astype("f8")
+    ret = price.pct_change().dropna()
+    return price, ret.asfreq("B").ffill()
+
+
+def fingerprint(ret):
+    """
+    Dấu vân tay của chuỗi lợi suất (ngày + giá trị) để phát hiện lịch sử bị sửa.
+    """
+    h = hashlib.sha1(ret.index.asi8.tobytes())
+    h.update(np.ascontiguousarray(ret.to_numpy(dtype="f8")).tobytes())
+    return h.hexdigest()
+
+
+class ArimaCache:
+    """
+    Cache order và tham số ARIMA theo mã, lưu JSON.
+    Mỗi entry: order, with_intercept, params, first_date, last_date, n_obs,
+    fingerprint (của đoạn dữ liệu đã fit), searched_on (ngày chạy auto_arima).
+    Chính sách làm mới (xem cache_decision):
+    - max_age_days: quá số ngày này kể từ lần search → chạy lại auto_arima
+    - drift_pvalue: trung bình phần dư của các quan sát mới lệch khỏi 0 → chạy lại auto_arima
+    """
+
+    def __init__(self, path="cache/arima_orders.json", max_age_days=7, drift_pvalue=0.01):
+        self.path = path
+        self.max_age_days = max_age_days
+        self.drift_pvalue = drift_pvalue
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as fh:
+                self.entries = json.load(fh)
+
+    def get(self, ticker):
+        return self.entries.get(ticker)
+
+    def put(self, ticker, entry):
+        self.entries[ticker] = entry
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump(self.entries, fh, indent=1)
+        os.replace(tmp, self.path)
+
+
+def cache_decision(entry, ret, max_age_days=7, today=None):
+    """
+    Quyết định dùng cache hay chạy lại auto_arima (trước khi fit):
+    "miss" (chưa có), "stale" (quá hạn), "changed" (dữ liệu cũ bị sửa), "hit" (dùng được).
+    """
+    if entry is None:
+        return "miss"
+    today = today or date.today()
+    if (today - date.fromisoformat(entry["searched_on"])).days >= max_age_days:
+        return "stale"
+    old = ret.loc[entry["first_date"]:entry["last_date"]]
+    if len(old) != entry["n_obs"] or fingerprint(old) != entry["fingerprint"]:
+        return "changed"
+    return "hit"
+
+
+def drift_detected(model, n_new, pvalue=0.01):
+    """
+    Kiểm định drift của trung bình có điều kiện trên n_new quan sát mới nhất:
+    nếu mô hình cũ còn đúng, trung bình phần dư ~ N(0, sigma²/n_new).
+    p-value hai phía < ngưỡng → coi là drift.
+    """
+    if n_new <= 0:
+        return False
+    from scipy import stats
+
+    sigma2 = model.params()[-1]
+    resid = np.asarray(model.resid())[-n_new:]
+    z = resid.mean() / np.sqrt(sigma2 / n_new)
+    return 2 * stats.norm.sf(abs(z)) < pvalue
+
+
+def fit_arima(ret, entry=None, arima_params=None, trace=False, max_age_days=7,
+              drift_pvalue=0.01, today=None):
+    """
+    Fit ARIMA cho chuỗi lợi suất, dùng entry cache nếu còn hợp lệ.
+    Trả về (model, status, new_entry). status ∈ hit / miss / stale / changed / drift / refit_failed
+    (refit warm-start lỗi, vd. LinAlgError / tham số khởi tạo không dừng → tìm lại bằng auto_arima).
+    """
+    from pmdarima import auto_arima
+    from pmdarima.arima import ARIMA
+
+    status = cache_decision(entry, ret, max_age_days, today)
+
+    model = None
+    if status == "hit":
+        # Warm-start: giữ order, khởi tạo tối ưu từ tham số đã fit
+        try:
+            model = ARIMA(order=tuple(entry["order"]), with_intercept=entry["with_intercept"],
+                          start_params=np.asarray(entry["params"]), suppress_warnings=True)
+            model.fit(ret)
+            if not np.isfinite(model.params()).all():
+                raise ValueError("tham số không hữu hạn")
+            n_new = len(ret.loc[ret.index > pd.Timestamp(entry["last_date"])])
+            drift = drift_detected(model, n_new, drift_pvalue)
+        except Exception as e:
+            print(f"[WARN] Refit ARIMA warm-start lỗi ({type(e).__name__}: {e}) → auto_arima")
+            status, model = "refit_failed", None
+        else:
+            if drift:
+                status, model = "drift", None
+
+    searched_on = entry["searched_on"] if model is not None else (today or date.today()).isoformat()
+    if model is None:
+        params = dict(ARIMA_PARAMS, **(arima_params or {}))
+        model = auto_arima(ret, trace=trace, **params)
+
+    new_entry = {
+        "order": list(model.order),
+        "with_intercept": bool(model.with_intercept),
+        "params": [float(p) for p in model.params()],
+        "first_date": ret.index[0].strftime("%Y-%m-%d"),
+        "last_date": ret.index[-1].strftime("%Y-%m-%d"),
+        "n_obs": len(ret),
+        "fingerprint": fingerprint(ret),
+        "searched_on": searched_on
+    }
+    return model, status, new_entry
+
+
+def forecast_ticker(ticker, price, steps=30, alpha=0.05, trace=False, arima_params=None,
+                    cache_entry=None, max_age_days=7, drift_pvalue=0.01):
+    """
+    Chạy toàn bộ pipeline ARIMA cho một mã.
+    Trả về dict:
+    - summary: ticker, ADF, order, AIC, số quan sát, trạng thái cache
+    - forecast: DataFrame (forecast_return, lower_ci, upper_ci, price_forecast) theo ngày BD
+    - model: mô hình pmdarima đã fit
+    - cache_entry: entry mới để lưu vào ArimaCache
+    """
+    from statsmodels.tsa.stattools import adfuller
+
+    price, ret = prepare_returns(price)
+
+    adf_result = adfuller(ret)
+
+    with stage("arima_fit", ticker=ticker) as rec:
+        rec.rows_in = len(ret)
+        model, cache_status, new_entry = fit_arima(ret, cache_entry, arima_params, trace,
+                                                   max_age_days, drift_pvalue)
+
+    # Dự báo trực tiếp từ mô hình đã fit (không fit lại lần hai)
+    mean, conf = model.predict(n_periods=steps, return_conf_int=True, alpha=alpha)
+
+    forecast_index = pd.date_range(
+        start=ret.index[-1] + pd.Timedelta(days=1),
+        periods=steps,
+        freq="B"
+    )
+    mean = np.asarray(mean)
+    conf = np.asarray(conf)
+    fc = pd.DataFrame({
+        "forecast_return": mean,
+        "lower_ci": conf[:, 0],
+        "upper_ci": conf[:, 1],
+        "price_forecast": price.iloc[-1] * np.cumprod(1 + mean)
+    }, index=forecast_index)
+
+    summary = {
+        "ticker": ticker,
+        "status": "ok",
+        "order": str(model.order),
+        "aic": model.aic(),
+        "adf_stat": adf_result[0],
+        "adf_pvalue": adf_result[1],
+        "n_obs": len(ret),
+        "last_date": ret.index[-1],
+        "cache": cache_status,
+        "error": ""
+    }
+    return {"summary": summary, "forecast": fc, "model": model, "cache_entry": new_entry}
+
+
+def _forecast_job(ticker, price, steps, alpha, arima_params, cache_entry, max_age_days, drift_pvalue):
+    # Chạy trong worker: bắt mọi lỗi để không làm hỏng cả lô; không gửi model về (đỡ pickle).
+    # Bản ghi đo của worker được gửi kèm kết quả (xem metrics.collect).
+    with collect() as records:
+        try:
+            res = forecast_ticker(ticker, price, steps=steps, alpha=alpha, arima_params=arima_params,
+                                  cache_entry=cache_entry, max_age_days=max_age_days,
+                                  drift_pvalue=drift_pvalue)
+            res.pop("model")
+        except Exception as e:
+            res = {
+                "summary": {"ticker": ticker, "status": "error", "error": f"{type(e).__name__}: {e}"},
+                "forecast": None,
+                "cache_entry": None,
+                "traceback": traceback.format_exc()
+            }
+    res["metrics"] = records
+    return res
+
+
+def _pool_context():
+    # fork: worker kế thừa các module đã nạp trong process chính, không phải import lại
+    methods = mp.get_all_start_methods()
+    return mp.get_context("fork") if "fork" in methods else None
+
+
+def forecast_many(pivot_close, tickers=None, steps=30, alpha=0.05, max_workers=None, arima_params=None,
+                  cache=None):
+    """
+    Dự báo ARIMA cho nhiều mã trên process pool.
+    cache: ArimaCache (tùy chọn) — entry được gửi cho worker, entry mới được lưu lại sau khi chạy.
+    Trả về (forecasts, summary):
+    - forecasts: dict ticker -> DataFrame dự báo (chỉ các mã thành công)
+    - summary: DataFrame một dòng / mã (order, AIC, ADF, trạng thái, lỗi)
+    """
+    tickers = list(pivot_close.columns) if tickers is None else list(tickers)
+    forecasts, rows = {}, []
+
+    # Nạp pmdarima / statsmodels một lần trước khi fork → các worker không phải import lại
+    import pmdarima.arima
+    import statsmodels.tsa.stattools
+
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context()) as pool:
+        futures = {
+            pool.submit(_forecast_job, t, pivot_close[t], steps, alpha, arima_params,
+                        cache.get(t) if cache else None,
+                        cache.max_age_days if cache else 7,
+                        cache.drift_pvalue if cache else 0.01): t
+            for t in tickers
+        }
+        for fut in as_completed(futures):
+            ticker = futures[fut]
+            try:
+                res = fut.result()
+            except Exception as e:
+                # Worker chết hẳn (vd. hết bộ nhớ) → vẫn chỉ đánh dấu lỗi mã này
+                res = {"summary": {"ticker": ticker, "status": "error", "error": repr(e)},
+                       "forecast": None, "cache_entry": None}
+
+            merge(res.get("metrics"))
+            rows.append(res["summary"])
+            if res["forecast"] is not None:
+                forecasts[ticker] = res["forecast"]
+                if cache is not None:
+                    cache.put(ticker, res["cache_entry"])
+                print(f"✓ ARIMA {ticker}: {res['summary']['order']} (cache: {res['summary']['cache']})")
+            else:
+                print(f"✗ ARIMA {ticker}: {res['summary']['error']}")
+
+    if cache is not None:
+        cache.save()
+
+    summary = pd.DataFrame(rows).set_index("ticker").reindex(tickers).reset_index()
+    forecasts = {t: forecasts[t] for t in tickers if t in forecasts}
+    return forecasts, summary
+
+
+def forecast_table(forecasts):
+    """
+    Gộp dict ticker -> DataFrame dự báo thành một bảng dạng long (ticker, date, ...).
+    """
+    if not forecasts:
+        return pd.DataFrame(columns=["ticker", "date", "forecast_return", "lower_ci",
+                                     "upper_ci", "price_forecast"])
+    table = pd.concat(forecasts, names=["ticker", "date"])
+    return table.reset_index()
@@ -0,0 +1,363 @@
+# MÔ HÌNH BIẾN ĐỘNG GARCH(1,1) / GJR-GARCH CHO MỌI MÃ
+#   r_t = mu + e_t,  sigma²_t = omega + (alpha + gamma·1[e_{t-1} < 0])·e²_{t-1} + beta·sigma²_{t-1}
+# (GARCH(1,1): gamma = 0). Phân phối chuẩn, lợi suất được nhân 100 (đơn vị %) khi fit.
+# - Với tham số cố định, đệ quy phương sai (và đạo hàm của nó) là bộ lọc tuyến tính theo beta
+#   → log-likelihood + gradient giải tích tính trên cả chuỗi bằng scipy.signal.lfilter (C),
+#   mảng T × mã, không vòng lặp Python theo thời gian; tối ưu SLSQP riêng từng mã với ràng buộc dừng
+#   alpha + gamma/2 + beta < 1 (mã không fit được → phương sai mẫu, fit_ok = False)
+# - Warm start từ tham số của lần fit trước (GarchCache, JSON) → refresh hằng ngày chỉ vài vòng lặp
+# - Chia mã thành các lô cho process pool
+# - Dự báo biến động có điều kiện → hiệp phương sai cho VaR (risk.py) và dải tin cậy cho dự báo ARIMA
+import json
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+PARAM_NAMES = ["mu", "omega", "alpha", "gamma", "beta"]
+SCALE = 100.0
+MAX_PERSISTENCE = 0.9999   # ràng buộc dừng: alpha + gamma/2 + beta <= MAX_PERSISTENCE
+
+
+class GarchCache:
+    """
+    Tham số GARCH đã fit theo mã, lưu JSON (mỗi entry: model, params, last_date, n_obs).
+    """
+
+    def __init__(self, path="cache/garch_params.json"):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as fh:
+                self.entries = json.load(fh)
+
+    def get(self, ticker, model=None):
+        entry = self.entries.get(ticker)
+        if entry is None or (model is not None and entry["model"] != model):
+            return None
+        return entry
+
+    def put(self, ticker, entry):
+        self.entries[ticker] = entry
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump(self.entries, fh, indent=1)
+        os.replace(tmp, self.path)
+
+
+# ----------------- LIKELIHOOD VECTOR HÓA -----------------
+def _recursion(x, beta):
+    # y_t = x_t + beta_j·y_{t-1} dọc trục thời gian cho từng mã j (bộ lọc IIR bậc 1, chạy trong C)
+    from scipy.signal import lfilter
+
+    out = np.empty_like(x)
+    for j in range(x.shape[1]):
+        out[:, j] = lfilter([1.0], [1.0, -beta[j]], x[:, j], axis=0)
+    return out
+
+
+def garch_filter(theta, r, mask, s2):
+    """
+    Lọc phương sai có điều kiện cho N mã cùng lúc.
+    - theta: N × 5 (mu, omega, alpha, gamma, beta); r, mask: T × N; s2: phương sai khởi tạo (N,)
+    Ngày thiếu dữ liệu (mask = False): e = 0 và không tính vào likelihood.
+    Với theta cố định, e không phụ thuộc sigma² nên đệ quy là bộ lọc tuyến tính theo beta:
+    sigma²_t = c_t + beta·sigma²_{t-1}, c_t = omega + (alpha + gamma·1[e_{t-1} < 0])·e²_{t-1}.
+    Trả về (sigma2 T × N, e T × N).
+    """
+    mu, omega, alpha, gamma, beta = theta.T
+    e = np.where(mask, r - mu, 0.0)
+    c = np.empty_like(e)
+    c[0] = s2
+    e_prev = e[:-1]
+    c[1:] = omega + (alpha + gamma * (e_prev < 0)) * e_prev ** 2
+    return _recursion(c, beta), e
+
+
+def garch_nll_grad(theta, r, mask, s2):
+    """
+    Negative log-likelihood (N,) và gradient giải tích (N × 5) theo tham số của từng mã.
+    dsigma²_t/dtheta thỏa cùng đệ quy với sigma² (hệ số beta) nên cũng tính bằng bộ lọc tuyến tính.
+    """
+    mu, omega, alpha, gamma, beta = theta.T
+    T, N = r.shape
+    m = mask.astype("f8")
+    sigma2, e = garch_filter(theta, r, mask, s2)
+
+    # Đầu vào của đệ quy đạo hàm (t ≥ 1, tại t = 0 bằng 0): T × N × 5
+    e_prev = e[:-1]
+    neg = (e_prev < 0).astype("f8")
+    e2 = e_prev ** 2
+    X = np.zeros((T, N, 5))
+    X[1:, :, 0] = -2 * (alpha + gamma * neg) * e_prev * m[:-1]
+    X[1:, :, 1] = 1.0
+    X[1:, :, 2] = e2
+    X[1:, :, 3] = neg * e2
+    X[1:, :, 4] = sigma2[:-1]
+    D = _recursion(X, beta)
+
+    ratio = e ** 2 / sigma2
+    nll = 0.5 * (m * (np.log(2 * np.pi) + np.log(sigma2) + ratio)).sum(axis=0)
+    dsig = 0.5 * m * (1 - ratio) / sigma2
+    grad = np.einsum("tn,tnk->nk", dsig, D)
+    grad[:, 0] -= (m * e / sigma2).sum(axis=0)
+    return nll, grad
+
+
+def _moments(r, mask):
+    n = mask.sum(axis=0)
+    mean = np.where(mask, r, 0).sum(axis=0) / n
+    return mean, np.where(mask, (r - mean) ** 2, 0).sum(axis=0) / n
+
+
+def _initial_variance(r, mask):
+    # sigma²_0 = phương sai mẫu (cố định, không phụ thuộc tham số)
+    return _moments(r, mask)[1]
+
+
+def _grid_start(r, mask, s2, model):
+    """
+    Điểm khởi tạo cho mã chưa có tham số cũ (likelihood GARCH có thể nhiều cực trị):
+    lưới (alpha, gamma, persistence), omega khớp phương sai mẫu; mọi điểm lưới được đánh giá
+    trong một lần gọi NLL vector hóa, chọn điểm tốt nhất.
+    """
+    mean, var = _moments(r, mask)
+    gammas = (0.0, 0.1, 0.3) if model == "gjr" else (0.0,)
+    grid = np.array([(a, g, a + g / 2 + b) for a in (0.02, 0.05, 0.1, 0.2) for g in gammas
+                     for b in (0.0, 0.5, 0.8, 0.9, 0.97)])
+    G = len(grid)
+    theta = np.column_stack([np.full(G, mean[0]), var[0] * (1 - np.minimum(grid[:, 2], 0.999)),
+                             grid[:, 0], grid[:, 1], grid[:, 2] - grid[:, 0] - grid[:, 1] / 2])
+    theta = theta[(theta[:, 4] >= 0) & (grid[:, 2] < 1)]
+    nll, _ = garch_nll_grad(theta, np.repeat(r, len(theta), axis=1), np.repeat(mask, len(theta), axis=1),
+                            np.repeat(s2, len(theta)))
+    return theta[np.nanargmin(nll)]
+
+
+def _stationary_start(x, limit):
+    # Điểm khởi tạo thỏa alpha + gamma/2 + beta <= limit (tham số cũ trong cache có thể vượt)
+    x = x.copy()
+    p = x[2] + x[3] / 2 + x[4]
+    if p > limit:
+        x[2:5] *= limit / p
+    return x
+
+
+def _fit_block(r, mask, x0, model="gjr", maxiter=500):
+    """
+    Fit một lô mã (x0: dòng NaN = khởi tạo theo lưới): mỗi mã một bài SLSQP riêng (hội tụ độc lập, warm start có tác dụng
+    từng mã), likelihood + gradient giải tích tính bằng bộ lọc tuyến tính trên cả chuỗi.
+    Ràng buộc dừng: alpha + gamma/2 + beta <= MAX_PERSISTENCE. Mã không fit được (solver báo lỗi / NLL
+    không hữu hạn) → mô hình phương sai không đổi (phương sai mẫu), ok = False.
+    Trả về (theta N × 5, nll (N,), ok (N,), tổng số lần đánh giá hàm).
+    """
+    N = r.shape[1]
+    s2 = _initial_variance(r, mask)
+    gamma_hi = 1.0 if model == "gjr" else 0.0
+    from scipy.optimize import minimize
+
+    lo = np.array([-np.inf, 1e-8, 0.0, 0.0, 0.0])
+    hi = np.array([np.inf, np.inf, 1.0, gamma_hi, 1.0])
+    bounds = [(None if np.isinf(a) else a, None if np.isinf(b) else b) for a, b in zip(lo, hi)]
+    weights = np.array([0.0, 0.0, 1.0, 0.5, 1.0])
+    stationary = {"type": "ineq", "fun": lambda x: MAX_PERSISTENCE - weights @ x, "jac": lambda x: -weights}
+
+    x0 = np.asarray(x0, dtype="f8")
+    theta = np.empty((N, 5))
+    nll = np.empty(N)
+    ok = np.ones(N, dtype=bool)
+    nfev = 0
+    for j in range(N):
+        rj, mj, s2j = r[:, [j]], mask[:, [j]], s2[[j]]
+        scale = 1.0 / max(1, mj.sum())
+
+        def objective(x):
+            nl, g = garch_nll_grad(x[None, :], rj, mj, s2j)
+            return nl[0] * scale, g[0] * scale
+
+        start = x0[j] if np.isfinite(x0[j]).all() else _grid_start(rj, mj, s2j, model)
+        start = _stationary_start(np.clip(start, lo, hi), MAX_PERSISTENCE)
+        with np.errstate(all="ignore"):
+            res = minimize(objective, start, jac=True, method="SLSQP", bounds=bounds,
+                           constraints=[stationary], options={"maxiter": maxiter, "ftol": 1e-12})
+        nfev += res.nfev
+        if res.success and np.isfinite(res.fun) and weights @ res.x <= MAX_PERSISTENCE + 1e-9:
+            theta[j] = res.x
+            nll[j] = res.fun / scale
+        else:
+            theta[j], nll[j] = _constant_variance(rj, mj, s2j)
+            ok[j] = False
+    return theta, nll, ok, nfev
+
+
+def _constant_variance(r, mask, s2):
+    # Dự phòng khi fit thất bại: sigma² = phương sai mẫu (omega = s2, alpha = gamma = beta = 0)
+    theta = np.array([_moments(r, mask)[0][0], s2[0], 0.0, 0.0, 0.0])
+    nll, _ = garch_nll_grad(theta[None, :], r, mask, s2)
+    return theta, nll[0]
+
+
+def check_gradient(theta, r, mask, s2=None, eps=1e-6):
+    """
+    Kiểm tra gradient giải tích của garch_nll_grad bằng sai phân trung tâm.
+    theta: N × 5; r, mask: T × N. Trả về sai số tương đối lớn nhất (N,).
+    """
+    theta = np.asarray(theta, dtype="f8")
+    s2 = _initial_variance(r, mask) if s2 is None else s2
+    _, grad = garch_nll_grad(theta, r, mask, s2)
+    num = np.empty_like(grad)
+    for k in range(theta.shape[1]):
+        step = eps * np.maximum(1.0, np.abs(theta[:, k]))
+        up, down = theta.copy(), theta.copy()
+        up[:, k] += step
+        down[:, k] -= step
+        num[:, k] = (garch_nll_grad(up, r, mask, s2)[0] - garch_nll_grad(down, r, mask, s2)[0]) / (2 * step)
+    return (np.abs(grad - num) / np.maximum(1.0, np.abs(num))).max(axis=1)
+
+
+def _pool_context():
+    methods = mp.get_all_start_methods()
+    return mp.get_context("fork") if "fork" in methods else None
+
+
+# ----------------- FIT & DỰ BÁO -----------------
+def forecast_variance(theta, sigma2_last, e_last, steps):
+    """
+    Dự báo phương sai có điều kiện 1..steps bước (N mã): sigma²_{T+h}, đơn vị đã scale.
+    """
+    mu, omega, alpha, gamma, beta = theta.T
+    persistence = alpha + gamma / 2 + beta
+    out = np.empty((steps, len(theta)))
+    out[0] = omega + (alpha + gamma * (e_last < 0)) * e_last ** 2 + beta * sigma2_last
+    for h in range(1, steps):
+        out[h] = omega + persistence * out[h - 1]
+    return out
+
+
+def fit_many(returns, model="gjr", steps=30, cache=None, max_workers=None, maxiter=500):
+    """
+    Fit GARCH(1,1) (model="garch") hoặc GJR-GARCH (model="gjr") cho mọi cột của returns (date × mã).
+    cache: GarchCache (tùy chọn) — tham số cũ làm điểm khởi tạo, tham số mới được lưu lại.
+    max_workers > 1: chia mã thành các lô cho process pool.
+    Trả về dict:
+    - params: DataFrame một dòng / mã (tham số, persistence, biến động dài hạn năm, NLL, warm start,
+      fit_ok = False nếu fit thất bại và dùng phương sai mẫu)
+    - sigma: biến động có điều kiện trong mẫu (date × mã, đơn vị lợi suất)
+    - std_resid: phần dư chuẩn hóa (date × mã)
+    - forecast: biến động dự báo 1..steps ngày tới (bước × mã, đơn vị lợi suất)
+    """
+    tickers = list(returns.columns)
+    r = returns.to_numpy(dtype="f8") * SCALE
+    mask = np.isfinite(r)
+    r = np.where(mask, r, 0.0)
+
+    x0 = np.full((len(tickers), 5), np.nan)     # NaN = chưa có tham số cũ → khởi tạo theo lưới
+    warm = np.zeros(len(tickers), dtype=bool)
+    if cache is not None:
+        for i, t in enumerate(tickers):
+            entry = cache.get(t, model)
+            if entry is not None:
+                x0[i] = entry["params"]
+                warm[i] = True
+
+    # Mỗi worker một lô mã (xen kẽ để chia đều mã warm / cold)
+    n_blocks = max(1, min(max_workers or 1, len(tickers)))
+    blocks = [np.arange(i, len(tickers), n_blocks) for i in range(n_blocks)]
+
+    theta = np.empty((len(tickers), 5))
+    nll = np.empty(len(tickers))
+    ok = np.empty(len(tickers), dtype=bool)
+    args = [(r[:, b], mask[:, b], x0[b], model, maxiter) for b in blocks]
+    if max_workers and max_workers > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context()) as pool:
+            results = list(pool.map(_fit_block, *zip(*args)))
+    else:
+        results = [_fit_block(*a) for a in args]
+    for b, (th, nl, fit_ok, _) in zip(blocks, results):
+        theta[b], nll[b], ok[b] = th, nl, fit_ok
+
+    n = mask.sum(axis=0)
+    sigma2, e = garch_filter(theta, r, mask, _initial_variance(r, mask))
+    fc_var = forecast_variance(theta, sigma2[-1], e[-1], steps)
+
+    persistence = theta[:, 2] + theta[:, 3] / 2 + theta[:, 4]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        long_run = np.where(persistence < 1, theta[:, 1] / (1 - persistence), np.nan)
+    params = pd.DataFrame(theta, columns=PARAM_NAMES, index=pd.Index(tickers, name="ticker"))
+    params["mu"] /= SCALE
+    params["omega"] /= SCALE ** 2
+    params["persistence"] = persistence
+    params["long_run_vol"] = np.sqrt(long_run * 252) / SCALE
+    params["nll"] = nll
+    params["n_obs"] = n
+    params["warm_start"] = warm
+    params["fit_ok"] = ok
+    params["model"] = model
+
+    if cache is not None:
+        last_date = returns.index[-1].strftime("%Y-%m-%d")
+        for i, t in enumerate(tickers):
+            if not ok[i]:
+                # Không lưu tham số dự phòng: lần sau fit lại từ lưới
+                cache.entries.pop(t, None)
+                continue
+            cache.put(t, {"model": model, "params": [float(p) for p in theta[i]],
+                          "last_date": last_date, "n_obs": int(n[i])})
+        cache.save()
+
+    sigma = np.sqrt(sigma2)
+    return {
+        "params": params,
+        "sigma": pd.DataFrame(sigma / SCALE, index=returns.index, columns=tickers),
+        "std_resid": pd.DataFrame(np.where(mask, e / sigma, np.nan), index=returns.index, columns=tickers),
+        "forecast": pd.DataFrame(np.sqrt(fc_var) / SCALE, index=pd.RangeIndex(1, steps + 1, name="step"),
+                                 columns=tickers)
+    }
+
+
+# ----------------- DÙNG DỰ BÁO GARCH Ở NƠI KHÁC -----------------
+def conditional_cov(garch_result, horizon=1, tickers=None):
+    """
+    Hiệp phương sai ngày có điều kiện (CCC): D·C·D với C = tương quan của phần dư chuẩn hóa,
+    D = biến động GARCH dự báo, lấy trung bình phương sai trên `horizon` ngày tới
+    (nhân với sqrt(h) trong risk.py cho đúng phương sai gộp h ngày).
+    """
+    tickers = list(garch_result["forecast"].columns) if tickers is None else list(tickers)
+    var_h = (garch_result["forecast"][tickers].iloc[:horizon] ** 2).mean().to_numpy()
+    corr = garch_result["std_resid"][tickers].corr().to_numpy()
+    vol = np.sqrt(var_h)
+    return corr * np.outer(vol, vol)
+
+
+def volatility_bands(fc, vol, alpha=0.05):
+    """
+    Dải tin cậy cho dự báo lợi suất (DataFrame của forecast.py) theo biến động GARCH từng bước:
+    forecast_return ± z·sigma_{T+h}. Thêm các cột garch_vol, lower_ci_garch, upper_ci_garch.
+    """
+    from scipy import stats
+
+    z = stats.norm.ppf(1 - alpha / 2)
+    vol = np.asarray(vol, dtype="f8")[:len(fc)]
+    out = fc.copy()
+    out["garch_vol"] = vol
+    out["lower_ci_garch"] = out["forecast_return"] - z * vol
+    out["upper_ci_garch"] = out["forecast_return"] + z * vol
+    return out
+
+
+if __name__ == "__main__":
+    # python garch.py: kiểm tra gradient giải tích trên chuỗi giả lập (exit code 1 nếu sai lệch)
+    import sys
+
+    rng = np.random.default_rng(0)
+    r = rng.standard_t(5, size=(1500, 3)) * 1.5
+    mask = rng.random(r.shape) > 0.01
+    theta = np.array([[0.05, 0.1, 0.05, 0.1, 0.85], [-0.02, 0.3, 0.2, 0.0, 0.6], [0.0, 0.05, 0.6, 0.3, 0.5]])
+    err = check_gradient(theta, np.where(mask, r, 0.0), mask)
+    print("Sai số tương đối lớn nhất của gradient:", err)
+    sys.exit(int(err.max() > 1e-5))
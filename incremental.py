@@ -0,0 +1,448 @@
+# CẬP NHẬT GIA TĂNG THEO NGÀY (KHÔNG TÍNH LẠI TOÀN BỘ LỊCH SỬ)
+# analysis.py tính lại pct_change, describe, corr, z-score, CAPM trên toàn bộ lịch sử mỗi lần chạy.
+# Ở đây giữ các thống kê đủ (sufficient statistics) trong một file trạng thái:
+# - Theo cặp mã (N × N): số quan sát chung, tổng, tổng bình phương, tổng tích chéo
+#   → tương quan pairwise giống DataFrame.corr(), cho cả lợi suất và giá đóng cửa
+# - Theo mã: min / max, số ngày ngoại lai |z| > ngưỡng (z tính theo thống kê đến NGÀY TRƯỚC)
+# - Tổng hồi quy CAPM ngày và tháng (tháng được chốt khi sang tháng mới, tháng đang chạy
+#   được cộng tạm khi báo cáo, giống resample("ME").last() của analysis.py)
+# Mỗi ngày mới: O(N²); khởi tạo từ lịch sử: phép nhân ma trận O(T·N²) một lần.
+# Chạy trong phiên: load → update → báo cáo (không save); cuối ngày: update → save.
+# Giá điều chỉnh theo sự kiện doanh nghiệp như analysis.load_prices (adjust.py); sự kiện mới đổi hệ số
+# của cả lịch sử → trạng thái được khởi tạo lại từ kho (dấu vân tay bảng sự kiện lưu trong trạng thái).
+#
+#   python incremental.py --store store --state cache/incremental_state.npz
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from adjust import adjusted_frame
+from capm import CAPM_COLUMNS, capm_from_moments
+
+
+class PairMoments:
+    """
+    Thống kê đủ theo cặp cột trên các quan sát cùng có dữ liệu (NaN bị bỏ theo cặp).
+    n[i, j]: số quan sát chung; s[i, j]: tổng x_i; q[i, j]: tổng x_i²; p[i, j]: tổng x_i·x_j.
+    Giá trị được trừ `shift` (trung bình lúc khởi tạo) trước khi cộng dồn để giảm sai số triệt tiêu.
+    """
+    FIELDS = ("shift", "n", "s", "q", "p", "min", "max")
+
+    def __init__(self, n_cols, shift=None):
+        self.shift = np.zeros(n_cols) if shift is None else np.nan_to_num(np.asarray(shift, dtype="f8"))
+        self.n = np.zeros((n_cols, n_cols))
+        self.s = np.zeros((n_cols, n_cols))
+        self.q = np.zeros((n_cols, n_cols))
+        self.p = np.zeros((n_cols, n_cols))
+        self.min = np.full(n_cols, np.inf)
+        self.max = np.full(n_cols, -np.inf)
+
+    def update(self, X):
+        """
+        Cộng thêm các dòng X (K × N); K = 1 cho một ngày → O(N²).
+        """
+        X = np.atleast_2d(np.asarray(X, dtype="f8"))
+        if not len(X):
+            return
+        valid = np.isfinite(X)
+        V = valid.astype("f8")
+        Xc = np.where(valid, X - self.shift, 0.0)
+        self.n += V.T @ V
+        self.s += Xc.T @ V
+        self.q += (Xc * Xc).T @ V
+        self.p += Xc.T @ Xc
+        self.min = np.minimum(self.min, np.where(valid, X, np.inf).min(axis=0))
+        self.max = np.maximum(self.max, np.where(valid, X, -np.inf).max(axis=0))
+
+    def count(self):
+        return np.diag(self.n).copy()
+
+    def mean(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.diag(self.s) / np.diag(self.n) + self.shift
+
+    def std(self):
+        n, s, q = np.diag(self.n), np.diag(self.s), np.diag(self.q)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(np.maximum(q - s * s / n, 0) / (n - 1))
+
+    def cov(self, ddof=1):
+        """
+        Hiệp phương sai pairwise (giống DataFrame.cov()).
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (self.p - self.s * self.s.T / self.n) / (self.n - ddof)
+
+    def corr(self):
+        """
+        Tương quan Pearson pairwise (giống DataFrame.corr()).
+        """
+        n, s = self.n, self.s
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = self.p - s * s.T / n
+            var = np.maximum(self.q - s * s / n, 0)
+            return cov / np.sqrt(var * var.T)
+
+    def to_arrays(self, prefix):
+        return {f"{prefix}.{f}": getattr(self, f) for f in self.FIELDS}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        obj = cls.__new__(cls)
+        for f in cls.FIELDS:
+            setattr(obj, f, np.array(arrays[f"{prefix}.{f}"]))
+        return obj
+
+
+class RegressionSums:
+    """
+    Tổng đủ cho hồi quy y_j = alpha_j + beta_j·x (x dùng chung, NaN bị bỏ theo từng mã).
+    """
+    FIELDS = ("x_shift", "y_shift", "n", "sx", "sy", "sxx", "syy", "sxy")
+
+    def __init__(self, n_cols, x_shift=0.0, y_shift=None):
+        self.x_shift = np.asarray(np.nan_to_num(x_shift), dtype="f8")
+        self.y_shift = np.zeros(n_cols) if y_shift is None else np.nan_to_num(np.asarray(y_shift, dtype="f8"))
+        for f in self.FIELDS[2:]:
+            setattr(self, f, np.zeros(n_cols))
+
+    def update(self, Y, x):
+        Y = np.atleast_2d(np.asarray(Y, dtype="f8"))
+        x = np.asarray(x, dtype="f8").reshape(-1, 1)
+        if not len(Y):
+            return
+        mask = np.isfinite(Y) & np.isfinite(x)
+        xm = np.where(mask, x - self.x_shift, 0.0)
+        ym = np.where(mask, Y - self.y_shift, 0.0)
+        self.n += mask.sum(axis=0)
+        self.sx += xm.sum(axis=0)
+        self.sy += ym.sum(axis=0)
+        self.sxx += (xm * xm).sum(axis=0)
+        self.syy += (ym * ym).sum(axis=0)
+        self.sxy += (xm * ym).sum(axis=0)
+
+    def copy(self):
+        return RegressionSums.from_arrays(self.to_arrays("r"), "r")
+
+    def results(self):
+        """
+        CAPM từ các tổng (cùng công thức với capm_arrays).
+        """
+        n = self.n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x_mean = self.sx / n
+            y_mean = self.sy / n
+            sxx = self.sxx - self.sx * x_mean
+            syy = self.syy - self.sy * y_mean
+            sxy = self.sxy - self.sx * y_mean
+        return capm_from_moments(n.astype(int), x_mean + self.x_shift, y_mean + self.y_shift, sxx, syy, sxy)
+
+    def to_arrays(self, prefix):
+        return {f"{prefix}.{f}": getattr(self, f) for f in self.FIELDS}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        obj = cls.__new__(cls)
+        for f in cls.FIELDS:
+            setattr(obj, f, np.array(arrays[f"{prefix}.{f}"]))
+        return obj
+
+
+class IncrementalState:
+    """
+    Trạng thái gia tăng cho một rổ mã cố định.
+    - dropna_rows: như returns_daily / returns_monthly của analysis.py (bỏ cả dòng nếu một mã thiếu;
+      mã chưa niêm yết — chưa có giá nào — không tính)
+    - z_threshold, min_obs: ngày ngoại lai khi |z| > z_threshold, chỉ xét khi đã có ≥ min_obs ngày
+    Lãi suất phi rủi ro: lãi suất năm tại ngày giao dịch (ffill); ngày = (1+r)^(1/252)-1,
+    tháng = (1+r)^(1/12)-1 với r tại ngày GIAO DỊCH cuối tháng (analysis.py lấy quan sát rf cuối
+    tháng theo lịch của chuỗi rf, nên CAPM tháng có thể lệch nhẹ ở tháng kết thúc bằng ngày nghỉ).
+    """
+    ARRAYS = ("last_close", "month_prev", "month_last", "outliers")
+    SCALARS = ("last_mkt", "mkt_month_prev", "mkt_month_last", "rf_rate", "rf_month_last")
+
+    def __init__(self, tickers, dropna_rows=True, z_threshold=4.0, min_obs=20,
+                 ret_shift=None, price_shift=None):
+        self.tickers = list(tickers)
+        N = len(self.tickers)
+        self.dropna_rows = dropna_rows
+        self.z_threshold = z_threshold
+        self.min_obs = min_obs
+        self.last_date = None
+        self.month = None
+        self.actions = None
+
+        self.last_close = np.full(N, np.nan)
+        self.month_prev = np.full(N, np.nan)
+        self.month_last = np.full(N, np.nan)
+        self.outliers = np.zeros(N)
+        self.last_mkt = self.mkt_month_prev = self.mkt_month_last = np.nan
+        self.rf_rate = self.rf_month_last = np.nan
+
+        self.ret = PairMoments(N, ret_shift)
+        self.price = PairMoments(N, price_shift)
+        self.capm_d = RegressionSums(N, y_shift=ret_shift)
+        self.capm_m = RegressionSums(N)
+
+    # ----------------- CẬP NHẬT -----------------
+    def update(self, dates, close, mkt, rf_rate):
+        """
+        Thêm K ngày mới (K = 1 trong chế độ hằng ngày):
+        dates (K,), close (K × N, theo thứ tự self.tickers), mkt (K,) giá VNINDEX, rf_rate (K,) lãi suất năm.
+        Ngày phải sau last_date.
+        """
+        dates = pd.DatetimeIndex(np.atleast_1d(dates))
+        close = np.atleast_2d(np.asarray(close, dtype="f8"))
+        mkt = np.atleast_1d(np.asarray(mkt, dtype="f8"))
+        rf_rate = np.atleast_1d(np.asarray(rf_rate, dtype="f8"))
+        if self.last_date is not None and dates[0] <= self.last_date:
+            raise ValueError(f"Ngày {dates[0].date()} không sau ngày cuối của trạng thái {self.last_date.date()}")
+
+        # Lợi suất ngày so với dòng trước (như pct_change(fill_method=None))
+        prev = np.vstack([self.last_close[None, :], close[:-1]])
+        ret = close / prev - 1
+        mret = mkt / np.concatenate([[self.last_mkt], mkt[:-1]]) - 1
+        rows = np.ones(len(ret), dtype=bool)
+        if self.dropna_rows:
+            # Như analysis.member_returns: bỏ ngày có mã đã niêm yết (đã có giá trước đó) thiếu lợi suất;
+            # mã chưa có giá nào không tính
+            seen = np.isfinite(np.vstack([self.last_close[None, :], close[:-1]]))
+            listed = (np.logical_or.accumulate(seen, axis=0) | (np.diag(self.price.n) > 0))
+            valid = np.isfinite(ret)
+            rows = (valid | ~listed).all(axis=1) & valid.any(axis=1)
+        R = ret[rows]
+
+        self._count_outliers(R)
+        self.ret.update(R)
+        self.price.update(close)
+
+        rf_d = (1 + rf_rate[rows]) ** (1 / 252) - 1
+        self.capm_d.update(R - rf_d[:, None], mret[rows] - rf_d)
+
+        self._roll_months(dates, close, mkt, rf_rate)
+
+        self.last_close = close[-1].copy()
+        self.last_mkt = mkt[-1]
+        self.rf_rate = rf_rate[-1]
+        self.last_date = dates[-1]
+        return self
+
+    def _count_outliers(self, R):
+        # z của mỗi ngày theo trung bình / độ lệch chuẩn tính đến ngày trước đó (không look-ahead)
+        if not len(R):
+            return
+        valid = np.isfinite(R)
+        Xc = np.where(valid, R - self.ret.shift, 0.0)
+        n = np.diag(self.ret.n) + np.cumsum(valid, axis=0) - valid
+        s = np.diag(self.ret.s) + np.cumsum(Xc, axis=0) - Xc
+        q = np.diag(self.ret.q) + np.cumsum(Xc * Xc, axis=0) - Xc * Xc
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = s / n
+            std = np.sqrt(np.maximum(q - s * mean, 0) / (n - 1))
+            z = (Xc - mean) / std
+        self.outliers += (valid & (n >= self.min_obs) & (np.abs(z) > self.z_threshold)).sum(axis=0)
+
+    def _month_row(self):
+        r = self.month_last / self.month_prev - 1
+        m = self.mkt_month_last / self.mkt_month_prev - 1
+        rf = (1 + self.rf_month_last) ** (1 / 12) - 1
+        # Mã chưa có giá ở cuối tháng trước (chưa niêm yết) không làm mất tháng
+        if (self.dropna_rows and not (np.isfinite(r) | np.isnan(self.month_prev)).all()) or not np.isfinite(m):
+            return None
+        return r - rf, m - rf
+
+    def _roll_months(self, dates, close, mkt, rf_rate):
+        # Chốt tháng khi gặp ngày đầu tiên của tháng mới; O(N) mỗi ngày
+        rows_y, rows_x = [], []
+        for d, c, m, rf in zip(dates.to_period("M"), close, mkt, rf_rate):
+            if self.month is not None and d != self.month:
+                row = self._month_row()
+                if row is not None:
+                    rows_y.append(row[0])
+                    rows_x.append(row[1])
+                self.month_prev, self.mkt_month_prev = self.month_last, self.mkt_month_last
+                self.month_last = np.full(len(self.tickers), np.nan)
+                self.mkt_month_last = np.nan
+            self.month = d
+            self.month_last = np.where(np.isfinite(c), c, self.month_last)
+            if np.isfinite(m):
+                self.mkt_month_last = m
+            if np.isfinite(rf):
+                self.rf_month_last = rf
+        if rows_y:
+            self.capm_m.update(np.vstack(rows_y), np.array(rows_x))
+
+    # ----------------- BÁO CÁO -----------------
+    def summary(self):
+        """
+        count / mean / std / min / max của lợi suất ngày (như describe()) + số ngày ngoại lai.
+        Phân vị (25% / 50% / 75%) không có thống kê đủ nên không có trong chế độ gia tăng.
+        """
+        with np.errstate(invalid="ignore"):
+            df = pd.DataFrame({
+                "count": self.ret.count(),
+                "mean": self.ret.mean(),
+                "std": self.ret.std(),
+                "min": np.where(np.isfinite(self.ret.min), self.ret.min, np.nan),
+                "max": np.where(np.isfinite(self.ret.max), self.ret.max, np.nan),
+                f"outliers_z{self.z_threshold:g}": self.outliers.astype(int)
+            }, index=pd.Index(self.tickers, name="ticker"))
+        return df
+
+    def corr(self, kind="returns"):
+        """
+        Ma trận tương quan pairwise của lợi suất ngày ("returns") hoặc giá đóng cửa ("price").
+        """
+        stats_ = self.ret if kind == "returns" else self.price
+        return pd.DataFrame(stats_.corr(), index=self.tickers, columns=self.tickers)
+
+    def capm(self, freq="M"):
+        """
+        Bảng CAPM (CAPM_COLUMNS) theo lợi suất vượt trội tháng ("M") hoặc ngày ("D").
+        Tháng đang chạy được cộng tạm (không ghi vào trạng thái).
+        """
+        sums = self.capm_d
+        if freq == "M":
+            sums = self.capm_m.copy()
+            row = self._month_row()
+            if row is not None:
+                sums.update(row[0][None, :], np.array([row[1]]))
+        df = pd.DataFrame(sums.results())
+        df.insert(0, "Ticker", self.tickers)
+        return df[CAPM_COLUMNS]
+
+    # ----------------- LƯU / NẠP -----------------
+    def save(self, path):
+        meta = {
+            "tickers": self.tickers,
+            "dropna_rows": self.dropna_rows,
+            "z_threshold": self.z_threshold,
+            "min_obs": self.min_obs,
+            "last_date": None if self.last_date is None else self.last_date.strftime("%Y-%m-%d"),
+            "month": None if self.month is None else str(self.month),
+            "actions": self.actions,
+            **{k: float(getattr(self, k)) for k in self.SCALARS}
+        }
+        arrays = {k: getattr(self, k) for k in self.ARRAYS}
+        arrays.update(self.ret.to_arrays("ret"))
+        arrays.update(self.price.to_arrays("price"))
+        arrays.update(self.capm_d.to_arrays("capm_d"))
+        arrays.update(self.capm_m.to_arrays("capm_m"))
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            arrays = {k: f[k] for k in f.files}
+        meta = json.loads(str(arrays.pop("meta")))
+        obj = cls(meta["tickers"], meta["dropna_rows"], meta["z_threshold"], meta["min_obs"])
+        obj.last_date = None if meta["last_date"] is None else pd.Timestamp(meta["last_date"])
+        obj.month = None if meta["month"] is None else pd.Period(meta["month"], freq="M")
+        obj.actions = meta.get("actions")
+        for k in cls.SCALARS:
+            setattr(obj, k, meta[k])
+        for k in cls.ARRAYS:
+            setattr(obj, k, arrays[k])
+        obj.ret = PairMoments.from_arrays(arrays, "ret")
+        obj.price = PairMoments.from_arrays(arrays, "price")
+        obj.capm_d = RegressionSums.from_arrays(arrays, "capm_d")
+        obj.capm_m = RegressionSums.from_arrays(arrays, "capm_m")
+        return obj
+
+
+# ----------------- NỐI VỚI PriceStore -----------------
+def actions_key(events, tickers):
+    """
+    Dấu vân tay các sự kiện doanh nghiệp của tickers (None = giá gốc, không điều chỉnh).
+    Đổi khi có sự kiện mới / sửa tay → hệ số của lịch sử đổi.
+    """
+    if events is None:
+        return None
+    ev = events[events["ticker"].isin(list(tickers))].sort_values(["ticker", "ex_date"])
+    rows = ev[["ticker", "ex_date", "factor"]].astype(str).to_numpy()
+    return hashlib.sha256("\n".join(",".join(r) for r in rows).encode()).hexdigest()
+
+
+def load_inputs(store, name="vn30", tickers=None, start=None, adjusted=True):
+    """
+    Giá đóng cửa (date × mã), VNINDEX và lãi suất phi rủi ro năm (ffill) trên cùng lịch giao dịch.
+    adjusted=True: giá điều chỉnh theo bảng sự kiện trong kho (như analysis.load_prices).
+    """
+    close = store.matrix("close", name=name, tickers=tickers, start=start)
+    if adjusted:
+        close = adjusted_frame(close, store.read_actions())
+    vnindex = store.read(["VNINDEX"], columns=["close"]).set_index("date")["close"].sort_index()
+    rf = store.read_series("rf").sort_values("date").set_index("date")["rate"]
+    mkt = vnindex.reindex(close.index)
+    rf = rf.reindex(rf.index.union(close.index)).ffill().reindex(close.index)
+    return close, mkt, rf
+
+
+def build_state(close, mkt, rf, **kwargs):
+    """
+    Khởi tạo trạng thái từ toàn bộ lịch sử (một lần, phép nhân ma trận).
+    shift = trung bình lịch sử → các tổng được cộng dồn quanh 0.
+    """
+    ret = close.pct_change(fill_method=None)
+    state = IncrementalState(close.columns, ret_shift=ret.mean().to_numpy(),
+                             price_shift=close.mean().to_numpy(), **kwargs)
+    return state.update(close.index, close.to_numpy(), mkt.to_numpy(), rf.to_numpy())
+
+
+def update_from_store(store, state_path, name="vn30", tickers=None, adjusted=True):
+    """
+    Nạp trạng thái (nếu có) và cộng các ngày mới trong PriceStore; chưa có → khởi tạo từ lịch sử.
+    Bảng sự kiện doanh nghiệp đổi (hoặc adjusted khác lúc tạo trạng thái) → khởi tạo lại.
+    Trả về (state, số ngày mới).
+    """
+    events = store.read_actions() if adjusted else None
+    if os.path.exists(state_path):
+        state = IncrementalState.load(state_path)
+        key = actions_key(events, state.tickers)
+        if state.actions == key:
+            start = state.last_date + pd.Timedelta(days=1)
+            close, mkt, rf = load_inputs(store, name, state.tickers, start=start, adjusted=adjusted)
+            close = close[close.index > state.last_date]
+            if len(close):
+                state.update(close.index, close.to_numpy(), mkt.to_numpy(), rf.to_numpy())
+            return state, len(close)
+        print("[INFO] Bảng sự kiện doanh nghiệp đã đổi → khởi tạo lại trạng thái từ lịch sử")
+        tickers = state.tickers
+
+    close, mkt, rf = load_inputs(store, name, tickers, adjusted=adjusted)
+    state = build_state(close, mkt, rf)
+    state.actions = actions_key(events, state.tickers)
+    return state, len(close)
+
+
+if __name__ == "__main__":
+    from store import PriceStore
+
+    parser = argparse.ArgumentParser(description="Cập nhật gia tăng thống kê / tương quan / CAPM")
+    parser.add_argument("--store", default="store")
+    parser.add_argument("--state", default="cache/incremental_state.npz")
+    parser.add_argument("--name", default="vn30")
+    parser.add_argument("--no-save", action="store_true", help="chạy trong phiên: không ghi trạng thái")
+    parser.add_argument("--unadjusted", action="store_true",
+                        help="giá close gốc, không điều chỉnh sự kiện doanh nghiệp (xem adjust.py)")
+    args = parser.parse_args()
+
+    state, n_new = update_from_store(PriceStore(args.store), args.state, args.name,
+                                     adjusted=not args.unadjusted)
+    if not args.no_save:
+        state.save(args.state)
+    print(f"[INFO] Trạng thái đến {state.last_date.date()} (+{n_new} ngày) → {args.state}")
+
+    os.makedirs("output", exist_ok=True)
+    state.summary().to_csv("output/incremental_summary_daily_return.csv", encoding="utf-8-sig")
+    state.corr("returns").to_csv("output/incremental_corr_returns.csv", encoding="utf-8-sig")
+    state.capm("M").to_csv("output/incremental_CAPM_monthly.csv", index=False, encoding="utf-8-sig")
+    print("✓ Đã lưu incremental_summary_daily_return.csv, incremental_corr_returns.csv, incremental_CAPM_monthly.csv")
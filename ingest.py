@@ -0,0 +1,122 @@
+# NẠP DỮ LIỆU THÔ DẠNG STREAMING (FILE LỚN HƠN RAM)
+# Thay cho mô hình "gom list DataFrame → pd.concat → sort_values toàn bộ":
+#   1. Đọc file raw CafeF / backup theo chunk (generator)
+#   2. Chuyển đổi từng chunk, tách theo (ticker, năm), ghi ra các run đã sort xuống đĩa
+#   3. Trộn ngoài (external merge): mỗi lần chỉ nạp các run của một phân vùng ticker/năm,
+#      sort, forward fill xuyên phân vùng, ghi thẳng vào PriceStore
+# Bộ nhớ đỉnh ~ 1 chunk + 1 phân vùng ticker/năm, không phụ thuộc kích thước file.
+#
+#   python ingest.py data/VN30_raw_backup_2020_2025.csv --store store --chunksize 200000
+import argparse
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from preprocess import CAFEF_SCHEMA, clean_chunks, convert_frame
+from store import PriceStore
+
+RUN_FIELDS = ("close", "adj_close", "open", "high", "low", "volume", "change", "change_pct")
+RUN_DTYPE = np.dtype([("date", "M8[ns]")] + [(f, "f8") for f in RUN_FIELDS])
+
+
+def iter_raw_chunks(path, chunksize=200_000, tickers=None):
+    """
+    Đọc file CSV thô theo chunk. Nếu truyền tickers thì chỉ giữ các mã đó
+    (lọc ngay trong từng chunk, không nạp cả file).
+    """
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        if tickers is not None:
+            chunk = chunk[chunk["symbol"].isin(tickers)]
+            if chunk.empty:
+                continue
+        yield chunk
+
+
+def _run_dir(tmp_dir, ticker, year):
+    return os.path.join(tmp_dir, ticker, str(year))
+
+
+def spill_runs(chunks, tmp_dir, schema=CAFEF_SCHEMA):
+    """
+    Pha 1: chuyển đổi từng chunk, sort trong chunk, ghi mỗi nhóm (ticker, năm)
+    thành một run .npy. Trả về dict ticker -> tập năm đã gặp.
+    """
+    seen = {}
+    for k, chunk in enumerate(chunks):
+        df = convert_frame(chunk, schema).dropna(subset=[schema["date"], schema["group"]])
+        if df.empty:
+            continue
+        df = df.sort_values([schema["group"], schema["date"]], kind="stable")
+        years = df[schema["date"]].dt.year.to_numpy()
+        for ticker, idx in df.groupby(schema["group"], sort=False).indices.items():
+            part = df.iloc[idx]
+            part_years = years[idx]
+            for year in np.unique(part_years):
+                rows = part[part_years == year]
+                run = np.empty(len(rows), dtype=RUN_DTYPE)
+                run["date"] = rows[schema["date"]].to_numpy(dtype="datetime64[ns]")
+                for f in RUN_FIELDS:
+                    run[f] = rows[f].to_numpy(dtype="f8") if f in rows else np.nan
+                d = _run_dir(tmp_dir, ticker, year)
+                os.makedirs(d, exist_ok=True)
+                np.save(os.path.join(d, f"{k:08d}.npy"), run)
+                seen.setdefault(ticker, set()).add(int(year))
+    return seen
+
+
+def merge_runs(tmp_dir, seen):
+    """
+    Pha 2: với từng ticker, duyệt các năm theo thứ tự, trộn các run của phân vùng
+    (ticker, năm) thành một DataFrame đã sort theo ngày. Trùng ngày → giữ bản ghi sau cùng.
+    """
+    for ticker in sorted(seen):
+        for year in sorted(seen[ticker]):
+            d = _run_dir(tmp_dir, ticker, year)
+            runs = [np.load(os.path.join(d, f)) for f in sorted(os.listdir(d))]
+            arr = np.concatenate(runs)
+            order = np.argsort(arr["date"], kind="stable")
+            arr = arr[order]
+            # Giữ bản ghi cuối cùng cho mỗi ngày
+            last = np.append(arr["date"][1:] != arr["date"][:-1], True)
+            arr = arr[last]
+
+            df = pd.DataFrame({f: arr[f] for f in RUN_DTYPE.names})
+            df.insert(1, "ticker", ticker)
+            yield df
+            shutil.rmtree(d)
+
+
+def ingest_file(path, store, chunksize=200_000, tickers=None, tmp_dir=None, schema=CAFEF_SCHEMA):
+    """
+    Nạp một file raw (CafeF dump / backup) vào PriceStore theo kiểu streaming.
+    Trả về số phân vùng ticker/năm đã ghi.
+    """
+    own_tmp = tmp_dir is None
+    tmp_dir = tmp_dir or tempfile.mkdtemp(prefix="vn30_runs_")
+    try:
+        seen = spill_runs(iter_raw_chunks(path, chunksize, tickers), tmp_dir, schema)
+        n_parts = 0
+        for df in clean_chunks(merge_runs(tmp_dir, seen), schema):
+            if not df.empty:
+                n_parts += store.write_bars(df)
+        print(f"[INFO] Ingest {path}: {len(seen)} mã, {n_parts} phân vùng → {store.root}")
+        return n_parts
+    finally:
+        if own_tmp:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming ingest raw CafeF CSV vào PriceStore")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--store", default="store")
+    parser.add_argument("--chunksize", type=int, default=200_000)
+    parser.add_argument("--tmp-dir", default=None)
+    args = parser.parse_args()
+
+    price_store = PriceStore(args.store)
+    for f in args.files:
+        ingest_file(f, price_store, chunksize=args.chunksize, tmp_dir=args.tmp_dir)
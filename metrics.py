@@ -0,0 +1,290 @@
+# ĐO ĐẠC THEO BƯỚC / THEO MÃ (INSTRUMENTATION)
+# - stage(): context manager ghi wall time, CPU time, peak RSS, số dòng vào/ra, số byte đọc/ghi
+#   cho một bước (task pipeline, một lần gọi fetch_cafef_price, một lần fit ARIMA, ...)
+#   kèm nhãn (ticker, task, ...)
+# - Bản ghi nằm trong bộ đệm của process; collect() gom bản ghi của một đoạn code để gửi từ
+#   worker (process pool) về process chính, merge() nhận lại → chạy tuần tự hay song song đều như nhau
+# - Xuất: JSON (bản ghi + tổng hợp theo bước), Prometheus textfile (node_exporter textfile collector),
+#   log JSON từng dòng qua logger "vn30.metrics" (tắt mặc định, bật bằng configure_logging)
+# - Profile: VN30_PROFILE="arima_fit,task" (hoặc "*") → bọc các bước đó bằng cProfile, ghi file .prof
+#   (pstats / snakeviz) vào VN30_PROFILE_DIR (mặc định cache/profile). Biến môi trường được worker
+#   kế thừa. py-spy dùng trực tiếp được: py-spy record --subprocesses -- python pipeline.py
+#
+#   with stage("clean_prices") as rec:
+#       rec.rows_in = len(df)
+#       df = ...
+#       rec.rows_out = len(df)
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows: không có peak RSS
+    resource = None
+
+logger = logging.getLogger("vn30.metrics")
+
+FIELDS = ("wall_s", "cpu_s", "rows_in", "rows_out", "bytes_read", "bytes_written")
+
+_lock = threading.Lock()
+_buffers = [[]]
+_local = threading.local()
+
+
+def _after_fork():
+    # Worker (fork) không kế thừa cProfile đang chạy của process cha → được profile riêng
+    _local.profiling = False
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class StageRecord:
+    """
+    Một lần chạy của một bước. Người gọi điền rows_in / rows_out / bytes_read / bytes_written
+    (cộng dồn được), phần thời gian và bộ nhớ do stage() tự đo.
+    """
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.rows_in = self.rows_out = 0
+        self.bytes_read = self.bytes_written = 0
+
+    def to_dict(self):
+        return {
+            "stage": self.name,
+            "labels": self.labels,
+            "start": self.start,
+            "wall_s": round(self.wall_s, 6),
+            "cpu_s": round(self.cpu_s, 6),
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "rows_in": int(self.rows_in),
+            "rows_out": int(self.rows_out),
+            "bytes_read": int(self.bytes_read),
+            "bytes_written": int(self.bytes_written),
+            "pid": os.getpid(),
+            "status": self.status,
+        }
+
+
+def peak_rss():
+    """
+    Đỉnh bộ nhớ thường trú (byte) của process hiện tại và các process con đã kết thúc.
+    """
+    if resource is None:
+        return None
+    scale = 1 if os.uname().sysname == "Darwin" else 1024  # Linux trả KB, macOS trả byte
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale
+
+
+def _cpu_time():
+    # Luồng phụ (vd. luồng tải của fetcher): chỉ CPU của luồng đó.
+    # Luồng chính: CPU của process + các process con đã kết thúc (worker của pool bên trong bước).
+    if threading.current_thread() is not threading.main_thread():
+        return time.thread_time()
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def _profiled(name):
+    wanted = os.environ.get("VN30_PROFILE", "")
+    if not wanted or getattr(_local, "profiling", False):
+        return False
+    names = {s.strip() for s in wanted.split(",")}
+    return "*" in names or name in names
+
+
+@contextmanager
+def stage(name, **labels):
+    """
+    Đo một bước. labels: nhãn tùy ý (ticker=..., task=...), giá trị được chuyển thành chuỗi.
+    Bước lỗi vẫn được ghi lại (status = "error") rồi ném lại exception.
+    """
+    rec = StageRecord(name, {k: str(v) for k, v in labels.items()})
+    rec.start = datetime.now().isoformat(timespec="milliseconds")
+    rec.status = "ok"
+
+    prof = None
+    if _profiled(name):
+        import cProfile
+
+        prof = cProfile.Profile()
+        _local.profiling = True
+        prof.enable()
+
+    t0, c0 = time.perf_counter(), _cpu_time()
+    try:
+        yield rec
+    except BaseException:
+        rec.status = "error"
+        raise
+    finally:
+        rec.wall_s = time.perf_counter() - t0
+        rec.cpu_s = _cpu_time() - c0
+        rec.peak_rss_bytes = peak_rss()
+        if prof is not None:
+            prof.disable()
+            _local.profiling = False
+            _dump_profile(prof, rec)
+        _record(rec.to_dict())
+
+
+def timed(name):
+    """
+    Decorator: đo mỗi lần gọi hàm như một bước; rows_in / rows_out lấy từ len() của
+    đối số đầu tiên và của kết quả (nếu có).
+    """
+    def wrap(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            with stage(name) as rec:
+                if args and hasattr(args[0], "__len__"):
+                    rec.rows_in = len(args[0])
+                out = func(*args, **kwargs)
+                if hasattr(out, "__len__"):
+                    rec.rows_out = len(out)
+                return out
+
+        return inner
+
+    return wrap
+
+
+def _dump_profile(prof, rec):
+    out_dir = os.environ.get("VN30_PROFILE_DIR", "cache/profile")
+    os.makedirs(out_dir, exist_ok=True)
+    tag = "-".join(rec.labels.values())
+    path = os.path.join(out_dir, f"{rec.name}{'-' + tag if tag else ''}-{os.getpid()}.prof")
+    prof.dump_stats(path)
+
+
+# ----------------- BỘ ĐỆM BẢN GHI -----------------
+def _record(entry):
+    with _lock:
+        _buffers[-1].append(entry)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(entry, ensure_ascii=False))
+
+
+@contextmanager
+def collect():
+    """
+    Gom các bản ghi phát sinh trong khối with vào một list riêng (không lẫn với bản ghi cũ,
+    kể cả bản ghi process con kế thừa khi fork). Dùng trong worker:
+        with collect() as records: ...
+        return result, records        # process chính: merge(records)
+    """
+    buf = []
+    with _lock:
+        _buffers.append(buf)
+    try:
+        yield buf
+    finally:
+        with _lock:
+            _buffers.remove(buf)
+
+
+def merge(records):
+    """
+    Nhận bản ghi từ worker vào bộ đệm hiện tại (không log lại).
+    """
+    with _lock:
+        _buffers[-1].extend(records or ())
+
+
+def records():
+    with _lock:
+        return list(_buffers[-1])
+
+
+def reset():
+    with _lock:
+        _buffers[-1].clear()
+
+
+# ----------------- TỔNG HỢP / XUẤT -----------------
+def summarize(entries):
+    """
+    Tổng hợp theo (bước, nhãn): số lần chạy, tổng các trường đo, peak RSS lớn nhất.
+    """
+    out = {}
+    for e in entries:
+        key = (e["stage"], tuple(sorted(e["labels"].items())))
+        agg = out.setdefault(key, dict({"stage": e["stage"], "labels": e["labels"], "count": 0,
+                                        "errors": 0, "peak_rss_bytes": 0}, **{f: 0 for f in FIELDS}))
+        agg["count"] += 1
+        agg["errors"] += e["status"] != "ok"
+        for f in FIELDS:
+            agg[f] += e[f]
+        agg["peak_rss_bytes"] = max(agg["peak_rss_bytes"], e["peak_rss_bytes"] or 0)
+    return list(out.values())
+
+
+def write_json(path, entries=None):
+    entries = records() if entries is None else entries
+    payload = {"created": datetime.now().isoformat(timespec="seconds"), "records": entries,
+               "summary": summarize(entries)}
+    _atomic_write(path, json.dumps(payload, indent=1, ensure_ascii=False))
+    return path
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_prometheus(path, entries=None, prefix="vn30_stage"):
+    """
+    File textfile cho node_exporter: counter tổng theo (bước, nhãn) + gauge peak RSS.
+    Ghi tạm rồi os.replace để collector không đọc phải file ghi dở.
+    """
+    entries = records() if entries is None else entries
+    metrics = [("runs_total", "count", "counter", "Số lần chạy"),
+               ("errors_total", "errors", "counter", "Số lần lỗi"),
+               ("wall_seconds_total", "wall_s", "counter", "Tổng wall time (giây)"),
+               ("cpu_seconds_total", "cpu_s", "counter", "Tổng CPU time (giây)"),
+               ("rows_in_total", "rows_in", "counter", "Tổng số dòng vào"),
+               ("rows_out_total", "rows_out", "counter", "Tổng số dòng ra"),
+               ("bytes_read_total", "bytes_read", "counter", "Tổng số byte đọc"),
+               ("bytes_written_total", "bytes_written", "counter", "Tổng số byte ghi"),
+               ("peak_rss_bytes", "peak_rss_bytes", "gauge", "Đỉnh RSS của process khi bước kết thúc")]
+    summary = summarize(entries)
+    lines = []
+    for suffix, field, kind, help_text in metrics:
+        name = f"{prefix}_{suffix}"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for agg in summary:
+            labels = dict({"stage": agg["stage"]}, **agg["labels"])
+            label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_str}}} {agg[field]}")
+    _atomic_write(path, "\n".join(lines) + "\n")
+    return path
+
+
+def _atomic_write(path, text):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def configure_logging(path=None, level=logging.INFO):
+    """
+    Bật log JSON từng dòng cho mỗi bản ghi: ra stderr, hoặc nối vào file path.
+    """
+    handler = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return handler
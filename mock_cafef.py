@@ -0,0 +1,145 @@
+# MOCK SERVER CafeF — chạy offline để kiểm thử bộ tải
+# Phục vụ JSON giống PriceHistory.ashx từ các file backup trong data/
+#
+#   python mock_cafef.py --port 8765
+#   -> http://127.0.0.1:8765/Ajax/PageNew/DataHistory/PriceHistory.ashx
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+MOCK_PATH = "/Ajax/PageNew/DataHistory/PriceHistory.ashx"
+
+BACKUP_FILES = (
+    "data/VN30_raw_backup_2020_2025.csv",
+    "data/VNINDEX_raw_backup_2020_2025.csv",
+)
+
+
+def load_backup_rows(files=BACKUP_FILES):
+    """
+    Đọc các file backup, trả về dict symbol -> DataFrame (ngày giảm dần như CafeF).
+    """
+    frames = [pd.read_csv(f) for f in files]
+    df = pd.concat(frames, ignore_index=True)
+    df["Ngay"] = pd.to_datetime(df["Ngay"], errors="coerce")
+    df = df.dropna(subset=["Ngay"]).sort_values(["symbol", "Ngay"], ascending=[True, False])
+    return {sym: g.drop(columns="symbol") for sym, g in df.groupby("symbol")}
+
+
+class MockCafeF:
+    """
+    Server HTTP giả lập CafeF.
+    - latency: độ trễ mỗi request (giây)
+    - fail_rate: xác suất trả lỗi 500 (kiểm thử retry)
+    - fail_tickers: các mã luôn trả JSON không có Data.Data
+    """
+
+    def __init__(self, rows=None, host="127.0.0.1", port=0, latency=0.0,
+                 fail_rate=0.0, fail_tickers=(), seed=None):
+        self.rows = rows if rows is not None else load_backup_rows()
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_tickers = set(fail_tickers)
+        self.random = random.Random(seed)
+        self.hits = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{MOCK_PATH}"
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with mock.lock:
+                    mock.hits += 1
+                    fail = mock.random.random() < mock.fail_rate
+
+                if mock.latency:
+                    time.sleep(mock.latency)
+
+                parsed = urlparse(self.path)
+                if parsed.path != MOCK_PATH:
+                    self.send_error(404)
+                    return
+                if fail:
+                    self.send_error(500)
+                    return
+
+                q = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                body = json.dumps(mock.respond(q)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def respond(self, q):
+        symbol = q.get("Symbol", "")
+        if symbol in self.fail_tickers or symbol not in self.rows:
+            return {"Data": None, "Message": None, "Success": False}
+
+        df = self.rows[symbol]
+        start = pd.to_datetime(q.get("StartDate"), dayfirst=True, errors="coerce")
+        end = pd.to_datetime(q.get("EndDate"), dayfirst=True, errors="coerce")
+        if pd.notna(start):
+            df = df[df["Ngay"] >= start]
+        if pd.notna(end):
+            df = df[df["Ngay"] <= end]
+
+        page_index = int(q.get("PageIndex", 1))
+        page_size = int(q.get("PageSize", 20))
+        page = df.iloc[(page_index - 1) * page_size: page_index * page_size].copy()
+        page["Ngay"] = page["Ngay"].dt.strftime("%d/%m/%Y")
+
+        return {
+            "Data": {"TotalCount": int(len(df)), "Data": page.to_dict(orient="records")},
+            "Message": None,
+            "Success": True
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock CafeF PriceHistory server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    mock = MockCafeF(port=args.port, latency=args.latency, fail_rate=args.fail_rate)
+    print("Mock CafeF:", mock.url)
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        mock.stop()
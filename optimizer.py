@@ -0,0 +1,311 @@
+# TỐI ƯU DANH MỤC MARKOWITZ (MEAN-VARIANCE)
+# - Ước lượng hiệp phương sai: mẫu hoặc co rút Ledoit-Wolf (ổn định khi nhiều mã, ít kỳ)
+# - Min-variance, max-Sharpe, target-return; ràng buộc long-only / hộp [lo, hi] hoặc bán khống tự do
+# - Không ràng buộc hộp → nghiệm đóng (closed-form)
+# - Có ràng buộc hộp → QP active-set: mỗi vòng chỉ giải hệ KKT trên các mã "tự do";
+#   tập mã chạm biên của nghiệm trước được dùng lại làm điểm khởi tạo (warm start),
+#   nên các điểm liền kề trên đường biên / các kỳ tái cân bằng liền kề hội tụ sau vài vòng.
+#   SLSQP chỉ dùng làm phương án dự phòng khi active-set không hội tụ.
+import numpy as np
+import pandas as pd
+
+TOL = 1e-10
+
+
+# ----------------- ƯỚC LƯỢNG HIỆP PHƯƠNG SAI -----------------
+def _as_array(returns):
+    if isinstance(returns, pd.DataFrame):
+        returns = returns.dropna()
+    return np.asarray(returns, dtype="f8")
+
+
+def sample_cov(returns):
+    """
+    Hiệp phương sai mẫu (ddof=1) trên các kỳ đủ dữ liệu.
+    """
+    X = _as_array(returns)
+    X = X - X.mean(axis=0)
+    return X.T @ X / (len(X) - 1)
+
+
+def ledoit_wolf(returns):
+    """
+    Hiệp phương sai co rút Ledoit-Wolf (2004) về mục tiêu mu·I.
+    Trả về (cov, shrinkage). Chi phí O(T·N²), toàn bộ bằng phép nhân ma trận.
+    """
+    X = _as_array(returns)
+    T, N = X.shape
+    X = X - X.mean(axis=0)
+
+    S = X.T @ X / T
+    mu = np.trace(S) / N
+    delta = (np.sum(S ** 2) - 2 * mu * np.trace(S) + mu ** 2 * N) / N
+    X2 = X ** 2
+    beta = (np.sum(X2.T @ X2) / T - np.sum(S ** 2)) / (N * T)
+    shrinkage = 0.0 if delta == 0 else min(beta, delta) / delta
+
+    cov = (1 - shrinkage) * S
+    cov[np.diag_indices(N)] += shrinkage * mu
+    return cov, shrinkage
+
+
+# ----------------- RÀNG BUỘC & ĐIỂM KHẢ THI -----------------
+def _bounds(bounds, n):
+    """
+    None → không ràng buộc (cho phép bán khống); (lo, hi) vô hướng hoặc mảng theo từng mã.
+    Trả về (lo, hi) dạng mảng (n,) hoặc None.
+    """
+    if bounds is None:
+        return None
+    lo, hi = bounds
+    lo = np.broadcast_to(np.asarray(-np.inf if lo is None else lo, dtype="f8"), n).copy()
+    hi = np.broadcast_to(np.asarray(np.inf if hi is None else hi, dtype="f8"), n).copy()
+    if lo.sum() > 1 + TOL or hi.sum() < 1 - TOL or (lo > hi).any():
+        raise ValueError("Ràng buộc trọng số không khả thi (tổng trọng số phải bằng 1)")
+    return lo, hi
+
+
+def _budget_point(lo, hi, x=None):
+    """
+    Điểm thỏa lo ≤ w ≤ hi và sum(w) = 1, gần x (mặc định 1/N).
+    """
+    n = len(lo)
+    x = np.clip(np.full(n, 1 / n) if x is None else x, lo, hi)
+    diff = 1 - x.sum()
+    room = (hi - x) if diff > 0 else (x - lo)
+    room = np.minimum(room, abs(diff))
+    if abs(diff) > 0 and room.sum() > 0:
+        x = x + np.sign(diff) * room * (abs(diff) / room.sum())
+    return x
+
+
+def _corner(order, lo, hi):
+    """
+    Đỉnh của miền khả thi: dồn ngân sách vào các mã theo thứ tự `order`.
+    """
+    w = lo.copy()
+    budget = 1 - w.sum()
+    for i in order:
+        add = min(hi[i] - w[i], budget)
+        w[i] += add
+        budget -= add
+    return w
+
+
+def _toward_target(x, mu, target, lo, hi):
+    """
+    Dịch điểm khả thi x về lợi suất target bằng cách trộn với đỉnh lợi suất thấp / cao nhất
+    (miền khả thi lồi nên điểm trộn vẫn khả thi, và vẫn gần x).
+    """
+    r = x @ mu
+    if abs(r - target) <= TOL:
+        return x
+    corner = _corner(np.argsort(-mu) if target > r else np.argsort(mu), lo, hi)
+    rc = corner @ mu
+    if (target - r) * (rc - target) < -TOL:
+        raise ValueError(f"Lợi suất mục tiêu {target:.6g} nằm ngoài miền khả thi")
+    theta = np.clip((target - r) / (rc - r), 0, 1)
+    return (1 - theta) * x + theta * corner
+
+
+# ----------------- QP ACTIVE-SET -----------------
+def _active_set_qp(cov, A, b, lo, hi, x0, max_iter=None):
+    """
+    min ½ w'Σw với A w = b, lo ≤ w ≤ hi, bắt đầu từ điểm khả thi x0 (primal active-set).
+    Tập làm việc = các mã đang bị giữ ở biên; mỗi vòng giải hệ KKT cỡ (#tự do + #ràng buộc).
+    Trả về (w, converged).
+    """
+    n, m = len(x0), len(b)
+    x = x0.copy()
+    at_lo = x <= lo + TOL
+    at_hi = (x >= hi - TOL) & ~at_lo
+    fixed = at_lo | at_hi
+    max_iter = max_iter or 10 * n + 50
+
+    for _ in range(max_iter):
+        F = np.flatnonzero(~fixed)
+        g = cov @ x
+        k = len(F)
+        K = np.zeros((k + m, k + m))
+        K[:k, :k] = cov[np.ix_(F, F)]
+        K[:k, k:] = A[:, F].T
+        K[k:, :k] = A[:, F]
+        rhs = np.concatenate([-g[F], np.zeros(m)])
+        try:
+            sol = np.linalg.solve(K, rhs)
+        except np.linalg.LinAlgError:
+            sol = np.linalg.lstsq(K, rhs, rcond=None)[0]
+        p, lam = sol[:k], sol[k:]
+
+        if np.abs(p).max(initial=0) <= TOL:
+            # Điểm dừng trên tập làm việc: kiểm tra nhân tử của các biên đang giữ
+            mult = g + A.T @ lam
+            viol = np.where(at_lo, -mult, 0) + np.where(at_hi, mult, 0)
+            j = np.argmax(viol)
+            if viol[j] <= TOL * max(1.0, np.abs(g).max()):
+                return x, True
+            fixed[j] = at_lo[j] = at_hi[j] = False
+            continue
+
+        # Bước dài nhất giữ được lo ≤ w ≤ hi; biên chặn đầu tiên được thêm vào tập làm việc
+        xF = x[F]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            steps = np.where(p < 0, (lo[F] - xF) / p, np.where(p > 0, (hi[F] - xF) / p, np.inf))
+        j = np.argmin(steps)
+        alpha = min(1.0, max(steps[j], 0.0))
+        x[F] = xF + alpha * p
+        if alpha < 1.0:
+            i = F[j]
+            if p[j] < 0:
+                x[i], at_lo[i] = lo[i], True
+            else:
+                x[i], at_hi[i] = hi[i], True
+            fixed[i] = True
+
+    return x, False
+
+
+def _slsqp(cov, A, b, lo, hi, x0):
+    # Phương án dự phòng khi active-set không hội tụ (vd. suy biến nặng)
+    from scipy.optimize import minimize
+
+    cons = [{"type": "eq", "fun": lambda w, i=i: A[i] @ w - b[i], "jac": lambda w, i=i: A[i]}
+            for i in range(len(b))]
+    res = minimize(lambda w: w @ cov @ w, x0, jac=lambda w: 2 * cov @ w, method="SLSQP",
+                   bounds=list(zip(lo, hi)), constraints=cons,
+                   options={"ftol": 1e-14, "maxiter": 1000})
+    return res.x
+
+
+def _solve(cov, A, b, lo, hi, x0):
+    w, ok = _active_set_qp(cov, A, b, lo, hi, x0)
+    return w if ok else _slsqp(cov, A, b, lo, hi, x0)
+
+
+# ----------------- CÁC BÀI TOÁN TỐI ƯU -----------------
+def min_variance(cov, bounds=(0, 1), x0=None):
+    """
+    Danh mục phương sai nhỏ nhất. x0: nghiệm cũ (vd. kỳ tái cân bằng trước) để warm start.
+    """
+    cov = np.asarray(cov, dtype="f8")
+    n = len(cov)
+    lohi = _bounds(bounds, n)
+    if lohi is None:
+        inv1 = np.linalg.solve(cov, np.ones(n))
+        return inv1 / inv1.sum()
+    lo, hi = lohi
+    return _solve(cov, np.ones((1, n)), np.ones(1), lo, hi, _budget_point(lo, hi, x0))
+
+
+def target_return(mu, cov, target, bounds=(0, 1), x0=None):
+    """
+    Phương sai nhỏ nhất với lợi suất kỳ vọng = target.
+    """
+    mu = np.asarray(mu, dtype="f8")
+    cov = np.asarray(cov, dtype="f8")
+    n = len(mu)
+    lohi = _bounds(bounds, n)
+    if lohi is None:
+        # Nghiệm đóng: tổ hợp của Σ⁻¹1 và Σ⁻¹μ
+        inv1 = np.linalg.solve(cov, np.ones(n))
+        invmu = np.linalg.solve(cov, mu)
+        A, B, C = inv1.sum(), mu @ inv1, mu @ invmu
+        D = A * C - B ** 2
+        return ((C - B * target) * inv1 + (A * target - B) * invmu) / D
+    lo, hi = lohi
+    start = _toward_target(_budget_point(lo, hi, x0), mu, target, lo, hi)
+    return _solve(cov, np.vstack([np.ones(n), mu]), np.array([1.0, target]), lo, hi, start)
+
+
+def return_range(mu, cov, bounds=(0, 1), x0=None):
+    """
+    Khoảng lợi suất của phần hiệu quả: (lợi suất danh mục min-variance, lợi suất lớn nhất khả thi,
+    trọng số min-variance).
+    """
+    mu = np.asarray(mu, dtype="f8")
+    w_min = min_variance(cov, bounds, x0)
+    lohi = _bounds(bounds, len(mu))
+    if lohi is None:
+        return w_min @ mu, np.inf, w_min
+    return w_min @ mu, _corner(np.argsort(-mu), *lohi) @ mu, w_min
+
+
+def max_sharpe(mu, cov, rf=0.0, bounds=(0, 1), x0=None):
+    """
+    Danh mục tiếp tuyến (Sharpe lớn nhất).
+    Có ràng buộc hộp: Sharpe là hàm đơn đỉnh theo lợi suất mục tiêu trên đường biên,
+    nên tìm kiếm một chiều trên target, mỗi lần giải target_return warm start từ nghiệm trước.
+    """
+    mu = np.asarray(mu, dtype="f8")
+    cov = np.asarray(cov, dtype="f8")
+    if bounds is None:
+        w = np.linalg.solve(cov, mu - rf)
+        return w / w.sum()
+
+    r_lo, r_hi, w_min = return_range(mu, cov, bounds, x0)
+    if r_hi - r_lo <= TOL:
+        return w_min
+    last = {"w": w_min}
+
+    def neg_sharpe(target):
+        w = target_return(mu, cov, target, bounds, x0=last["w"])
+        last["w"] = w
+        return -(w @ mu - rf) / np.sqrt(w @ cov @ w)
+
+    from scipy.optimize import minimize_scalar
+
+    res = minimize_scalar(neg_sharpe, bounds=(r_lo, r_hi), method="bounded",
+                          options={"xatol": 1e-9 * max(1.0, abs(r_hi))})
+    return target_return(mu, cov, res.x, bounds, x0=last["w"])
+
+
+def efficient_frontier(mu, cov, n_points=30, bounds=(0, 1), rf=0.0, tickers=None):
+    """
+    Đường biên hiệu quả từ danh mục min-variance tới lợi suất lớn nhất khả thi
+    (không ràng buộc hộp: tới 2 × lợi suất lớn nhất của một mã).
+    Mỗi điểm warm start từ nghiệm của điểm trước.
+    Trả về (frontier, weights):
+    - frontier: DataFrame (target, return, volatility, sharpe)
+    - weights: DataFrame (điểm × mã)
+    """
+    mu = np.asarray(mu, dtype="f8")
+    cov = np.asarray(cov, dtype="f8")
+    r_lo, r_hi, w = return_range(mu, cov, bounds)
+    if not np.isfinite(r_hi):
+        r_hi = 2 * mu.max()
+
+    rows, W = [], []
+    for target in np.linspace(r_lo, r_hi, n_points):
+        w = target_return(mu, cov, target, bounds, x0=w)
+        ret, vol = w @ mu, np.sqrt(w @ cov @ w)
+        rows.append({"target": target, "return": ret, "volatility": vol, "sharpe": (ret - rf) / vol})
+        W.append(w)
+
+    return pd.DataFrame(rows), pd.DataFrame(W, columns=tickers)
+
+
+def rolling_weights(returns, window=36, objective="min_variance", bounds=(0, 1), rf=0.0,
+                    estimator="ledoit_wolf", periods_per_year=12):
+    """
+    Trọng số tối ưu tại mỗi kỳ tái cân bằng, ước lượng trên `window` kỳ trước đó (không look-ahead).
+    - objective: "min_variance" hoặc "max_sharpe"
+    - estimator: "ledoit_wolf" hoặc "sample"
+    Nghiệm kỳ trước làm điểm khởi tạo cho kỳ sau (cửa sổ chỉ trượt một kỳ nên nghiệm gần nhau).
+    Trả về DataFrame date × mã; dòng t dùng dữ liệu đến hết kỳ t-1.
+    """
+    R = returns.to_numpy(dtype="f8")
+    rows, index = [], []
+    w = None
+    for t in range(window, len(R)):
+        X = R[t - window:t]
+        X = X[np.isfinite(X).all(axis=1)]
+        if len(X) < 2:
+            continue
+        cov = (ledoit_wolf(X)[0] if estimator == "ledoit_wolf" else sample_cov(X)) * periods_per_year
+        if objective == "max_sharpe":
+            w = max_sharpe(X.mean(axis=0) * periods_per_year, cov, rf, bounds, x0=w)
+        else:
+            w = min_variance(cov, bounds, x0=w)
+        rows.append(w)
+        index.append(returns.index[t])
+    return pd.DataFrame(rows, index=pd.Index(index, name=returns.index.name), columns=returns.columns)
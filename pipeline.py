@@ -0,0 +1,474 @@
+# PIPELINE THEO ĐỒ THỊ PHỤ THUỘC (DAG) + CACHE THEO NỘI DUNG
+# data.py và analysis.py được tách thành các task có tên, khai báo đầu vào / đầu ra:
+#   fetch → clean ─┐
+#   rf ────────────┴→ store                       (nhóm "data")
+#   prices → returns → stats, heatmap, garch, capm
+#   prices → arima;  arima + garch → forecast
+#   capm → portfolios, backtest, markowitz;  portfolios + markowitz + garch → risk
+#   capm + portfolios + markowitz → bootstrap
+#   prices + heatmap + forecast + portfolios + markowitz → charts   (nhóm "analysis")
+# Các task tính toán không vẽ; task charts vẽ mọi biểu đồ song song (xem charts.py).
+# Khóa cache của một task = hash của: mã nguồn hàm, module chứa hàm (+ các module khai báo),
+# tham số (kể cả giá trị mặc định của hàm),
+# hash NỘI DUNG kết quả các task phụ thuộc, hash nội dung các file đầu vào.
+# → task chỉ chạy lại khi một trong các thứ đó đổi; task phía trên chạy lại nhưng cho kết quả
+#   y hệt thì task phía dưới vẫn lấy từ cache. Kết quả lưu ở cache/pipeline/<task>.pkl và chỉ
+#   được đọc khi có task phía dưới cần chạy lại.
+# Các task độc lập (heatmap, arima, garch, capm, ...) chạy song song trên process pool.
+#
+#   python pipeline.py                      # tất cả (data + analysis)
+#   python pipeline.py capm                 # chỉ capm và các task nó cần
+#   python pipeline.py analysis --workers 4
+#   python pipeline.py heatmap --force      # bỏ qua cache của các task được chọn
+#   python pipeline.py all --offline        # không gọi API, dùng file raw đã lưu
+#   python pipeline.py --charts draft       # biểu đồ PNG 72 dpi (nhanh); svg / none (không vẽ)
+#   python pipeline.py analysis --universe VN30_BANKS   # phân tích universe khác (universe.py)
+#   python pipeline.py analysis --compact   # giá / lợi suất float32 (panel.py) cho universe lớn
+#   python pipeline.py analysis --unadjusted   # giá close gốc, không điều chỉnh sự kiện doanh nghiệp (adjust.py)
+#   python pipeline.py --list
+#   python pipeline.py analysis --metrics output/metrics.json --profile arima_fit   # số đo / profile (metrics.py)
+import argparse
+import hashlib
+import importlib.util
+import inspect
+import json
+import multiprocessing as mp
+import os
+import pickle
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+import metrics
+
+
+class Task:
+    """
+    Một bước của pipeline.
+    - func(**kwargs): kwargs = kết quả các task trong deps (theo tên) + params
+    - files: file / thư mục đầu vào ngoài pipeline, hash theo nội dung
+    - outputs: file task ghi ra; thiếu file → task chạy lại
+    - modules: module mà kết quả phụ thuộc (mã nguồn được đưa vào khóa cache), ngoài module chứa func
+    - after: chỉ ràng buộc thứ tự — chờ các task này nếu chúng có trong lượt chạy
+    - volatile: luôn chạy lại (vd. tải dữ liệu mới); task phía dưới vẫn dùng cache nếu kết quả không đổi
+    """
+
+    def __init__(self, name, func, deps=(), params=None, files=(), outputs=(), modules=(),
+                 after=(), volatile=False):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.params = dict(params or {})
+        self.files = tuple(files)
+        self.outputs = tuple(outputs)
+        self.modules = tuple(modules)
+        self.after = tuple(after)
+        self.volatile = volatile
+
+
+def _sha256_file(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _walk(path):
+    # Các file dưới path (file đơn hoặc thư mục), bỏ file tạm đang ghi dở
+    if os.path.isfile(path):
+        return [path]
+    out = []
+    for root, _, names in os.walk(path):
+        out += [os.path.join(root, n) for n in names if ".tmp" not in n]
+    return sorted(out)
+
+
+def _run_task(task, dep_paths, result_path):
+    """
+    Chạy một task (trong process con hoặc process chính): đọc kết quả các task phụ thuộc,
+    gọi hàm, ghi kết quả (pickle, ghi tạm rồi os.replace).
+    Trả về (hash nội dung, số giây, bản ghi đo của task — xem metrics.py).
+    """
+    with metrics.collect() as records, metrics.stage("task", task=task.name) as rec:
+        kwargs = dict(task.params)
+        for dep, path in dep_paths.items():
+            with open(path, "rb") as f:
+                kwargs[dep] = pickle.load(f)
+            rec.bytes_read += os.path.getsize(path)
+            rec.rows_in += _count_rows(kwargs[dep])
+        for out in task.outputs:
+            os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+
+        t0 = time.perf_counter()
+        result = task.func(**kwargs)
+        elapsed = time.perf_counter() - t0
+
+        blob = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp = result_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, result_path)
+        rec.rows_out = _count_rows(result)
+        rec.bytes_written = len(blob) + sum(os.path.getsize(p) for p in task.outputs if os.path.isfile(p))
+    return hashlib.sha256(blob).hexdigest(), elapsed, records
+
+
+def _count_rows(obj):
+    # Số dòng của kết quả task: tổng len() các DataFrame / Series / mảng bên trong (dict, list lồng nhau)
+    if isinstance(obj, dict):
+        return sum(_count_rows(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(_count_rows(v) for v in obj)
+    if hasattr(obj, "shape") and getattr(obj, "ndim", 0) > 0:
+        return len(obj)
+    return 0
+
+
+def _pool_context():
+    methods = mp.get_all_start_methods()
+    return mp.get_context("fork") if "fork" in methods else None
+
+
+class Pipeline:
+    """
+    Tập task + nhóm target; manifest (cache_dir/manifest.json) lưu khóa và hash kết quả
+    của lần chạy gần nhất mỗi task, cùng hash các file đầu vào theo (size, mtime)
+    để không đọc lại file không đổi.
+    """
+
+    def __init__(self, cache_dir="cache/pipeline"):
+        self.cache_dir = cache_dir
+        self.tasks = {}
+        self.groups = {}
+        self._code = {}
+
+    def add(self, name, func, **kwargs):
+        for dep in kwargs.get("deps", ()):
+            if dep not in self.tasks:
+                raise ValueError(f"Task {name}: chưa khai báo task phụ thuộc {dep}")
+        self.tasks[name] = Task(name, func, **kwargs)
+        return self.tasks[name]
+
+    def group(self, name, targets):
+        self.groups[name] = tuple(targets)
+
+    # ----------------- LẬP KẾ HOẠCH -----------------
+    def _expand(self, targets):
+        out = []
+        for t in targets:
+            if t in self.groups:
+                out += self._expand(self.groups[t])
+            elif t in self.tasks:
+                out.append(t)
+            else:
+                raise KeyError(f"Không có task / nhóm: {t}")
+        return out
+
+    def plan(self, targets):
+        """
+        Các task cần cho targets (gồm mọi task phụ thuộc), theo thứ tự topo.
+        """
+        order, seen = [], set()
+
+        def visit(name):
+            if name in seen:
+                return
+            seen.add(name)
+            for dep in self.tasks[name].deps:
+                visit(dep)
+            order.append(name)
+
+        for t in self._expand(targets):
+            visit(t)
+        return order
+
+    # ----------------- KHÓA CACHE -----------------
+    def _result_path(self, name):
+        return os.path.join(self.cache_dir, f"{name}.pkl")
+
+    def _manifest_path(self):
+        return os.path.join(self.cache_dir, "manifest.json")
+
+    def _load_manifest(self):
+        path = self._manifest_path()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        return {"tasks": {}, "files": {}}
+
+    def _save_manifest(self, manifest):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self._manifest_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, ensure_ascii=False)
+        os.replace(tmp, self._manifest_path())
+
+    def _code_hash(self, task):
+        # Module định nghĩa hàm (analysis / data) luôn được hash: hàm phụ trợ và hằng số
+        # cùng file (vd. member_returns, TRANSACTION_COST) đổi → khóa đổi
+        if task.name not in self._code:
+            h = hashlib.sha256(inspect.getsource(task.func).encode())
+            h.update(_sha256_file(inspect.getsourcefile(task.func)).encode())
+            for m in task.modules:
+                h.update(_sha256_file(importlib.util.find_spec(m).origin).encode())
+            self._code[task.name] = h.hexdigest()
+        return self._code[task.name]
+
+    @staticmethod
+    def _params(task):
+        # Tham số thực của lần gọi: giá trị mặc định của hàm (đã resolve) + task.params
+        params = {name: p.default for name, p in inspect.signature(task.func).parameters.items()
+                  if p.default is not inspect.Parameter.empty and name not in task.deps}
+        params.update(task.params)
+        return params
+
+    def _file_hash(self, path, manifest):
+        if not os.path.exists(path):
+            return "missing"
+        digests = []
+        for p in _walk(path):
+            st = os.stat(p)
+            cached = manifest["files"].get(p)
+            if cached and cached[:2] == [st.st_size, st.st_mtime_ns]:
+                digest = cached[2]
+            else:
+                digest = _sha256_file(p)
+                manifest["files"][p] = [st.st_size, st.st_mtime_ns, digest]
+            digests.append(f"{os.path.relpath(p, path)}:{digest}")
+        return hashlib.sha256("\n".join(digests).encode()).hexdigest()
+
+    def key(self, task, results, manifest):
+        payload = {
+            "code": self._code_hash(task),
+            "params": self._params(task),
+            "deps": {d: results[d] for d in task.deps},
+            "files": {p: self._file_hash(p, manifest) for p in task.files},
+            "outputs": task.outputs,
+        }
+        blob = json.dumps(payload, sort_keys=True, default=repr)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _fresh(self, task, key, manifest):
+        entry = manifest["tasks"].get(task.name)
+        return (entry is not None and entry["key"] == key
+                and os.path.exists(self._result_path(task.name))
+                and all(os.path.exists(p) for p in task.outputs))
+
+    # ----------------- CHẠY -----------------
+    def run(self, targets=("all",), workers=None, force=()):
+        """
+        Chạy các task cần cho targets; task nào khóa cache không đổi thì bỏ qua.
+        - workers: số process (1 = chạy tuần tự trong process chính)
+        - force: True (mọi task trong kế hoạch) hoặc danh sách task luôn chạy lại
+        Trả về dict task -> {"status": "cached" / "run", "seconds": ...}.
+        """
+        order = self.plan(targets)
+        force = set(order) if force is True else set(force or ())
+        os.makedirs(self.cache_dir, exist_ok=True)
+        manifest = self._load_manifest()
+
+        results, report = {}, {}
+        pending, running = list(order), {}
+        pool = None if workers == 1 else ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context())
+
+        def finish(name, key, digest, elapsed, records):
+            metrics.merge(records)
+            results[name] = digest
+            report[name] = {"status": "run", "seconds": round(elapsed, 3)}
+            manifest["tasks"][name] = {"key": key, "result": digest, "seconds": round(elapsed, 3),
+                                       "finished": datetime.now().isoformat(timespec="seconds")}
+            self._save_manifest(manifest)
+            print(f"✓ [{name}] xong sau {elapsed:.2f}s")
+
+        try:
+            while pending or running:
+                busy = {n for n, _ in running.values()}
+                for name in list(pending):
+                    task = self.tasks[name]
+                    if any(d not in results for d in task.deps):
+                        continue
+                    if any(a in busy or a in pending for a in task.after):
+                        continue
+                    pending.remove(name)
+
+                    key = self.key(task, results, manifest)
+                    if not task.volatile and name not in force and self._fresh(task, key, manifest):
+                        results[name] = manifest["tasks"][name]["result"]
+                        report[name] = {"status": "cached", "seconds": 0.0}
+                        print(f"· [{name}] dùng cache")
+                        continue
+
+                    args = (task, {d: self._result_path(d) for d in task.deps}, self._result_path(name))
+                    if pool is None:
+                        finish(name, key, *_run_task(*args))
+                    else:
+                        running[pool.submit(_run_task, *args)] = (name, key)
+                        busy.add(name)
+
+                if running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        name, key = running.pop(fut)
+                        finish(name, key, *fut.result())
+                elif pending:
+                    raise RuntimeError(f"Không thể xếp lịch các task: {pending}")
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            self._save_manifest(manifest)
+        return report
+
+
+# ----------------- DAG CỦA DỰ ÁN VN30 -----------------
+DATA_TARGETS = ("store",)
+ANALYSIS_TARGETS = ("stats", "heatmap", "forecast", "portfolios", "backtest", "markowitz", "risk", "bootstrap")
+CHART_NAMES = ("VN30_correlation_heatmap", "VN30_normalized_trend", "VJC_ARIMA_return_forecast",
+               "VJC_ARIMA_price_forecast", "Portfolio_cumulative_return_complete", "Markowitz_efficient_frontier")
+
+
+def build_pipeline(store_root="store", cache_dir="cache/pipeline", offline=False, charts="full",
+                   universe=None, compact=False, adjusted=True):
+    """
+    Khai báo các task của data.py và analysis.py.
+    offline=True: task fetch không gọi API mà đọc lại file raw (và được cache như task thường).
+    charts: full / draft / svg → chế độ của task charts; "none" → không đưa task charts vào nhóm.
+    universe: universe được phân tích (mặc định VN30). Nhóm data luôn tải / ghi kho cho mọi
+    universe đã cấu hình (xem universe.py), mỗi mã một lần.
+    compact=True: task prices trả về giá float32 (panel.py) → returns và các task phía sau float32.
+    adjusted=False: phân tích trên close gốc thay vì giá điều chỉnh theo bảng sự kiện (adjust.py).
+    """
+    import analysis
+    import data
+    from charts import chart_path
+    from universe import DEFAULT_UNIVERSE, UNIVERSES_FILE, get_universe
+
+    u = get_universe(universe or DEFAULT_UNIVERSE)
+    p = Pipeline(cache_dir)
+    raw_files = (data.raw_file, data.vnindex_raw_file)
+    actions_files = (data.actions_file,)
+
+    # --- data.py ---
+    p.add("fetch", data.fetch_raw, params={"offline": offline},
+          files=(raw_files + actions_files if offline else ()) + (UNIVERSES_FILE,),
+          outputs=raw_files + actions_files, modules=("fetcher", "refresh", "ingest", "universe", "adjust"),
+          volatile=not offline)
+    p.add("clean", data.clean_raw, deps=("fetch",), modules=("preprocess",))
+    p.add("rf", data.load_rf, params={"rf_file": data.rf_file}, files=(data.rf_file,))
+    p.add("store", data.save_store, deps=("clean", "rf"), params={"store_root": store_root},
+          files=(UNIVERSES_FILE,), outputs=tuple(os.path.join(store_root, "matrix", v.store_name, "close.npy")
+                                                 for v in data.select_universes())
+                                           + (os.path.join(store_root, "actions.npy"),),
+          modules=("store", "universe"))
+
+    # --- analysis.py ---
+    store_files = (os.path.join(store_root, "matrix", u.store_name), os.path.join(store_root, "bars", u.index),
+                   os.path.join(store_root, "actions.npy"), UNIVERSES_FILE)
+    p.add("prices", analysis.load_prices, params={"store_root": store_root, "universe": u.name,
+                                                    "compact": compact, "adjusted": adjusted},
+          files=store_files, outputs=("output/missing_value_report.csv",),
+          modules=("store", "universe", "panel", "adjust"),
+          after=("store",))
+    p.add("returns", analysis.compute_returns, deps=("prices",),
+          outputs=("output/outlier_report_daily.csv",))
+    p.add("stats", analysis.descriptive_stats, deps=("prices", "returns"),
+          outputs=("output/summary_price.csv", "output/summary_daily_return.csv"))
+    p.add("heatmap", analysis.correlation_heatmap, deps=("returns",),
+          outputs=("output/VN30_correlation_returns.csv", "output/VN30_clusters.csv"),
+          modules=("correlation", "incremental"))
+    p.add("arima", analysis.arima_forecasts, deps=("prices",), modules=("forecast",))
+    p.add("garch", analysis.garch_volatility, deps=("returns",), outputs=("output/GARCH_params.csv",),
+          modules=("garch",))
+    p.add("forecast", analysis.forecast_report, deps=("prices", "arima", "garch"),
+          outputs=("output/ARIMA_forecast_all.csv", "output/ARIMA_models_summary.csv",
+                   "output/VJC_ARIMA_forecast_return.csv"),
+          modules=("forecast", "garch"))
+    p.add("capm", analysis.capm_regression, deps=("returns",), params={"store_root": store_root},
+          files=(os.path.join(store_root, "series", "rf.npy"),),
+          outputs=("output/CAPM_results_realRF.csv", "output/CAPM_rolling_beta_36M.csv",
+                   "output/CAPM_rolling_beta_252D.csv"),
+          modules=("capm",))
+    p.add("portfolios", analysis.beta_portfolios, deps=("capm",),
+          outputs=("output/Portfolio_metrics_complete.csv", "output/Portfolio_metrics_rolling_beta.csv"),
+          modules=("portfolio",))
+    p.add("backtest", analysis.walkforward_backtest, deps=("returns", "capm"),
+          outputs=("output/Backtest_walkforward_metrics.csv", "output/Backtest_walkforward_returns.csv"),
+          modules=("backtest", "portfolio"))
+    p.add("markowitz", analysis.markowitz_portfolios, deps=("capm",),
+          outputs=("output/Markowitz_weights.csv", "output/Markowitz_efficient_frontier.csv"),
+          modules=("optimizer", "portfolio"))
+    p.add("risk", analysis.portfolio_risk, deps=("returns", "portfolios", "markowitz", "garch"),
+          outputs=("output/Portfolio_VaR_CVaR.csv",), modules=("risk", "garch"))
+    p.add("bootstrap", analysis.bootstrap_intervals, deps=("capm", "portfolios", "markowitz"),
+          outputs=("output/Bootstrap_CI.csv",), modules=("bootstrap", "capm", "portfolio"))
+
+    # Biểu đồ: một task riêng ở cuối DAG, đổi chế độ vẽ không làm các task tính toán chạy lại
+    analysis_targets = ANALYSIS_TARGETS
+    if charts != "none":
+        p.add("charts", analysis.render_charts, deps=("prices", "heatmap", "forecast", "portfolios", "markowitz"),
+              params={"mode": charts}, outputs=tuple(chart_path(n, charts) for n in CHART_NAMES),
+              modules=("charts",))
+        analysis_targets += ("charts",)
+
+    p.group("data", DATA_TARGETS)
+    p.group("analysis", analysis_targets)
+    p.group("all", DATA_TARGETS + analysis_targets)
+    return p
+
+
+def main(argv=None, default_targets=("all",)):
+    parser = argparse.ArgumentParser(description="Chạy pipeline VN30 (chỉ các task có đầu vào thay đổi)")
+    parser.add_argument("targets", nargs="*", help="task hoặc nhóm: data, analysis, all")
+    parser.add_argument("--workers", type=int, default=None, help="số process (1 = tuần tự)")
+    parser.add_argument("--force", action="store_true", help="chạy lại các target được chọn dù có cache")
+    parser.add_argument("--offline", action="store_true", help="không gọi API, dùng file raw đã lưu")
+    parser.add_argument("--store", default="store")
+    parser.add_argument("--cache-dir", default="cache/pipeline")
+    parser.add_argument("--universe", default=None, help="universe được phân tích (mặc định VN30, xem universe.py)")
+    parser.add_argument("--compact", action="store_true",
+                        help="giá / lợi suất float32 (nửa bộ nhớ, cho universe lớn; xem panel.py)")
+    parser.add_argument("--unadjusted", action="store_true",
+                        help="phân tích trên giá close gốc (không điều chỉnh chia tách / cổ tức, xem adjust.py)")
+    parser.add_argument("--charts", default="full", choices=("full", "draft", "svg", "none"),
+                        help="biểu đồ: full (PNG 300 dpi), draft (PNG 72 dpi), svg, none (không vẽ)")
+    parser.add_argument("--list", action="store_true", help="liệt kê task và trạng thái cache")
+    parser.add_argument("--metrics", metavar="PATH.json",
+                        help="ghi số đo theo task / mã ra JSON (kèm file .prom cùng tên cho Prometheus)")
+    parser.add_argument("--log-metrics", action="store_true", help="log JSON từng bản ghi đo ra stderr")
+    parser.add_argument("--profile", metavar="STAGES",
+                        help="cProfile các bước (vd. task,arima_fit hoặc *), file .prof ở cache/profile")
+    args = parser.parse_args(argv)
+
+    if args.log_metrics:
+        metrics.configure_logging()
+    if args.profile:
+        # Biến môi trường → worker (fork) cũng thấy
+        os.environ["VN30_PROFILE"] = args.profile
+
+    pipeline = build_pipeline(args.store, args.cache_dir, offline=args.offline, charts=args.charts,
+                              universe=args.universe, compact=args.compact, adjusted=not args.unadjusted)
+    targets = args.targets or list(default_targets)
+
+    if args.list:
+        manifest = pipeline._load_manifest()
+        for name in pipeline.plan(targets):
+            task = pipeline.tasks[name]
+            entry = manifest["tasks"].get(name)
+            last = f"{entry['finished']} ({entry['seconds']}s)" if entry else "chưa chạy"
+            print(f"{name:<11} ← {', '.join(task.deps) or '-':<40} {last}")
+        return
+
+    force = pipeline._expand(targets) if args.force else ()
+    t0 = time.perf_counter()
+    report = pipeline.run(targets, workers=args.workers, force=force)
+    n_run = sum(r["status"] == "run" for r in report.values())
+    print(f"[INFO] {n_run} task chạy, {len(report) - n_run} task dùng cache, "
+          f"tổng {time.perf_counter() - t0:.1f}s")
+    if args.metrics:
+        metrics.write_json(args.metrics)
+        prom = metrics.write_prometheus(os.path.splitext(args.metrics)[0] + ".prom")
+        print(f"Đã lưu {args.metrics}, {prom}")
+
+
+if __name__ == "__main__":
+    main()
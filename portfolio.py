@@ -0,0 +1,127 @@
+# PHÂN TÍCH DANH MỤC THEO LÔ (VECTOR HÓA)
+# Thay cho việc gọi portfolio_metrics_weighted riêng cho từng danh mục:
+# một ma trận trọng số (danh mục × mã) được đánh giá trong một lượt NumPy.
+# - Lợi suất năm hóa, độ biến động, Sharpe, đường tích lũy, max drawdown
+# - Tái cân bằng mỗi kỳ / mỗi k kỳ / buy-and-hold, chi phí giao dịch theo turnover
+import numpy as np
+import pandas as pd
+
+METRIC_COLUMNS = ["Annualized Return", "Volatility", "Sharpe Ratio", "Max Drawdown", "Turnover"]
+
+
+def weights_matrix(groups, tickers):
+    """
+    dict tên danh mục -> list mã  →  DataFrame trọng số 1/N (danh mục × mã).
+    """
+    W = pd.DataFrame(0.0, index=list(groups), columns=list(tickers))
+    for name, members in groups.items():
+        if len(members):
+            W.loc[name, members] = 1 / len(members)
+    return W
+
+
+def _simulate(W, R, held_nan, rebalance, cost):
+    """
+    Mô phỏng theo thời gian cho mọi danh mục cùng lúc (vòng lặp theo kỳ, NumPy theo P × N).
+    Trọng số trôi theo lợi suất giữa các lần tái cân bằng; chi phí = cost × turnover.
+    """
+    T = R.shape[0]
+    P = W.shape[0]
+    port = np.empty((T, P))
+    turnover = np.zeros((T, P))
+    w = W.copy()
+    for t in range(T):
+        if t > 0 and rebalance and t % rebalance == 0:
+            turnover[t] = np.abs(W - w).sum(axis=1)
+            w = W.copy()
+        gross = w @ R[t]
+        port[t] = gross - cost * turnover[t]
+        # Trọng số sau kỳ t (trôi theo giá)
+        grown = w * (1 + R[t])
+        total = grown.sum(axis=1, keepdims=True)
+        w = np.divide(grown, total, out=np.zeros_like(grown), where=total != 0) * W.sum(axis=1, keepdims=True)
+    port[held_nan] = np.nan
+    return port, turnover
+
+
+def portfolio_returns(W, R, rebalance=1, cost=0.0, block_cells=20_000_000):
+    """
+    Lợi suất kỳ của P danh mục.
+    - W: trọng số (P × N), R: lợi suất (T × N), NaN = mã không có dữ liệu kỳ đó
+    - rebalance: 1 = về trọng số mục tiêu mỗi kỳ, k = mỗi k kỳ, None/0 = buy-and-hold
+    - cost: chi phí trên mỗi đơn vị turnover (vd. 0.0015 = 15 bps)
+    Kỳ mà một mã đang nắm giữ bị NaN → lợi suất danh mục NaN (giống dropna theo danh mục).
+    Trả về (port_returns T × P, turnover T × P).
+    """
+    W = np.asarray(W, dtype="f8")
+    # Lợi suất float32 (compact panel, xem panel.py) giữ nguyên kiểu: không nhân đôi ma trận T × N
+    R = np.asarray(R)
+    if R.dtype.kind != "f":
+        R = R.astype("f8")
+    nan = np.isnan(R)
+    held_nan = (nan.astype(R.dtype) @ (W != 0).T.astype(R.dtype)) > 0
+    R0 = np.where(nan, R.dtype.type(0), R)
+
+    if rebalance == 1:
+        # Tái cân bằng mỗi kỳ: một phép nhân ma trận cho mọi danh mục (kết quả T × P luôn float64)
+        port = (R0 @ W.T.astype(R.dtype)).astype("f8", copy=False)
+        turnover = np.zeros_like(port)
+        if cost:
+            # Trọng số trôi cuối kỳ t-1 so với mục tiêu → turnover tại kỳ t.
+            # Mảng trung gian T × P × N được xử lý theo khối danh mục để giới hạn bộ nhớ.
+            T, N = R0.shape
+            block = max(1, int(block_cells // max(1, T * N)))
+            for lo in range(0, W.shape[0], block):
+                Wb = W[lo:lo + block]
+                gross = 1 + port[:-1, lo:lo + block]
+                grown = Wb[None, :, :] * (1 + R0[:-1, None, :])
+                drifted = grown / np.where(gross == 0, np.nan, gross)[:, :, None] * Wb.sum(axis=1)[None, :, None]
+                turnover[1:, lo:lo + block] = np.abs(Wb[None, :, :] - drifted).sum(axis=2)
+            port = port - cost * turnover
+        port[held_nan] = np.nan
+        return port, turnover
+
+    return _simulate(W, R0, held_nan, rebalance, cost)
+
+
+def metrics_from_returns(port, rf=0, periods_per_year=12):
+    """
+    Metrics cho từng cột của ma trận lợi suất kỳ (T × P), bỏ qua NaN.
+    Trả về dict mảng (P,) và đường tích lũy (T × P).
+    """
+    port = np.asarray(port, dtype="f8")
+    if port.ndim == 1:
+        port = port[:, None]
+    mean_ret = np.nanmean(port, axis=0) * periods_per_year
+    vol = np.nanstd(port, axis=0, ddof=1) * np.sqrt(periods_per_year)
+    sharpe = (mean_ret - rf) / vol
+
+    cum = np.cumprod(1 + np.where(np.isnan(port), 0.0, port), axis=0)
+    roll_max = np.maximum.accumulate(cum, axis=0)
+    max_dd = ((cum - roll_max) / roll_max).min(axis=0)
+
+    return {
+        "Annualized Return": mean_ret,
+        "Volatility": vol,
+        "Sharpe Ratio": sharpe,
+        "Max Drawdown": max_dd,
+    }, cum
+
+
+def portfolio_batch(weights, returns_df, rf=0, periods_per_year=12, rebalance=1, cost=0.0):
+    """
+    Đánh giá mọi danh mục trong weights (DataFrame danh mục × mã) trên returns_df (date × mã).
+    Trả về (metrics, cum):
+    - metrics: DataFrame một dòng / danh mục (METRIC_COLUMNS, Turnover = turnover trung bình/năm)
+    - cum: DataFrame đường lợi suất tích lũy (date × danh mục)
+    """
+    weights = weights.reindex(columns=returns_df.columns, fill_value=0.0)
+    port, turnover = portfolio_returns(weights.to_numpy(), returns_df.to_numpy(), rebalance, cost)
+
+    metrics, cum = metrics_from_returns(port, rf, periods_per_year)
+    metrics["Turnover"] = turnover.mean(axis=0) * periods_per_year
+
+    metrics = pd.DataFrame(metrics, index=weights.index)[METRIC_COLUMNS]
+    metrics.index.name = "Portfolio"
+    cum = pd.DataFrame(cum, index=returns_df.index, columns=weights.index)
+    return metrics, cum
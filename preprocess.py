@@ -0,0 +1,174 @@
+# TIỀN XỬ LÝ DỮ LIỆU GIÁ THEO SCHEMA (DÙNG CHUNG CHO CỔ PHIẾU VÀ CHỈ SỐ)
+# - Đổi tên / chọn cột theo schema
+# - Parse số, ngày, ThayDoi "0.2(0.88 %)" bằng các hàm vector hóa của pandas
+# - Forward fill theo từng mã bằng groupby().ffill() (không dùng apply)
+# - Xử lý theo chunk để giới hạn bộ nhớ, báo cáo tốc độ xử lý (và ghi bản ghi đo, xem metrics.py)
+import time
+
+import pandas as pd
+
+from metrics import stage
+
+CAFEF_SCHEMA = {
+    "rename": {
+        "Ngay": "date",
+        "GiaDongCua": "close",
+        "GiaDieuChinh": "adj_close",
+        "GiaMoCua": "open",
+        "GiaCaoNhat": "high",
+        "GiaThapNhat": "low",
+        "KhoiLuongKhopLenh": "volume",
+        "ThayDoi": "change_raw",
+        "symbol": "ticker"
+    },
+    # Thứ tự cột đầu ra
+    "keep": ["date", "ticker", "close", "adj_close", "open", "high", "low", "volume",
+             "change", "change_pct"],
+    "date": "date",
+    "group": "ticker",
+    "numeric": ["close", "adj_close", "open", "high", "low", "volume"],
+    # Cột bắt buộc phải có giá trị sau khi forward fill
+    "required": ["date", "close", "adj_close", "open", "high", "low", "volume"],
+    "change": "change_raw"
+}
+
+# "0.2(0.88 %)", "-1.53(-0.16 %)", "1,200(2.5 %)"
+CHANGE_PATTERN = r"^\s*([-+]?[\d.,]+)\s*\(\s*([-+]?[\d.,]+)\s*%\s*\)\s*$"
+
+
+def parse_ngay(s):
+    """
+    Chuyển cột ngày sang datetime.
+    API CafeF trả DD/MM/YYYY, còn file backup / raw đã lưu dùng YYYY-MM-DD;
+    hai định dạng có thể lẫn trong cùng một cột (API + backup).
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    s = s.astype(str)
+    dates = pd.to_datetime(s, format="%d/%m/%Y", errors="coerce")
+    iso = dates.isna()
+    if iso.any():
+        dates[iso] = pd.to_datetime(s[iso].str[:10], format="%Y-%m-%d", errors="coerce")
+    return dates
+
+
+def parse_number(s):
+    """
+    Chuyển cột sang số. Cột đã là kiểu số thì giữ nguyên,
+    cột chuỗi bỏ dấu phẩy hàng nghìn rồi pd.to_numeric.
+    """
+    if pd.api.types.is_numeric_dtype(s):
+        return s
+    return pd.to_numeric(s.astype(str).str.replace(",", "", regex=False), errors="coerce")
+
+
+def parse_change(s):
+    """
+    Tách ThayDoi "0.2(0.88 %)" thành hai cột số: change (0.2) và change_pct (0.88).
+    """
+    parts = s.astype(str).str.extract(CHANGE_PATTERN)
+    return parts[0].pipe(parse_number), parts[1].pipe(parse_number)
+
+
+def convert_frame(df, schema=CAFEF_SCHEMA):
+    """
+    Bước chuyển đổi không phụ thuộc dòng khác: đổi tên, parse ngày/số/ThayDoi, chọn cột.
+    Chưa xử lý missing (xem fill_missing).
+    """
+    df = df.rename(columns=schema["rename"])
+
+    date_col = schema["date"]
+    if date_col in df.columns:
+        df[date_col] = parse_ngay(df[date_col])
+
+    for c in schema["numeric"]:
+        if c in df.columns:
+            df[c] = parse_number(df[c])
+
+    change_col = schema.get("change")
+    if change_col and change_col in df.columns:
+        df["change"], df["change_pct"] = parse_change(df[change_col])
+
+    return df[[c for c in schema["keep"] if c in df.columns]]
+
+
+def fill_missing(df, schema=CAFEF_SCHEMA):
+    """
+    Bỏ dòng không có ngày, forward fill theo từng mã, bỏ phần NA đầu chuỗi.
+    Dữ liệu cần được sắp theo ngày trong từng mã.
+    """
+    df = df.dropna(subset=[schema["date"]])
+    group = schema["group"]
+    values = [c for c in df.columns if c not in (schema["date"], group)]
+    if group in df.columns:
+        df[values] = df.groupby(group, sort=False)[values].ffill()
+    else:
+        df[values] = df[values].ffill()
+    return df.dropna(subset=[c for c in schema["required"] if c in df.columns])
+
+
+def clean_prices(df, schema=CAFEF_SCHEMA, verbose=True):
+    """
+    Làm sạch toàn bộ DataFrame thô trong bộ nhớ (một lượt).
+    """
+    t0 = time.perf_counter()
+    with stage("clean_prices") as rec:
+        df = convert_frame(df, schema)
+
+        rows_in = rec.rows_in = len(df)
+
+        missing_before = int(df[[c for c in schema["required"] if c in df.columns]].isna().sum().sum())
+        if missing_before > 0:
+            if verbose:
+                print(f"[INFO] Missing detected: {missing_before} values → applying cleaning")
+            df = fill_missing(df, schema)
+        rec.rows_out = len(df)
+
+    if verbose:
+        report_throughput(rows_in, len(df), time.perf_counter() - t0)
+    return df
+
+
+def clean_chunks(chunks, schema=CAFEF_SCHEMA, verbose=True):
+    """
+    Làm sạch một luồng chunk (vd. pd.read_csv(..., chunksize=...)) với bộ nhớ giới hạn.
+    Giữ lại dòng cuối cùng của mỗi mã giữa các chunk để forward fill xuyên chunk,
+    nên bộ nhớ phụ chỉ tỉ lệ với số mã chứ không với số dòng.
+    Luồng đầu vào cần được sắp theo ngày trong từng mã.
+    """
+    group = schema["group"]
+    carry = None
+    rows_in = rows_out = 0
+    t0 = time.perf_counter()
+
+    for chunk in chunks:
+        # Chỉ đo phần xử lý của chunk, không tính thời gian phía tiêu thụ generator
+        with stage("clean_chunk") as rec:
+            rows_in += len(chunk)
+            rec.rows_in = len(chunk)
+            df = convert_frame(chunk, schema).dropna(subset=[schema["date"]])
+            n_carry = 0
+            if carry is not None:
+                n_carry = len(carry)
+                df = pd.concat([carry, df], ignore_index=True)
+
+            values = [c for c in df.columns if c not in (schema["date"], group)]
+            if group in df.columns:
+                df[values] = df.groupby(group, sort=False)[values].ffill()
+                carry = df.groupby(group, sort=False).tail(1).reset_index(drop=True)
+            else:
+                df[values] = df[values].ffill()
+                carry = df.tail(1).reset_index(drop=True)
+
+            out = df.iloc[n_carry:].dropna(subset=[c for c in schema["required"] if c in df.columns])
+            rows_out += len(out)
+            rec.rows_out = len(out)
+        yield out
+
+    if verbose:
+        report_throughput(rows_in, rows_out, time.perf_counter() - t0)
+
+
+def report_throughput(rows_in, rows_out, seconds):
+    rate = rows_in / seconds if seconds > 0 else float("inf")
+    print(f"[INFO] Clean: {rows_in:,} → {rows_out:,} dòng trong {seconds:.3f}s ({rate:,.0f} dòng/s)")
@@ -0,0 +1,131 @@
+# CẬP NHẬT GIA TĂNG DỮ LIỆU GIÁ (DELTA REFRESH)
+# Thay vì tải lại toàn bộ 2020 → nay mỗi lần chạy:
+# - Đọc ngày cuối cùng đã lưu của từng mã
+# - Chỉ tải các phiên còn thiếu (lật trang PageIndex khi cần)
+# - Nối thêm vào file raw
+# - Sự kiện doanh nghiệp (GiaDieuChinh của lịch sử bị CafeF điều chỉnh lại): phát hiện từ các phiên
+#   vừa tải (kèm phiên chồng lấn) và ghi vào bảng sự kiện (xem adjust.py) thay vì tải lại toàn bộ mã;
+#   chỉ tải lại toàn bộ khi GiaDieuChinh đổi mà không xác định được sự kiện
+import os
+
+import numpy as np
+import pandas as pd
+
+from adjust import detect_events, merge_events
+from fetcher import fetch_many
+from preprocess import convert_frame, parse_ngay
+
+
+def _to_number(s):
+    return pd.to_numeric(s.astype(str).str.replace(",", "", regex=False), errors="coerce")
+
+
+def load_raw(raw_file):
+    """
+    Đọc file raw đã lưu (schema CafeF), chuẩn hóa cột Ngay sang datetime.
+    Trả về DataFrame rỗng nếu chưa có file.
+    """
+    if not os.path.exists(raw_file):
+        return pd.DataFrame()
+    df = pd.read_csv(raw_file)
+    df["Ngay"] = parse_ngay(df["Ngay"])
+    return df
+
+
+def last_dates(raw_df):
+    """
+    Ngày giao dịch cuối cùng đã lưu của từng mã (Series symbol -> Timestamp).
+    """
+    if raw_df.empty:
+        return pd.Series(dtype="datetime64[ns]")
+    return raw_df.dropna(subset=["Ngay"]).groupby("symbol")["Ngay"].max()
+
+
+def adjusted_history_changed(stored, fetched, last_date, rtol=1e-4):
+    """
+    So sánh GiaDieuChinh của phiên chồng lấn (ngày cuối đã lưu) giữa dữ liệu
+    đã lưu và dữ liệu mới tải. CafeF điều chỉnh lại toàn bộ lịch sử khi có
+    chia tách / cổ tức cổ phiếu, nên lệch ở phiên chồng lấn = có sự kiện.
+    """
+    old = _to_number(stored.loc[stored["Ngay"] == last_date, "GiaDieuChinh"])
+    new = _to_number(fetched.loc[fetched["Ngay"] == last_date, "GiaDieuChinh"])
+    if old.empty or new.empty:
+        return False
+    return not np.isclose(old.iloc[-1], new.iloc[-1], rtol=rtol)
+
+
+def incremental_refresh(raw_file, tickers, start_date, end_date, page_size=200, events=None, **fetch_kwargs):
+    """
+    Cập nhật file raw theo chế độ gia tăng.
+    raw_file: đường dẫn file raw, hoặc DataFrame raw đã đọc (vd. gộp từ nhiều file).
+    events: bảng sự kiện hiện có (adjust.py); None → phát hiện lại từ dữ liệu raw đã lưu.
+    - Mã chưa có trong file → tải toàn bộ từ start_date
+    - Mã đã có → tải từ ngày cuối đã lưu (chồng lấn 1 phiên để kiểm tra GiaDieuChinh)
+    - Sự kiện trong các phiên mới → thêm vào bảng sự kiện, lịch sử đã lưu giữ nguyên
+    - GiaDieuChinh thay đổi nhưng không xác định được sự kiện → tải lại toàn bộ lịch sử mã đó
+    Trả về (df_all, failed, events): dữ liệu raw đã cập nhật (sort theo symbol, Ngay),
+    danh sách mã tải lỗi (giữ nguyên dữ liệu cũ) và bảng sự kiện đã cập nhật.
+    """
+    stored = load_raw(raw_file) if isinstance(raw_file, str) else raw_file
+    last = last_dates(stored)
+    if events is None:
+        # Dữ liệu raw đã lưu của mỗi mã đến từ cùng một lần tải đầy đủ → phát hiện được trên toàn bộ
+        events = detect_events(convert_frame(stored)) if not stored.empty else None
+
+    starts = {
+        t: last[t].strftime("%d/%m/%Y") if t in last.index else start_date
+        for t in tickers
+    }
+    n_delta = sum(t in last.index for t in tickers)
+    print(f"[INFO] Incremental: {n_delta} mã cập nhật delta, {len(tickers) - n_delta} mã tải mới")
+
+    fetched, failed = fetch_many(tickers, starts, end_date, page_size=page_size, **fetch_kwargs)
+
+    repull = []
+    new_rows = []
+    new_events = []
+    redetected = []
+    for ticker, df in fetched.items():
+        if df.empty:
+            continue
+        df["Ngay"] = parse_ngay(df["Ngay"])
+        # Phiên chồng lấn là phiên liền trước của phiên mới đầu tiên → bắt được sự kiện ngay ở phiên đó
+        found = detect_events(convert_frame(df))
+        if ticker not in last.index:
+            new_rows.append(df)
+            new_events.append(found)
+            redetected.append(ticker)
+            continue
+
+        old = stored[stored["symbol"] == ticker]
+        if adjusted_history_changed(old, df, last[ticker]) and found.empty:
+            repull.append(ticker)
+        else:
+            new_rows.append(df[df["Ngay"] > last[ticker]])
+            new_events.append(found)
+
+    if any(len(e) for e in new_events):
+        found = pd.concat(new_events, ignore_index=True)
+        print(f"[INFO] Sự kiện doanh nghiệp mới: {len(found)} ({', '.join(sorted(set(found['ticker'])))})")
+
+    # GiaDieuChinh đổi nhưng không tìm thấy sự kiện → thay toàn bộ lịch sử của các mã này
+    if repull:
+        print(f"[INFO] GiaDieuChinh thay đổi → tải lại toàn bộ: {repull}")
+        full, failed_full = fetch_many(repull, start_date, end_date, **fetch_kwargs)
+        failed += failed_full
+        for ticker, df in full.items():
+            df["Ngay"] = parse_ngay(df["Ngay"])
+            stored = stored[stored["symbol"] != ticker]
+            new_rows.append(df)
+            new_events.append(detect_events(convert_frame(df)))
+            redetected.append(ticker)
+    events = merge_events(events, pd.concat(new_events, ignore_index=True) if new_events else None,
+                          replace=redetected)
+
+    n_new = sum(len(df) for df in new_rows)
+    df_all = pd.concat([stored] + new_rows, ignore_index=True) if new_rows else stored
+    df_all = df_all.drop_duplicates(subset=["symbol", "Ngay"], keep="last")
+    df_all = df_all.sort_values(["symbol", "Ngay"]).reset_index(drop=True)
+    print(f"[INFO] Incremental: thêm {n_new} dòng, tổng {len(df_all)} dòng")
+
+    return df_all, failed, events
@@ -0,0 +1,217 @@
+# ĐO LƯỜNG RỦI RO DANH MỤC: VaR / EXPECTED SHORTFALL (CVaR)
+# Cho một hoặc nhiều vector trọng số trên lợi suất ngày, các kỳ hạn 1 ngày / 10 ngày:
+# - Lịch sử (historical simulation): phân phối thực nghiệm của lợi suất danh mục,
+#   kỳ hạn h ngày dùng các cửa sổ h ngày chồng nhau (lợi suất kép)
+# - Tham số (delta-normal): mu_h = h·mu, sigma_h = sqrt(h)·sigma
+# - Monte Carlo: kịch bản tương quan Z·Lᵀ (L = Cholesky của Σ), phân phối chuẩn hoặc Student-t;
+#   sinh theo khối với RNG có seed (mỗi khối một SeedSequence con → kết quả không phụ thuộc
+#   số process), chỉ giữ đuôi tổn thất của từng danh mục → bộ nhớ giới hạn dù số kịch bản lớn
+# Quy ước: VaR, ES là tổn thất dương (tỷ lệ trên giá trị danh mục).
+# Chỉ bỏ các ngày thiếu dữ liệu của mã được nắm giữ (mã niêm yết muộn, trọng số 0 không rút ngắn mẫu).
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+ALPHAS = (0.95, 0.99)
+HORIZONS = (1, 10)
+RISK_COLUMNS = ["Portfolio", "Method", "Horizon", "Confidence", "VaR", "ES"]
+
+
+def _weights(weights, columns):
+    """
+    DataFrame (danh mục × mã) / Series / mảng 1 chiều → (W: P × N, tên danh mục).
+    """
+    if isinstance(weights, pd.DataFrame):
+        return weights.reindex(columns=columns, fill_value=0.0).to_numpy(dtype="f8"), list(weights.index)
+    if isinstance(weights, pd.Series):
+        return weights.reindex(columns, fill_value=0.0).to_numpy(dtype="f8")[None, :], [weights.name or "Portfolio"]
+    W = np.atleast_2d(np.asarray(weights, dtype="f8"))
+    return W, [f"Portfolio {i + 1}" for i in range(len(W))] if len(W) > 1 else ["Portfolio"]
+
+
+def _complete(returns, W, cov=None):
+    """
+    Các ngày mọi mã ĐƯỢC NẮM GIỮ (trọng số khác 0 ở ít nhất một danh mục) đều có dữ liệu, và các mã
+    đủ dữ liệu trên những ngày đó: mã không nắm giữ (vd. niêm yết muộn) không làm mất ngày nào.
+    Trả về (R: ngày × mã giữ lại, W, cov cắt theo cùng các mã).
+    """
+    held = (W != 0).any(axis=0)
+    rows = returns.loc[:, held].notna().all(axis=1)
+    cols = returns.loc[rows].notna().all(axis=0).to_numpy()
+    if cov is not None:
+        cov = np.asarray(cov, dtype="f8")[np.ix_(cols, cols)]
+    # Chọn trên DataFrame (như dropna()): cùng bố cục bộ nhớ → cùng thứ tự cộng trong R @ W
+    return returns.loc[rows, cols].to_numpy(dtype="f8"), W[:, cols], cov
+
+
+def _tail_size(n, alpha):
+    # Số kịch bản trong đuôi (1 - alpha): VaR = tổn thất lớn thứ k, ES = trung bình k tổn thất lớn nhất
+    return max(1, int(np.ceil(n * (1 - alpha) - 1e-9)))
+
+
+def tail_stats(losses, alphas=ALPHAS, n=None):
+    """
+    VaR / ES thực nghiệm từ ma trận tổn thất (kịch bản × danh mục).
+    losses có thể chỉ là phần đuôi đã sắp giảm dần, khi đó n = tổng số kịch bản gốc.
+    Trả về dict alpha -> (VaR (P,), ES (P,)).
+    """
+    n = len(losses) if n is None else n
+    k_max = _tail_size(n, min(alphas))
+    if len(losses) > k_max:
+        losses = np.partition(losses, len(losses) - k_max, axis=0)[-k_max:]
+    tail = -np.sort(-losses, axis=0)
+    out = {}
+    for a in alphas:
+        k = _tail_size(n, a)
+        out[a] = (tail[k - 1], tail[:k].mean(axis=0))
+    return out
+
+
+def _rows(names, method, stats_by_horizon):
+    rows = []
+    for h, by_alpha in stats_by_horizon.items():
+        for a, (var, es) in by_alpha.items():
+            for i, name in enumerate(names):
+                rows.append({"Portfolio": name, "Method": method, "Horizon": h,
+                             "Confidence": a, "VaR": var[i], "ES": es[i]})
+    return rows
+
+
+# ----------------- LỊCH SỬ -----------------
+def historical_var(returns, weights, alphas=ALPHAS, horizons=HORIZONS):
+    """
+    VaR / ES lịch sử. Danh mục được tái cân bằng về trọng số mục tiêu mỗi ngày;
+    chỉ dùng các ngày mọi mã được nắm giữ đều có dữ liệu.
+    """
+    W, names = _weights(weights, returns.columns)
+    R, W, _ = _complete(returns, W)
+    log_port = np.log1p(R @ W.T)
+    cs = np.vstack([np.zeros((1, len(W))), np.cumsum(log_port, axis=0)])
+
+    result = {}
+    for h in horizons:
+        # Lợi suất kép trên các cửa sổ h ngày chồng nhau
+        port_h = np.expm1(cs[h:] - cs[:-h])
+        result[h] = tail_stats(-port_h, alphas)
+    return pd.DataFrame(_rows(names, "Historical", result), columns=RISK_COLUMNS)
+
+
+# ----------------- THAM SỐ (DELTA-NORMAL) -----------------
+def parametric_var(returns, weights, alphas=ALPHAS, horizons=HORIZONS, cov=None):
+    """
+    VaR / ES delta-normal: tổn thất ~ N(-h·mu_p, h·sigma_p²).
+    cov: ma trận hiệp phương sai ngày tùy chọn (vd. Ledoit-Wolf); mặc định là hiệp phương sai mẫu.
+    """
+    from scipy import stats
+
+    W, names = _weights(weights, returns.columns)
+    R, W, cov = _complete(returns, W, cov)
+    mu = R.mean(axis=0)
+    cov = np.cov(R, rowvar=False) if cov is None else cov
+    mu_p = W @ mu
+    sigma_p = np.sqrt(np.einsum("pi,ij,pj->p", W, cov, W))
+
+    result = {}
+    for h in horizons:
+        result[h] = {}
+        for a in alphas:
+            z = stats.norm.ppf(a)
+            var = z * sigma_p * np.sqrt(h) - mu_p * h
+            es = sigma_p * np.sqrt(h) * stats.norm.pdf(z) / (1 - a) - mu_p * h
+            result[h][a] = (var, es)
+    return pd.DataFrame(_rows(names, "Parametric", result), columns=RISK_COLUMNS)
+
+
+# ----------------- MONTE CARLO -----------------
+def _cholesky(cov):
+    """
+    Cholesky của Σ; nếu Σ không xác định dương (nhiều mã, ít ngày) → cắt trị riêng âm về ~0.
+    """
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        vals, vecs = np.linalg.eigh(cov)
+        vals = np.maximum(vals, 1e-12 * max(vals.max(), 1e-300))
+        return np.linalg.cholesky((vecs * vals) @ vecs.T)
+
+
+def _simulate_blocks(M, block_ids, block_size, n_sims, seed, k, df):
+    """
+    Sinh các khối kịch bản và trả về k tổn thất chuẩn hóa lớn nhất của từng danh mục.
+    M = Lᵀ Wᵀ (N × P): cú sốc danh mục = Z @ M, không cần tạo lợi suất từng mã.
+    """
+    children = np.random.SeedSequence(seed).spawn(int(np.ceil(n_sims / block_size)))
+    tail = np.empty((0, M.shape[1]))
+    for b in block_ids:
+        rng = np.random.default_rng(children[b])
+        size = min(block_size, n_sims - b * block_size)
+        Z = rng.standard_normal((size, M.shape[0]))
+        if df is not None:
+            # Student-t đa biến, chuẩn hóa để có cùng hiệp phương sai Σ
+            Z *= np.sqrt((df - 2) / rng.chisquare(df, size))[:, None]
+        shock = -(Z @ M)
+        tail = np.concatenate([tail, shock])
+        if len(tail) > k:
+            tail = np.partition(tail, len(tail) - k, axis=0)[-k:]
+    return tail
+
+
+def _pool_context():
+    methods = mp.get_all_start_methods()
+    return mp.get_context("fork") if "fork" in methods else None
+
+
+def monte_carlo_var(returns, weights, alphas=ALPHAS, horizons=HORIZONS, n_sims=100_000,
+                    block_size=20_000, seed=None, df=None, cov=None, max_workers=None):
+    """
+    VaR / ES Monte Carlo với kịch bản tương quan (Cholesky).
+    - n_sims kịch bản, sinh theo khối block_size (bộ nhớ ~ block_size × (N + P) + đuôi k × P)
+    - seed: int / None; cùng seed → cùng kết quả, bất kể max_workers
+    - df: None = chuẩn, số thực > 2 = Student-t (đuôi dày)
+    - cov: hiệp phương sai ngày tùy chọn (mặc định hiệp phương sai mẫu)
+    - max_workers > 1: chia các khối cho process pool
+    Kỳ hạn h ngày: tổn thất = -h·mu_p + sqrt(h)·cú sốc (quy tắc căn thời gian).
+    """
+    W, names = _weights(weights, returns.columns)
+    R, W, cov = _complete(returns, W, cov)
+    mu = R.mean(axis=0)
+    cov = np.cov(R, rowvar=False) if cov is None else cov
+    M = _cholesky(cov).T @ W.T
+    mu_p = W @ mu
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    k = _tail_size(n_sims, min(alphas))
+    n_blocks = int(np.ceil(n_sims / block_size))
+
+    if max_workers and max_workers > 1 and n_blocks > 1:
+        chunks = [list(range(n_blocks))[i::max_workers] for i in range(max_workers)]
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context()) as pool:
+            parts = pool.map(_simulate_blocks, [M] * len(chunks), chunks, [block_size] * len(chunks),
+                             [n_sims] * len(chunks), [seed] * len(chunks), [k] * len(chunks),
+                             [df] * len(chunks))
+            tail = np.concatenate(list(parts))
+    else:
+        tail = _simulate_blocks(M, range(n_blocks), block_size, n_sims, seed, k, df)
+
+    base = tail_stats(tail, alphas, n=n_sims)
+    result = {
+        h: {a: (np.sqrt(h) * var - h * mu_p, np.sqrt(h) * es - h * mu_p) for a, (var, es) in base.items()}
+        for h in horizons
+    }
+    return pd.DataFrame(_rows(names, "Monte Carlo", result), columns=RISK_COLUMNS)
+
+
+def risk_report(returns, weights, alphas=ALPHAS, horizons=HORIZONS, n_sims=100_000, seed=None,
+                df=None, cov=None, max_workers=None):
+    """
+    Gộp ba phương pháp thành một bảng dạng long (RISK_COLUMNS).
+    """
+    return pd.concat([
+        historical_var(returns, weights, alphas, horizons),
+        parametric_var(returns, weights, alphas, horizons, cov=cov),
+        monte_carlo_var(returns, weights, alphas, horizons, n_sims=n_sims, seed=seed, df=df,
+                        cov=cov, max_workers=max_workers)
+    ], ignore_index=True)
@@ -0,0 +1,214 @@
+# KHO DỮ LIỆU GIÁ DẠNG CỘT (MEMORY-MAPPED NumPy)
+# Thay cho việc data.py ghi CSV rồi analysis.py đọc lại + pivot.
+#
+# Cấu trúc thư mục:
+#   store/bars/<TICKER>/<YEAR>.npy      structured array, cột có kiểu cố định
+#   store/matrix/<name>/dates.npy       trục ngày (datetime64[ns])
+#   store/matrix/<name>/tickers.json    thứ tự cột
+#   store/matrix/<name>/<field>.npy     ma trận date × ticker đã pivot sẵn
+#   store/series/<name>.npy             chuỗi thời gian phụ (vd. lãi suất phi rủi ro)
+#   store/actions.npy                   bảng sự kiện doanh nghiệp / hệ số điều chỉnh (xem adjust.py)
+#
+# Tất cả file .npy được đọc bằng np.load(mmap_mode="r") → không copy, không parse.
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+PRICE_FIELDS = ("close", "adj_close", "open", "high", "low")
+ACTION_DTYPE = np.dtype([("ticker", "U16"), ("ex_date", "M8[ns]"), ("factor", "f8"), ("cum_factor", "f8"),
+                         ("source", "U8")])
+
+
+def bar_dtype(price_dtype="f8"):
+    """
+    Kiểu dữ liệu của một dòng giá: date datetime64[ns], giá float, volume int64.
+    """
+    return np.dtype(
+        [("date", "M8[ns]")]
+        + [(f, price_dtype) for f in PRICE_FIELDS]
+        + [("volume", "i8")]
+    )
+
+
+def _save(path, arr):
+    # Ghi ra file tạm rồi os.replace → không để lại file hỏng nếu bị ngắt giữa chừng
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp.npy"
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+
+class PriceStore:
+    """
+    Kho giá phân vùng theo ticker/năm.
+    - write_bars: ghi DataFrame đã làm sạch (date, ticker, close, adj_close, ...)
+    - read: đọc dạng long, đẩy điều kiện ticker/khoảng ngày xuống mức phân vùng
+    - build_matrix / matrix: ma trận date × ticker đã pivot, đọc memory-mapped
+    """
+
+    def __init__(self, root="store", price_dtype="f8"):
+        self.root = root
+        self.dtype = bar_dtype(price_dtype)
+
+    # ----------------- PHÂN VÙNG TICKER / NĂM -----------------
+    def _bar_dir(self, ticker):
+        return os.path.join(self.root, "bars", ticker)
+
+    def tickers(self):
+        bars = os.path.join(self.root, "bars")
+        if not os.path.isdir(bars):
+            return []
+        return sorted(os.listdir(bars))
+
+    def years(self, ticker):
+        d = self._bar_dir(ticker)
+        if not os.path.isdir(d):
+            return []
+        return sorted(int(f[:-4]) for f in os.listdir(d) if f.endswith(".npy") and f[:-4].isdigit())
+
+    def write_bars(self, df):
+        """
+        Ghi DataFrame dạng long vào các phân vùng ticker/năm.
+        Các phân vùng có trong df được ghi đè, phân vùng khác giữ nguyên.
+        """
+        df = df.dropna(subset=["date"]).sort_values(["ticker", "date"])
+        years = df["date"].dt.year.to_numpy()
+        n_parts = 0
+        for ticker, idx in df.groupby("ticker", sort=False).indices.items():
+            part = df.iloc[idx]
+            part_years = years[idx]
+            for year in np.unique(part_years):
+                rows = part[part_years == year]
+                arr = np.empty(len(rows), dtype=self.dtype)
+                arr["date"] = rows["date"].to_numpy(dtype="datetime64[ns]")
+                for f in PRICE_FIELDS:
+                    arr[f] = rows[f].to_numpy() if f in rows else np.nan
+                arr["volume"] = rows["volume"].fillna(0).to_numpy(dtype="i8") if "volume" in rows else 0
+                _save(os.path.join(self._bar_dir(ticker), f"{year}.npy"), arr)
+                n_parts += 1
+        return n_parts
+
+    def read_bars(self, ticker, start=None, end=None):
+        """
+        Structured array của một mã trong khoảng [start, end].
+        Chỉ mở các file năm giao với khoảng ngày (predicate pushdown).
+        """
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        parts = []
+        for year in self.years(ticker):
+            if start is not None and year < start.year:
+                continue
+            if end is not None and year > end.year:
+                continue
+            arr = np.load(os.path.join(self._bar_dir(ticker), f"{year}.npy"), mmap_mode="r")
+            lo = 0 if start is None else np.searchsorted(arr["date"], start.to_datetime64())
+            hi = len(arr) if end is None else np.searchsorted(arr["date"], end.to_datetime64(), side="right")
+            parts.append(arr[lo:hi])
+        if not parts:
+            return np.empty(0, dtype=self.dtype)
+        return np.concatenate(parts)
+
+    def read(self, tickers=None, start=None, end=None, columns=None):
+        """
+        Đọc dữ liệu dạng long (date, ticker, ...) cho các mã / khoảng ngày chọn.
+        """
+        tickers = self.tickers() if tickers is None else list(tickers)
+        columns = list(columns) if columns is not None else list(self.dtype.names[1:])
+        frames = []
+        for ticker in tickers:
+            arr = self.read_bars(ticker, start, end)
+            if len(arr) == 0:
+                continue
+            frame = pd.DataFrame({c: arr[c] for c in ["date"] + columns})
+            frame.insert(1, "ticker", ticker)
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=["date", "ticker"] + columns)
+        df = pd.concat(frames, ignore_index=True)
+        df["ticker"] = df["ticker"].astype("category")
+        return df
+
+    # ----------------- MA TRẬN ĐÃ PIVOT -----------------
+    def _matrix_dir(self, name):
+        return os.path.join(self.root, "matrix", name)
+
+    def build_matrix(self, name, tickers=None, fields=("close", "adj_close")):
+        """
+        Pivot sẵn các phân vùng thành ma trận date × ticker và lưu xuống đĩa.
+        Ngày là hợp của ngày giao dịch các mã; ô không có dữ liệu = NaN.
+        """
+        tickers = self.tickers() if tickers is None else list(tickers)
+        bars = {t: self.read_bars(t) for t in tickers}
+        bars = {t: a for t, a in bars.items() if len(a)}
+        tickers = list(bars)
+
+        dates = np.unique(np.concatenate([a["date"] for a in bars.values()]))
+        d = self._matrix_dir(name)
+        for f in fields:
+            mat = np.full((len(dates), len(tickers)), np.nan, dtype=self.dtype[f])
+            for j, t in enumerate(tickers):
+                mat[np.searchsorted(dates, bars[t]["date"]), j] = bars[t][f]
+            _save(os.path.join(d, f"{f}.npy"), mat)
+
+        _save(os.path.join(d, "dates.npy"), dates)
+        with open(os.path.join(d, "tickers.json"), "w") as fh:
+            json.dump(tickers, fh)
+        return len(dates), len(tickers)
+
+    def matrix(self, field, name, tickers=None, start=None, end=None):
+        """
+        Ma trận field (close / adj_close ...) dạng DataFrame date × ticker.
+        Dữ liệu là memory-map chỉ đọc; cắt theo khoảng ngày là view (không copy),
+        chọn tập con ticker chỉ copy các cột được chọn.
+        """
+        d = self._matrix_dir(name)
+        dates = np.load(os.path.join(d, "dates.npy"), mmap_mode="r")
+        with open(os.path.join(d, "tickers.json")) as fh:
+            all_tickers = json.load(fh)
+        values = np.load(os.path.join(d, f"{field}.npy"), mmap_mode="r")
+
+        lo = 0 if start is None else np.searchsorted(dates, pd.Timestamp(start).to_datetime64())
+        hi = len(dates) if end is None else np.searchsorted(dates, pd.Timestamp(end).to_datetime64(), side="right")
+        values = values[lo:hi]
+        columns = all_tickers
+        if tickers is not None:
+            pos = [all_tickers.index(t) for t in tickers]
+            values = values[:, pos]
+            columns = list(tickers)
+
+        df = pd.DataFrame(values, index=pd.DatetimeIndex(dates[lo:hi], name="date"),
+                          columns=pd.Index(columns, name="ticker"), copy=False)
+        return df
+
+    # ----------------- CHUỖI PHỤ (RISK-FREE ...) -----------------
+    def write_series(self, name, df, value_col):
+        arr = np.empty(len(df), dtype=[("date", "M8[ns]"), (value_col, "f8")])
+        arr["date"] = df["date"].to_numpy(dtype="datetime64[ns]")
+        arr[value_col] = df[value_col].to_numpy(dtype="f8")
+        _save(os.path.join(self.root, "series", f"{name}.npy"), arr)
+
+    def read_series(self, name):
+        arr = np.load(os.path.join(self.root, "series", f"{name}.npy"), mmap_mode="r")
+        return pd.DataFrame({c: arr[c] for c in arr.dtype.names})
+
+    # ----------------- SỰ KIỆN DOANH NGHIỆP (xem adjust.py) -----------------
+    def _actions_path(self):
+        return os.path.join(self.root, "actions.npy")
+
+    def write_actions(self, events):
+        arr = np.empty(len(events), dtype=ACTION_DTYPE)
+        for f in ACTION_DTYPE.names:
+            arr[f] = events[f].to_numpy(dtype=ACTION_DTYPE[f])
+        _save(self._actions_path(), arr)
+
+    def read_actions(self):
+        """
+        Bảng sự kiện (ticker, ex_date, factor, cum_factor, source); None nếu kho chưa có.
+        """
+        if not os.path.exists(self._actions_path()):
+            return None
+        arr = np.load(self._actions_path())
+        return pd.DataFrame({f: arr[f] for f in ACTION_DTYPE.names})
@@ -0,0 +1,145 @@
+# DANH SÁCH CHỈ SỐ / RỔ CỔ PHIẾU (UNIVERSE) + THÀNH PHẦN THEO THỜI GIAN
+# - Mỗi universe (VN30, rổ tự chọn, ...) là cấu hình: chỉ số tham chiếu + các mã, mỗi mã kèm
+#   các khoảng thời gian là thành phần (point-in-time) → phân tích một ngày chỉ dùng các mã
+#   thuộc rổ vào ngày đó
+# - Mọi universe dùng chung MỘT lượt tải / làm sạch / ghi kho: data.py tải hợp các mã (không trùng),
+#   kho (store.py) lưu theo từng mã, mỗi universe chỉ là một ma trận date × mã dựng từ kho chung
+# - Chỉ số tham chiếu (VNINDEX, ...) đi cùng đường tải với cổ phiếu
+# - Thêm / sửa universe không cần sửa mã: file universes.json (cùng schema với UNIVERSES bên dưới)
+#
+#   {"VN100": {"index": "VNINDEX", "members": ["ACB", "FPT", ...]},
+#    "VN30":  {"members": {"BCM": [["2023-08-01", null]], "PDR": [["2020-01-01", "2022-07-31"]]}},
+#    "VN30_TECH": {"include": ["VN30"], "members": ["CMG"]}}
+#
+# members: list mã (thành phần suốt thời gian) hoặc dict mã -> list [từ ngày, đến ngày | null].
+# Universe trong file ghi đè universe cùng tên; mã có trong cả hai thì lấy khoảng thời gian của file.
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+VN30 = ("ACB", "BCM", "BID", "CTG", "DGC", "FPT", "GAS", "GVR", "HDB", "HPG",
+        "LPB", "MBB", "MSN", "MWG", "PLX", "SAB", "SHB", "SSB", "SSI", "STB",
+        "TCB", "TPB", "VCB", "VHM", "VIB", "VIC", "VJC", "VNM", "VPB", "VRE")
+
+UNIVERSES = {
+    "VN30": {"index": "VNINDEX", "members": list(VN30)},
+    # Rổ tự chọn ví dụ: nhóm ngân hàng trong VN30 (trùng mã với VN30 → không tải lại)
+    "VN30_BANKS": {"index": "VNINDEX", "members": ["ACB", "BID", "CTG", "HDB", "LPB", "MBB", "SHB",
+                                                   "SSB", "STB", "TCB", "TPB", "VCB", "VIB", "VPB"]},
+}
+
+DEFAULT_UNIVERSE = "VN30"
+UNIVERSES_FILE = "universes.json"
+
+
+class Universe:
+    """
+    Một universe: tên, chỉ số tham chiếu, khoảng thời gian thành phần của từng mã.
+    """
+
+    def __init__(self, name, index="VNINDEX", periods=None):
+        self.name = name
+        self.index = index
+        # mã -> list (Timestamp bắt đầu | None, Timestamp kết thúc | None), theo thứ tự khai báo
+        self.periods = dict(periods or {})
+
+    @property
+    def store_name(self):
+        # Tên ma trận trong kho: store/matrix/<name>
+        return self.name.lower()
+
+    def tickers(self):
+        """
+        Mọi mã từng là thành phần (thứ tự khai báo).
+        """
+        return list(self.periods)
+
+    def members_at(self, when):
+        """
+        Các mã là thành phần tại ngày when.
+        """
+        when = pd.Timestamp(when)
+        return [t for t, spans in self.periods.items()
+                if any((s is None or s <= when) and (e is None or when <= e) for s, e in spans)]
+
+    def membership(self, dates, tickers=None):
+        """
+        Ma trận bool date × mã: True nếu mã là thành phần tại ngày đó.
+        """
+        dates = pd.DatetimeIndex(dates)
+        tickers = self.tickers() if tickers is None else list(tickers)
+        d = dates.to_numpy()
+        mask = np.zeros((len(dates), len(tickers)), dtype=bool)
+        for j, t in enumerate(tickers):
+            for s, e in self.periods.get(t, ()):
+                lo = np.ones(len(d), bool) if s is None else d >= s.to_datetime64()
+                hi = np.ones(len(d), bool) if e is None else d <= e.to_datetime64()
+                mask[:, j] |= lo & hi
+        return pd.DataFrame(mask, index=dates, columns=pd.Index(tickers, name="ticker"))
+
+
+def _parse_members(members):
+    # list mã hoặc dict mã -> [[từ, đến], ...] → dict mã -> [(Timestamp | None, Timestamp | None), ...]
+    if isinstance(members, dict):
+        items = members.items()
+    else:
+        items = ((t, [[None, None]]) for t in members)
+    return {t: [(None if s is None else pd.Timestamp(s), None if e is None else pd.Timestamp(e))
+                for s, e in spans]
+            for t, spans in items}
+
+
+def load_universes(path=UNIVERSES_FILE, config=None):
+    """
+    Các universe từ cấu hình mặc định (UNIVERSES) + file path (nếu có).
+    Trả về dict tên -> Universe; "include" được mở rộng thành hợp các mã.
+    """
+    config = {k: dict(v) for k, v in (UNIVERSES if config is None else config).items()}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for name, spec in json.load(f).items():
+                base = config.get(name, {})
+                members = _parse_members(base.get("members", []))
+                members.update(_parse_members(spec.get("members", [])))
+                config[name] = dict(base, **spec)
+                config[name]["members"] = members
+
+    out = {}
+
+    def resolve(name, seen=()):
+        if name in out:
+            return out[name]
+        if name in seen:
+            raise ValueError(f"Universe lặp vòng: {' → '.join(seen + (name,))}")
+        spec = config[name]
+        periods = {}
+        for inc in spec.get("include", ()):
+            for t, spans in resolve(inc, seen + (name,)).periods.items():
+                periods.setdefault(t, []).extend(spans)
+        for t, spans in _parse_members(spec.get("members", [])).items():
+            periods[t] = spans
+        out[name] = Universe(name, spec.get("index", "VNINDEX"), periods)
+        return out[name]
+
+    for name in config:
+        resolve(name)
+    return out
+
+
+def get_universe(name=DEFAULT_UNIVERSE, path=UNIVERSES_FILE):
+    universes = load_universes(path)
+    if name not in universes:
+        raise KeyError(f"Không có universe {name!r} (có: {', '.join(universes)})")
+    return universes[name]
+
+
+def all_symbols(universes):
+    """
+    Hợp các mã của nhiều universe, không trùng, giữ thứ tự xuất hiện.
+    Trả về (cổ phiếu, chỉ số tham chiếu).
+    """
+    stocks = dict.fromkeys(t for u in universes for t in u.tickers())
+    indices = dict.fromkeys(u.index for u in universes if u.index)
+    return [t for t in stocks if t not in indices], list(indices)